@@ -0,0 +1,76 @@
+#!/usr/bin/python3
+import argparse
+import os
+import sys
+
+from libs.ce_tensors import TensorDatasetBuilder
+
+
+def build_tensors() -> int:
+    parser = argparse.ArgumentParser(
+        description="Build sliding-window training tensors per DIMM rank "
+        "from CE exports and read_correrrcnt CSV output"
+    )
+    parser.add_argument("output", help="output directory")
+    parser.add_argument(
+        "--ce-export",
+        action="append",
+        default=[],
+        metavar="DIR",
+        help="CE export directory written by syslog_parse.py --export",
+    )
+    parser.add_argument(
+        "--correrrcnt",
+        action="append",
+        default=[],
+        metavar="FILE",
+        help="mem_inspector CSV output with read_correrrcnt rows",
+    )
+    parser.add_argument("--bin", type=int, default=3600, help="bin size in seconds")
+    parser.add_argument("--window", type=int, default=24, help="window size in bins")
+    parser.add_argument("--stride", type=int, default=1, help="window step in bins")
+    parser.add_argument(
+        "--horizon", type=int, default=24, help="label horizon after window in bins"
+    )
+    parser.add_argument(
+        "--partition-mb",
+        type=int,
+        default=256,
+        help="spilled events per partition in MiB (bounds memory of one worker)",
+    )
+    parser.add_argument(
+        "--keep-empty", action="store_true", help="keep windows without any event"
+    )
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=1, help="build partitions in N processes"
+    )
+    args = parser.parse_args()
+
+    for path in args.ce_export + args.correrrcnt:
+        if not os.path.exists(path):
+            print(f"File {path} desn't exist")
+            return 1
+    try:
+        builder = TensorDatasetBuilder(
+            args.output,
+            bin_seconds=args.bin,
+            window=args.window,
+            stride=args.stride,
+            horizon=args.horizon,
+            partition_bytes=args.partition_mb << 20,
+            skip_empty=not args.keep_empty,
+        )
+    except RuntimeError as err:
+        print(err)
+        return 1
+    for path in args.ce_export:
+        builder.add_ce_export(path)
+    for path in args.correrrcnt:
+        builder.add_correrrcnt_csv(path)
+    index = builder.build(args.jobs)
+    print(f"{index['windows']} windows in {len(index['shards'])} shards")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(build_tensors())
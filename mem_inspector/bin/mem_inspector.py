@@ -1,19 +1,32 @@
 #!/usr/bin/env python3
+import argparse
 import asyncio
+import math
+import signal
 from dataclasses import dataclass
-from typing import Final, List
+from typing import Any, Dict, Final, List, Optional, Type
 
-from libs.data_processors import AbsDataProcessor
+from libs.data_processors import AbsDataProcessor, CSVDataProcessor, DedupeFilter
+from libs.instrumentation import instrumentation
 from libs.native import NativeCallMap
 from libs.pmon.pmon_native_helpers import pmu_utils_init
 from libs.logger import pmon_logger as logger
-from libs.metric_values import AbsMetricValues
 from libs.pmon.pmon_metric_values import (
     HWMONTempValues,
     PMONBWValues,
     PMONCorrerrcntValues,
+    PMONMCAValues,
+    PMONRankBWValues,
     PMONTRMLMaxTempValues,
+    SelfMetricValues,
 )
+from libs.metric_values import AbsMetricValues
+from libs.prometheus import MetricSpec, PrometheusExporter
+from libs.sinks import AbsSink, RowFormatter, sink_from_spec
+
+
+OVERRUN_SKIP: Final[str] = "skip"
+OVERRUN_CATCHUP: Final[str] = "catchup"
 
 
 @dataclass
@@ -21,121 +34,284 @@ class Command:
     name: str
     cmd: List[str]
     delay: float
+    overrun: str = OVERRUN_SKIP
 
 
-class Filter:
-    data = {}
+class MetricsReader:
+    class Out(CSVDataProcessor):
+        FORMATTERS: Dict[Type[Any], RowFormatter] = {
+            PMONBWValues: RowFormatter(
+                ["node_name", "mem_bw_rd", "mem_bw_wr", "mem_bw_total"],
+                "node_name",
+            ),
+            PMONRankBWValues: RowFormatter(
+                [
+                    "node_name",
+                    "rank",
+                    "mem_bw_rd",
+                    "mem_bw_wr",
+                    "mem_bw_total",
+                    "rd_active",
+                    "wr_active",
+                ],
+                "key",
+            ),
+            HWMONTempValues: RowFormatter(
+                ["label", "socket_sensor", "input", "crit", "max"],
+                "socket_sensor",
+            ),
+            PMONCorrerrcntValues: RowFormatter(
+                [
+                    "node_name",
+                    "correrrcnt_0",
+                    "correrrcnt_1",
+                    "correrrcnt_2",
+                    "correrrcnt_3",
+                    "correrrthrshld_0",
+                    "correrrthrshld_1",
+                    "correrrthrshld_2",
+                    "correrrthrshld_3",
+                    "correrrorstatus",
+                ],
+                "node_name",
+            ),
+            PMONTRMLMaxTempValues: RowFormatter(
+                [
+                    "node_name",
+                    "channel0_max_temp",
+                    "channel1_max_temp",
+                    "channel2_max_temp",
+                    "channel3_max_temp",
+                ],
+                "node_name",
+            ),
+            PMONMCAValues: RowFormatter(
+                [
+                    "socket",
+                    "bank",
+                    "classification",
+                    "status",
+                    "addr",
+                    "misc",
+                    "addr_lsb",
+                    "corrected_count",
+                    "mcacod",
+                    "mscod",
+                    "channel",
+                ],
+                "key",
+            ),
+            SelfMetricValues: RowFormatter(["name", "metric", "value"], "key"),
+        }
 
-    def process(self, data, unique):
-        if unique in self.data and self.data[unique] == data:
-            logger.debug(f"duplicate {unique} = {data}")
-            return False
-        else:
-            logger.debug(f"non duplicate {unique} = {data}")
-            self.data[unique] = data
-            return True
+        PROMETHEUS: Dict[Type[Any], MetricSpec] = {
+            PMONBWValues: MetricSpec(
+                ["node_name"],
+                {
+                    "mem_bw_rd": ("pmon_mem_bw_bytes", {"direction": "read"}),
+                    "mem_bw_wr": ("pmon_mem_bw_bytes", {"direction": "write"}),
+                    "mem_bw_total": ("pmon_mem_bw_bytes", {"direction": "total"}),
+                },
+                "Memory bandwidth per iMC channel",
+            ),
+            PMONRankBWValues: MetricSpec(
+                ["node_name", "rank"],
+                {
+                    "mem_bw_rd": ("pmon_rank_bw_bytes", {"direction": "read"}),
+                    "mem_bw_wr": ("pmon_rank_bw_bytes", {"direction": "write"}),
+                    "rd_active": ("pmon_rank_active_ratio", {"direction": "read"}),
+                    "wr_active": ("pmon_rank_active_ratio", {"direction": "write"}),
+                },
+                "Memory bandwidth per DIMM rank of iMC channels, multiplexed",
+            ),
+            HWMONTempValues: MetricSpec(
+                ["socket", "sensor", "label"],
+                {
+                    "input": ("hwmon_temp_celsius", {}),
+                    "max": ("hwmon_temp_max_celsius", {}),
+                    "crit": ("hwmon_temp_crit_celsius", {}),
+                },
+                "HWMON temperature sensors",
+            ),
+            PMONCorrerrcntValues: MetricSpec(
+                ["node_name"],
+                {
+                    **{
+                        f"correrrcnt_{idx}": (
+                            "pmon_correrrcnt",
+                            {"register": f"correrrcnt_{idx}"},
+                        )
+                        for idx in range(4)
+                    },
+                    **{
+                        f"correrrthrshld_{idx}": (
+                            "pmon_correrrthrshld",
+                            {"register": f"correrrthrshld_{idx}"},
+                        )
+                        for idx in range(4)
+                    },
+                    "correrrorstatus": ("pmon_correrrorstatus", {}),
+                },
+                "Corrected error counter registers",
+            ),
+            PMONTRMLMaxTempValues: MetricSpec(
+                ["node_name"],
+                {
+                    f"channel{idx}_max_temp": (
+                        "pmon_dimm_max_temp_celsius",
+                        {"channel": str(idx)},
+                    )
+                    for idx in range(4)
+                },
+                "DIMM max temperature per channel",
+            ),
+            PMONMCAValues: MetricSpec(
+                ["socket", "bank"],
+                {
+                    "val": ("pmon_mca_status_valid", {}),
+                    "uc": ("pmon_mca_status_uncorrected", {}),
+                    "corrected_count": ("pmon_mca_corrected_count", {}),
+                },
+                "Machine check bank status of memory controller banks",
+            ),
+            SelfMetricValues: MetricSpec(
+                ["name", "metric"],
+                {"value": ("self", {})},
+                "Collector self instrumentation",
+            ),
+        }
 
+        def __init__(
+            self,
+            sink: Optional[AbsSink] = None,
+            max_lines: int = 256,
+            max_delay: float = 1.0,
+            dedupe_capacity: int = 4096,
+            heartbeat: float = 0.0,
+            exporter: Optional[AbsDataProcessor] = None,
+        ) -> None:
+            self.filter = DedupeFilter(dedupe_capacity, heartbeat)
+            # latest values are exported before duplicate filtering
+            self.exporter = exporter
+            super().__init__(
+                MetricsReader.Out.FORMATTERS,
+                sink,
+                self.filter.process,
+                max_lines,
+                max_delay,
+            )
 
-class MetricsReader:
-    class Out(AbsDataProcessor):
-        filter = Filter()
-
-        @staticmethod
-        def csv_output(data: AbsMetricValues, order_list: List[str], key: str) -> None:
-            q: Final[str] = '"'
-            sep: Final[str] = ";"
-
-            csv_line: str = ""
-            meta = data.meta
-            metrics = data.metrics
-            unique: Dict = {}
-            unique_key = meta.tool + "_#_" + str(getattr(metrics, key))
-            for field in ["creation_timestamp", "tool", "hostname"] + order_list:
-                if field in order_list:
-                    csv_line += f"{q}{getattr(metrics, field)}{q}{sep}"
-                    unique[field] = getattr(metrics, field)
-                else:
-                    csv_line += f"{q}{getattr(meta, field)}{q}{sep}"
-
-            if MetricsReader.Out.filter.process(unique, unique_key):
-                print(csv_line)
-
-        @staticmethod
-        def write_metric(metrics_list: List[AbsMetricValues]) -> None:
-            for data in metrics_list:
-                logger.debug(f"data = {data}")
-
-                if type(data.metrics) == PMONBWValues:
-                    MetricsReader.Out.csv_output(
-                        data,
-                        ["node_name", "mem_bw_rd", "mem_bw_wr", "mem_bw_total"],
-                        "node_name",
-                    )
-                elif type(data.metrics) == HWMONTempValues:
-                    MetricsReader.Out.csv_output(
-                        data,
-                        ["label", "socket_sensor", "input", "crit", "max"],
-                        "socket_sensor",
-                    )
-                elif type(data.metrics) == PMONCorrerrcntValues:
-                    MetricsReader.Out.csv_output(
-                        data,
-                        [
-                            "node_name",
-                            "correrrcnt_0",
-                            "correrrcnt_1",
-                            "correrrcnt_2",
-                            "correrrcnt_3",
-                            "correrrthrshld_0",
-                            "correrrthrshld_1",
-                            "correrrthrshld_2",
-                            "correrrthrshld_3",
-                            "correrrorstatus",
-                        ],
-                        "node_name",
-                    )
-                elif type(data.metrics) == PMONTRMLMaxTempValues:
-                    MetricsReader.Out.csv_output(
-                        data,
-                        [
-                            "node_name",
-                            "channel0_max_temp",
-                            "channel1_max_temp",
-                            "channel2_max_temp",
-                            "channel3_max_temp",
-                        ],
-                        "node_name",
-                    )
+        def write_metric(self, metrics_list: List[AbsMetricValues]) -> None:
+            if self.exporter is not None:
+                self.exporter.write_metric(metrics_list)
+            super().write_metric(metrics_list)
 
-    async def exec_task(self, cmd: Command) -> None:
-        if cmd.delay is not None and cmd.delay != 0:
-            await asyncio.sleep(cmd.delay)
-        logger.debug(f"EXEC TASK {cmd.name} sleep={cmd.delay}")
-        await NativeCallMap.cmd(cmd.name, cmd.cmd, MetricsReader.Out())
+    def __init__(self, out: Optional[CSVDataProcessor] = None) -> None:
+        self.out = out or MetricsReader.Out()
+
+    async def flush_task(self) -> None:
+        """Flush buffered output that has not been followed by new rows."""
+        while True:
+            await asyncio.sleep(self.out.buffer.max_delay)
+            self.out.flush_if_due()
+
+    async def exec_task(self, cmd: Command, phase: float) -> None:
+        """
+        Run [cmd] on a fixed-rate monotonic timeline, first run after [phase] seconds.
+        Deadlines advance by cmd.delay independently of execution time, so the period
+        does not drift. On overrun missed deadlines are skipped (OVERRUN_SKIP)
+        or executed back-to-back until the timeline is reached (OVERRUN_CATCHUP).
+        """
+        loop = asyncio.get_running_loop()
+        deadline: float = loop.time() + phase
+        while True:
+            await asyncio.sleep(max(0.0, deadline - loop.time()))
+            instrumentation.command(cmd.name).lateness.observe(
+                max(0.0, loop.time() - deadline)
+            )
+            logger.debug("EXEC TASK %s period=%s", cmd.name, cmd.delay)
+            await NativeCallMap.cmd(cmd.name, cmd.cmd, self.out)
+
+            if not cmd.delay:
+                deadline = loop.time()
+                continue
+            deadline += cmd.delay
+            late: float = loop.time() - deadline
+            if late > 0 and cmd.overrun == OVERRUN_SKIP:
+                skipped: int = math.ceil(late / cmd.delay)
+                logger.debug("OVERRUN TASK %s skipped=%d", cmd.name, skipped)
+                deadline += skipped * cmd.delay
+
+    @staticmethod
+    def phases(cmds: List[Command]) -> Dict[str, float]:
+        """
+        Spread start times of commands sharing the same period evenly over that period,
+        i.e three 60s commands start after 20s, 40s and 60s.
+        """
+        by_delay: Dict[float, List[Command]] = {}
+        for cmd in cmds:
+            by_delay.setdefault(cmd.delay or 0.0, []).append(cmd)
+        phases: Dict[str, float] = {}
+        for delay, group in by_delay.items():
+            for idx, cmd in enumerate(group):
+                phases[cmd.name] = delay * (idx + 1) / len(group)
+        return phases
 
     async def run(self, cmds: List[Command]) -> None:
+        self.flusher = asyncio.create_task(self.flush_task(), name="flush")
+        self.commands: Dict[str, Command] = {cmd.name: cmd for cmd in cmds}
+        phases = MetricsReader.phases(cmds)
         self.pending_tasks = {
-            asyncio.create_task(self.exec_task(cmd), name=cmd.name) for cmd in cmds
+            asyncio.create_task(self.exec_task(cmd, phases[cmd.name]), name=cmd.name)
+            for cmd in cmds
         }
-        while True:
-            done, self.pending_tasks = await asyncio.wait(
-                self.pending_tasks, return_when=asyncio.FIRST_COMPLETED
-            )
+        try:
+            while True:
+                done, self.pending_tasks = await asyncio.wait(
+                    self.pending_tasks, return_when=asyncio.FIRST_COMPLETED
+                )
 
-            for task in done:
-                name = task.get_name()
-                logger.debug(f"COMPLETED TASK: {name}")
-                for cmd in cmds:
-                    if cmd.name == name:
-                        self.pending_tasks.add(
-                            asyncio.create_task(self.exec_task(cmd), name=cmd.name)
+                # scheduled tasks run forever, completion means a failure - restart it
+                for task in done:
+                    name = task.get_name()
+                    if not task.cancelled() and task.exception():
+                        logger.error(f"FAILED TASK: {name} {task.exception()!r}")
+                    else:
+                        logger.debug("COMPLETED TASK: %s", name)
+                    cmd = self.commands[name]
+                    self.pending_tasks.add(
+                        asyncio.create_task(
+                            self.exec_task(cmd, cmd.delay), name=cmd.name
                         )
+                    )
+        finally:
+            # stop (SIGTERM/SIGINT cancel the main task) - write rows still buffered
+            tasks = {self.flusher, *self.pending_tasks}
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.out.flush()
 
 
-async def main() -> None:
-    metrics = MetricsReader()
+async def main(args: argparse.Namespace) -> None:
+    exporter: Optional[PrometheusExporter] = None
+    if args.prometheus:
+        host, _, port = args.prometheus.rpartition(":")
+        exporter = PrometheusExporter(MetricsReader.Out.PROMETHEUS)
+        await exporter.serve(host or "127.0.0.1", int(port))
+    metrics = MetricsReader(
+        MetricsReader.Out(
+            sink_from_spec(args.output),
+            args.batch_lines,
+            args.batch_delay,
+            args.dedupe_capacity,
+            args.heartbeat,
+            exporter,
+        )
+    )
     cmds = [
         # Command("read_bw", ["read_bw", "1"], 15),
+        # Command("read_bw_sampler", ["read_bw_sampler", "0.5", "30"], 0),
         Command("read_hwmon_temp", ["read_hwmon_temp"], 60),
         Command(
             "read_correrrcnt",
@@ -153,11 +329,110 @@ async def main() -> None:
             60,
         ),
         #        Command("read_dimm_temp", ["read_dimm_temp", "0x6fb0", "0x6fd0"], 15),
+        *(
+            [Command("read_mca", ["read_mca", *args.mca_banks], args.mca_interval)]
+            if args.mca_interval
+            else []
+        ),
+        *(
+            [
+                Command(
+                    "read_rank_bw",
+                    [
+                        "read_rank_bw",
+                        str(args.rank_bw_interval),
+                        str(args.rank_bw_slice),
+                    ],
+                    0,
+                )
+            ]
+            if args.rank_bw_interval
+            else []
+        ),
+        Command(
+            "read_self_metrics",
+            ["read_self_metrics", *([args.stats_file] if args.stats_file else [])],
+            args.stats_interval,
+        ),
     ]
-    await metrics.run(cmds)
+    main_task = asyncio.current_task()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, main_task.cancel)  # type: ignore
+    try:
+        await metrics.run(cmds)
+    except asyncio.CancelledError:
+        logger.debug("STOP collector")
+    finally:
+        metrics.out.close()
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Memory inspector")
+    parser.add_argument(
+        "--output",
+        default="stdout",
+        help='CSV output: "stdout", "file:PATH", "rotating:PATH" or "unix:PATH"',
+    )
+    parser.add_argument(
+        "--batch-lines", type=int, default=256, help="flush after N buffered rows"
+    )
+    parser.add_argument(
+        "--batch-delay", type=float, default=1.0, help="flush rows older than N seconds"
+    )
+    parser.add_argument(
+        "--dedupe-capacity",
+        type=int,
+        default=4096,
+        help="number of series tracked by duplicate filter",
+    )
+    parser.add_argument(
+        "--heartbeat",
+        type=float,
+        default=0.0,
+        help="emit unchanged rows every N seconds (0 - only on change)",
+    )
+    parser.add_argument(
+        "--stats-interval",
+        type=float,
+        default=60.0,
+        help="period of collector self metrics in seconds",
+    )
+    parser.add_argument(
+        "--stats-file", help="JSON instrumentation snapshot replaced every period"
+    )
+    parser.add_argument(
+        "--mca-interval",
+        type=float,
+        default=0.0,
+        help="period of machine check bank polling in seconds (0 - disabled), "
+        "requires the msr kernel module",
+    )
+    parser.add_argument(
+        "--mca-banks",
+        nargs="*",
+        default=[],
+        metavar="BANK",
+        help='MCA banks or ranges i.e "7" "13-18", default memory controller banks',
+    )
+    parser.add_argument(
+        "--rank-bw-interval",
+        type=float,
+        default=0.0,
+        help="period of per rank bandwidth in seconds (0 - disabled), "
+        "uses all iMC channel counters",
+    )
+    parser.add_argument(
+        "--rank-bw-slice",
+        type=float,
+        default=0.1,
+        help="per rank bandwidth counter multiplexing slice in seconds",
+    )
+    parser.add_argument(
+        "--prometheus",
+        metavar="[HOST:]PORT",
+        help="serve latest values in Prometheus format on http://HOST:PORT/metrics",
+    )
     pmu_utils_init()
     logger.setLevel(100)
-    asyncio.run(main())
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,27 @@
+#!/usr/bin/python3
+import argparse
+import os
+import sys
+
+from libs.pmon.pmon_snapshot import convert_dump
+
+
+def pmon_snapshot() -> int:
+    parser = argparse.ArgumentParser(
+        description='Convert "lspci -xxxx -D" text dump to binary snapshot '
+        "loaded by PMONEmulatedDriver via mmap"
+    )
+    parser.add_argument("dump", help='"lspci -xxxx -D" output file')
+    parser.add_argument("snapshot", help="output snapshot file")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.dump):
+        print(f"File {args.dump} desn't exist")
+        return 1
+    count: int = convert_dump(args.dump, args.snapshot)
+    print(f"{count} devices written to {args.snapshot}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(pmon_snapshot())
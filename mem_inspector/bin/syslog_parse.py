@@ -1,73 +1,91 @@
 #!/usr/bin/python3
-import sys, os,csv
-import json
+import argparse
+import os
+import sys
+from typing import Any, Dict, Iterable
 
-def print_csv(li):
-    print(";".join(li[0]))
-    for line in li:
-        lista = []
-        for item in line:
-            lista.append(str(line[item]))
-        print(";".join(lista))
+from libs.ce_export import FORMAT_NPY, FORMAT_NPZ, CEColumnStore
+from libs.syslog_ce import CE_FIELDS, SyslogFollower, parse_files
 
-def syslog_analysis():
-    syslog_list = []
-    for filename in sys.argv[1:]:
+
+def print_csv(records: Iterable[Dict[str, Any]], flush: bool = False) -> None:
+    header: bool = False
+    for record in records:
+        if not header:
+            print(";".join(CE_FIELDS))
+            header = True
+        print(";".join(str(record[field]) for field in CE_FIELDS), flush=flush)
+
+
+def syslog_analysis() -> int:
+    parser = argparse.ArgumentParser(
+        description="Parse CE-ERROR records from (rotated, .gz, .xz) syslog files"
+    )
+    parser.add_argument("files", nargs="+", help="syslog files")
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=1, help="parse files in N processes"
+    )
+    parser.add_argument(
+        "-f",
+        "--follow",
+        action="store_true",
+        help="follow the (single) syslog file and print records as they complete",
+    )
+    parser.add_argument(
+        "--checkpoint", help="file persisting the follow position between runs"
+    )
+    parser.add_argument(
+        "--interval", type=float, default=1.0, help="follow poll interval in seconds"
+    )
+    parser.add_argument(
+        "--export",
+        metavar="DIR",
+        help="append records to a columnar NumPy export directory instead of CSV",
+    )
+    parser.add_argument(
+        "--format",
+        choices=[FORMAT_NPY, FORMAT_NPZ],
+        default=FORMAT_NPY,
+        help="export shard format, npy shards can be memory mapped",
+    )
+    parser.add_argument(
+        "--shard-rows", type=int, default=1 << 20, help="records per export shard"
+    )
+    parser.add_argument(
+        "--year",
+        type=int,
+        help="year of the syslog dates (default: current year, previous year "
+        "for dates later than now)",
+    )
+    args = parser.parse_args()
+
+    if args.follow:
+        if len(args.files) != 1:
+            print("Only one file can be followed")
+            return 1
+        follower = SyslogFollower(args.files[0], args.checkpoint, args.interval)
+        try:
+            print_csv(follower.follow(), flush=True)
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    for filename in args.files:
         if not os.path.isfile(filename):
             print(f"File {filename} desn't exist")
-            return None
-        file = open(filename, "rb")
-        ce_error = {}
+            return 1
+    if args.export:
+        try:
+            store = CEColumnStore(args.export, args.format, args.shard_rows, args.year)
+        except (RuntimeError, ValueError) as err:
+            print(err)
+            return 1
+        store.extend(parse_files(args.files, args.jobs))
+        store.close()
+        return 0
+    print_csv(parse_files(args.files, args.jobs))
+    return 0
 
-        for line in file:
-            words = line.split()
-            if words[6].decode("utf-8") == "CE-ERROR:":
-                if words[7].decode("utf-8") == "Getting" and words[8].decode("utf-8") == "counters":
-                    ce_error = {
-                        "date": words[0].decode("utf-8") + " " + words[1].decode("utf-8") + " " + words[2].decode("utf-8"),
-                        "host": words[3].decode("utf-8"),
-                        "pci" : words[12].decode("utf-8"),
-                        "rank0": 0,
-                        "rank1": 0,
-                        "rank2": 0,
-                        "rank3": 0,
-                        "rank4": 0,
-                        "rank5": 0,
-                        "rank6": 0,
-                        "rank7": 0,
-                        "node": 0,
-                        "source": 0,
-                        "cpu": 0,
-                        "ha": 0,
-                        "mci_status": 0,
-                        "mci_status_long": 0,
-                        "mci_addr": 0,
-                        "mci_addr_long": 0,
-                    }
-                elif words[7].decode("utf-8").startswith("Rank0="):
-                    ce_error["rank0"] = int(words[7].decode("utf-8")[6:],10)
-                    ce_error["rank1"] = int(words[8].decode("utf-8")[6:],10)
-                    ce_error["rank2"] = int(words[9].decode("utf-8")[6:],10)
-                    ce_error["rank3"] = int(words[10].decode("utf-8")[6:],10)
-                    ce_error["rank4"] = int(words[11].decode("utf-8")[6:],10)
-                    ce_error["rank5"] = int(words[12].decode("utf-8")[6:],10)
-                    ce_error["rank6"] = int(words[13].decode("utf-8")[6:],10)
-                    ce_error["rank7"] = int(words[14].decode("utf-8")[6:],10)
-                    ce_error["node"] = int(words[16].decode("utf-8"))
-                    ce_error["source"] = int(words[17].decode("utf-8")[7:],10)
-                elif words[7].decode("utf-8") == "status" and words[8].decode("utf-8") == "and" and words[9].decode("utf-8") == "address":
-                    ce_error["cpu"] = int(words[12].decode("utf-8")[4:],10)
-                    ce_error["ha"] = int(words[13].decode("utf-8")[3:-1],10)
-                    ce_error["mci_status"] = int(words[14].decode("utf-8")[11:],10)
-                    ce_error["mci_status_long"] = words[15].decode("utf-8")[:-1]
-                    ce_error["mci_addr"] = int(words[16].decode("utf-8")[9:],10)
-                    ce_error["mci_addr_long"] = words[17].decode("utf-8")
-                    syslog_list.append(ce_error)
-    return syslog_list
 
 if __name__ == "__main__":
-    dlist = syslog_analysis()
-    if dlist:
-        # print(json.dumps(dlist))
-        print_csv(dlist)
-
+    sys.exit(syslog_analysis())
@@ -0,0 +1,60 @@
+"""
+Micro-benchmark of register field decoding.
+Compares get_bitfield() per field and per value, the precomputed scalar
+decoder (decode_value) and one vectorized NumPy pass over all values
+(decode_array) for CORRERRCNT registers of a simulated fleet.
+"""
+import random
+import timeit
+from typing import List
+
+import numpy as np
+
+from libs.logger import pmon_logger as logger
+from libs.pmon.pmon import Registers
+from libs.pmon.pmon_layout import REGISTER_LAYOUTS, decode_array, decode_value
+from libs.pmon.pmon_utils import get_bitfield
+
+logger.setLevel(100)
+
+REGISTER: Registers = Registers.correrrcnt_0
+VALUES: int = 100_000
+LOOPS: int = 3
+
+values: List[int] = [random.getrandbits(32) for _ in range(VALUES)]
+array = np.array(values, dtype=np.uint32)
+
+
+def bitfield() -> None:
+    for value in values:
+        for _, lo, hi in REGISTER_LAYOUTS[REGISTER]:
+            get_bitfield(value, lo, hi)
+
+
+def scalar() -> None:
+    for value in values:
+        decode_value(REGISTER, value)
+
+
+def vectorized() -> None:
+    decode_array(REGISTER, array)
+
+
+if __name__ == "__main__":
+    decoded = decode_array(REGISTER, array)
+    for idx in range(0, VALUES, VALUES // 100):
+        fields = decode_value(REGISTER, values[idx])
+        for name, lo, hi in REGISTER_LAYOUTS[REGISTER]:
+            expected: int = get_bitfield(values[idx], lo, hi)
+            assert decoded[name][idx] == fields[name] == expected
+    print(f"{VALUES} {REGISTER.name} values, {len(REGISTER_LAYOUTS[REGISTER])} fields")
+    for name, func in (
+        ("get_bitfield", bitfield),
+        ("decode_value", scalar),
+        ("decode_array", vectorized),
+    ):
+        best: float = min(timeit.repeat(func, number=LOOPS, repeat=3))
+        print(
+            f"{name:>12}: {best / LOOPS * 1e3:8.2f} ms/pass "
+            f"{best / LOOPS / VALUES * 1e9:8.1f} ns/value"
+        )
@@ -0,0 +1,80 @@
+"""
+Micro-benchmark of debug logging cost on register read paths with logging disabled.
+Compares eager f-string / str.format() debug messages (formatted even when the
+message is dropped) with lazy %-style arguments and isEnabledFor() guards.
+Emulated driver reads from an in-memory dump, so no hardware is needed;
+"driver get" is the full PMON[node].reg(register).get() path.
+"""
+import timeit
+from typing import Tuple
+
+from libs.logger import pmon_logger as logger
+from libs.pmon.pmon import PMON, Registers, Size
+from libs.pmon.pmon_driver_emulated import PMONEmulatedDriver
+from libs.pmon.pmon_utils import get_bitfield
+
+logger.setLevel(100)
+
+NODE: str = "0000:ff:14.3"
+LOOPS: int = 100000
+
+PMONEmulatedDriver.dump_file = "<memory>"
+PMONEmulatedDriver.dump_data = {NODE: bytearray(range(256)) * 16}
+pmon = PMON(PMONEmulatedDriver)
+register = pmon[NODE].reg(Registers.correrrcnt_0)
+sbdf: Tuple[str, ...] = tuple(NODE.replace(".", ":").split(":"))
+
+
+def eager_get() -> int:
+    path = str("%s:%s:%s.%s" % sbdf)
+    addr = Registers.correrrcnt_0
+    value: int = int.from_bytes(
+        PMONEmulatedDriver.dump_data[path][addr.value : addr.value + 4], "little"
+    )
+    logger.debug(f"[GET] pmon[{path}].reg({hex(addr.value)}).get({4}) = {value}")
+    return value
+
+
+def lazy_get() -> int:
+    path = str("%s:%s:%s.%s" % sbdf)
+    addr = Registers.correrrcnt_0
+    value: int = int.from_bytes(
+        PMONEmulatedDriver.dump_data[path][addr.value : addr.value + 4], "little"
+    )
+    logger.debug("[GET] pmon[%s].reg(%#x).get(%d) = %d", path, addr.value, 4, value)
+    return value
+
+
+def driver_get() -> int:
+    return register.get(Size.DWORD)
+
+
+def eager_bitfield() -> int:
+    data, startbit, endbit = 0x12345678, 4, 11
+    value: int = data >> startbit
+    mask: int = (1 << (endbit - startbit + 1)) - 1
+    result: int = value & mask
+    logger.debug(
+        "[BITFIELD] {0:032b}[{1}:{2}] = {3:0b} x {4:0b} = {5:0b}".format(
+            data, startbit, endbit, value, mask, result
+        )
+    )
+    return result
+
+
+def guarded_bitfield() -> int:
+    return get_bitfield(0x12345678, 4, 11)
+
+
+if __name__ == "__main__":
+    assert eager_get() == lazy_get() == driver_get()
+    assert eager_bitfield() == guarded_bitfield()
+    for name, func in (
+        ("eager get", eager_get),
+        ("lazy get", lazy_get),
+        ("driver get", driver_get),
+        ("eager bitfield", eager_bitfield),
+        ("guarded bitfield", guarded_bitfield),
+    ):
+        best: float = min(timeit.repeat(func, number=LOOPS, repeat=5))
+        print(f"{name:>16}: {best / LOOPS * 1e9:10.1f} ns/call")
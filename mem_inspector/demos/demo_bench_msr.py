@@ -0,0 +1,78 @@
+"""
+Micro-benchmark of MSR reads across all logical CPUs.
+Compares open/seek/read/close per read with pooled per-CPU descriptors and
+pread, sequential and split among a thread pool (read_msr_all workers).
+Uses /dev/cpu/*/msr when readable (root, msr module loaded), otherwise a
+temporary file tree, which measures the Python and syscall side only.
+"""
+import os
+import shutil
+import tempfile
+import timeit
+from typing import List
+
+from libs.io_executor import all_cpus
+from libs.logger import pmon_logger as logger
+from libs.pmon.pmon import PMON
+from libs.pmon.pmon_driver_linuxkernel import PMONLinuxKernelDriver
+
+logger.setLevel(100)
+
+# MCi_CTL, MCi_STATUS, MCi_ADDR, MCi_MISC of the first 4 machine check banks
+MSRS: List[int] = [0x400 + bank * 4 + reg for bank in range(4) for reg in range(4)]
+LOOPS: int = 5
+
+cpus: List[int] = all_cpus()
+tmpdir: str = ""
+if not os.access(PMONLinuxKernelDriver.MSR_PATH % cpus[0], os.R_OK):
+    tmpdir = tempfile.mkdtemp()
+    for cpu in cpus:
+        os.makedirs(f"{tmpdir}/{cpu}")
+        with open(f"{tmpdir}/{cpu}/msr", "wb") as file:
+            file.write(bytes(0x500))
+    PMONLinuxKernelDriver.MSR_PATH = tmpdir + "/%d/msr"
+    print(f"/dev/cpu/*/msr not readable, using {tmpdir}")
+
+pmon = PMON(PMONLinuxKernelDriver)
+
+
+def unpooled() -> None:
+    PMONLinuxKernelDriver.fd_pool = False
+    for cpu in cpus:
+        for msr in MSRS:
+            pmon.read_msr(cpu, msr)
+    PMONLinuxKernelDriver.fd_pool = True
+
+
+def pooled() -> None:
+    for cpu in cpus:
+        for msr in MSRS:
+            pmon.read_msr(cpu, msr)
+
+
+def batched() -> None:
+    pmon.read_msr_all(MSRS, cpus)
+
+
+def threaded() -> None:
+    pmon.read_msr_all(MSRS, cpus, workers=4)
+
+
+if __name__ == "__main__":
+    reads: int = len(cpus) * len(MSRS)
+    print(f"{len(MSRS)} MSRs x {len(cpus)} CPUs = {reads} reads per pass")
+    assert pmon.read_msr_all(MSRS, cpus) == pmon.read_msr_all(MSRS, cpus, workers=4)
+    for name, func in (
+        ("unpooled", unpooled),
+        ("pooled", pooled),
+        ("read_msr_all", batched),
+        ("4 workers", threaded),
+    ):
+        best: float = min(timeit.repeat(func, number=LOOPS, repeat=3))
+        print(
+            f"{name:>12}: {best / LOOPS * 1e3:8.2f} ms/pass "
+            f"{best / LOOPS / reads * 1e9:8.1f} ns/read"
+        )
+    PMONLinuxKernelDriver.invalidate()
+    if tmpdir:
+        shutil.rmtree(tmpdir)
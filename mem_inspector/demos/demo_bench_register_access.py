@@ -0,0 +1,52 @@
+"""
+Micro-benchmark of PMON[node].reg(register) per-access overhead.
+Compares memoized PMONUnit/PMONRegister handles with the previous
+implementation, which created nested Unit and Register classes on every access.
+The null PMONDriver is used, so only Python side overhead is measured.
+"""
+import re
+import timeit
+from typing import Any, Tuple
+
+from libs.pmon.pmon import PMON, PMONDriver, Registers, Size
+from libs.logger import pmon_logger as logger
+
+logger.setLevel(100)
+
+NODE: str = "0000:ff:14.3"
+LOOPS: int = 100000
+
+pmon = PMON(PMONDriver)
+
+
+def legacy_reg(driver: Any, search: str, register: Registers) -> Any:
+    class Unit:
+        def __init__(self, node: Tuple[str, ...]) -> None:
+            self.node = node
+
+        def reg(self, register: Registers) -> Any:
+            class Register(driver):  # type: ignore
+                def __init__(self, parent: Unit, register: Registers) -> None:
+                    self.parent = parent
+                    self.register = register
+
+                def get(self, size: Size = Size.DWORD) -> int:
+                    return super().get(self.parent.node, self.register, size)  # type: ignore
+
+            return Register(self, register)
+
+    return Unit(tuple(re.split(r":|\.", search))).reg(register)
+
+
+def bench_legacy() -> int:
+    return legacy_reg(PMONDriver, NODE, Registers.correrrcnt_0).get()  # type: ignore
+
+
+def bench_cached() -> int:
+    return pmon[NODE].reg(Registers.correrrcnt_0).get()
+
+
+if __name__ == "__main__":
+    for name, func in (("legacy", bench_legacy), ("cached", bench_cached)):
+        best: float = min(timeit.repeat(func, number=LOOPS, repeat=5))
+        print(f"{name:>8}: {best / LOOPS * 1e9:10.1f} ns/access")
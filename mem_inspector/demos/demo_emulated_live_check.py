@@ -0,0 +1,54 @@
+"""
+Compare PMONEmulatedDriver live mode (in-process sysfs config space reads)
+with a dump captured on the same host by "lspci -xxxx -D > dump".
+Scan results and the standard config header (first 64 bytes, static while
+the host is up) of every device must match; PMON counters are not compared.
+Run as root, lspci shows only the first 64 bytes to other users.
+"""
+import os
+import sys
+import time
+from typing import Dict, List
+
+from libs.logger import pmon_logger as logger
+from libs.pmon.pmon import PMON, PMONDevice, parse_node
+from libs.pmon.pmon_driver_emulated import PMONEmulatedDriver
+
+logger.setLevel(100)
+
+HEADER_SIZE: int = 64
+
+if len(sys.argv) != 2 or not os.path.isfile(sys.argv[1]):
+    print(f"Usage: {sys.argv[0]} <lspci -xxxx -D dump>")
+    sys.exit(1)
+
+PMONEmulatedDriver.dump_file = sys.argv[1]
+PMONEmulatedDriver.readdump()
+dump: Dict[str, bytes] = {
+    path: bytes(config[:HEADER_SIZE])
+    for path, config in PMONEmulatedDriver.dump_data.items()
+}
+dumped: List[PMONDevice] = PMONEmulatedDriver.scan()
+
+PMONEmulatedDriver.dump_file = ""
+PMONEmulatedDriver.dump_data = {}
+pmon = PMON(PMONEmulatedDriver)
+driver = PMONEmulatedDriver()
+start: float = time.perf_counter()
+live: List[PMONDevice] = pmon.scan()
+print(f"live scan: {len(live)} devices in {(time.perf_counter() - start) * 1e3:.1f} ms")
+
+errors: int = 0
+if live != dumped:
+    print(f"scan mismatch: {len(dumped)} devices in dump, {len(live)} live")
+    errors += 1
+start = time.perf_counter()
+for device in live:
+    expected: bytes = dump.get(device.path, b"")
+    data = driver.get_block(parse_node(device.path), 0, len(expected))
+    if data != expected:
+        print(f"{device.path}: config header differs from dump")
+        errors += 1
+print(f"live header reads: {(time.perf_counter() - start) * 1e3:.1f} ms")
+print("OK" if not errors else f"{errors} mismatches")
+sys.exit(1 if errors else 0)
@@ -1,5 +1,6 @@
 from libs.hwmon.hwmon import HWMON
 from libs.pmon.pmon import PMON, Devices, Registers, PMONDevice
+from libs.pmon.pmon_layout import format_fields
 from libs.pmon.pmon_driver_emulated import PMONEmulatedDriver
 from libs.pmon.pmon_driver_linuxkernel import PMONLinuxKernelDriver
 from libs.vme_constants import PCI_INTEL_VENDORID
@@ -47,9 +48,8 @@ def read_correrrcnt():
     for dev in scan_and_cache_correrr_imc:
         print(f"\n\t{dev}")
         correrrorstatus = pmon[dev.path].reg(Registers.correrrorstatus).get()
-        correrrorstatus_bin = f"{correrrorstatus:032b}"
-        correrrorstatus_bin = f"{correrrorstatus_bin[0:7]} {correrrorstatus_bin[8:10]} {correrrorstatus_bin[11:13]} {correrrorstatus_bin[14:21]} {correrrorstatus_bin[22:31]}"
-        print(f"{Registers.correrrorstatus.name} [0x{Registers.correrrorstatus.value:02X}] = {correrrorstatus_bin}")
+        print(f"{Registers.correrrorstatus.name} [0x{Registers.correrrorstatus.value:02X}] = "
+              f"{format_fields(Registers.correrrorstatus, correrrorstatus)}")
 
         for reg in range(0,4):
             correrrcnt = Registers[f"correrrcnt_{reg}"]
@@ -57,10 +57,8 @@ def read_correrrcnt():
             correrrcnt_value = pmon[dev.path].reg(correrrcnt).get()
             correrrthrshld_value = pmon[dev.path].reg(correrrthrshld).get()
 
-            correrrcnt_bin = f"{correrrcnt_value:032b}"
-            correrrcnt_bin = f"{correrrcnt_bin[0:14]} {correrrcnt_bin[15]} {correrrcnt_bin[16:30]} {correrrcnt_bin[31]}"
-            correrrthrshld_bin = f"{correrrthrshld_value:032b}"
-            correrrthrshld_bin = f"{correrrthrshld_bin[0:14]} {correrrthrshld_bin[15]} {correrrthrshld_bin[16:30]} {correrrthrshld_bin[31]}"
+            correrrcnt_bin = format_fields(correrrcnt, correrrcnt_value)
+            correrrthrshld_bin = format_fields(correrrthrshld, correrrthrshld_value)
 
             print(f"{correrrcnt.name} [0x{correrrcnt.value:02X}] = {correrrcnt_bin}\t"
                 f"{correrrthrshld.name} [0x{correrrthrshld.value:02X}] = {correrrthrshld_bin}")
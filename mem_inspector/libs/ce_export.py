@@ -0,0 +1,245 @@
+"""
+Columnar binary export of parsed CE records
+Records are stored as typed NumPy column shards (memory-mappable .npy files
+or compressed .npz archives) with dictionary-encoded host and PCI columns.
+
+Layout of an export directory:
+    index.json          shard list, row counts, host and PCI dictionaries
+    shard-00000/        one <column>.npy file per column  (format "npy")
+    shard-00001.npz     all columns of a shard            (format "npz")
+"""
+import json
+import os
+import time
+from functools import lru_cache
+from typing import Any, Dict, Final, Iterable, Iterator, List, Optional, Tuple
+
+from libs.logger import logger
+
+try:
+    import numpy as np  # type: ignore
+except ImportError:
+    # numpy is only required for the binary export
+    np = None
+
+FORMAT_NPY: Final[str] = "npy"
+FORMAT_NPZ: Final[str] = "npz"
+
+INDEX_FILE: Final[str] = "index.json"
+
+# column name -> numpy dtype name
+CE_COLUMNS: Final[Dict[str, str]] = {
+    "timestamp": "int64",
+    "host": "uint32",
+    "pci": "uint32",
+    **{f"rank{rank}": "uint32" for rank in range(8)},
+    "node": "int32",
+    "source": "int32",
+    "cpu": "int32",
+    "ha": "int32",
+    "source_id": "int32",
+    "mci_status": "uint64",
+    "mci_addr": "uint64",
+    "pfn": "int64",
+}
+
+U64_MASK: Final[int] = 0xFFFFFFFFFFFFFFFF
+
+# syslog dates later than the reference time by more than this (hosts logging
+# in other time zones) belong to the previous year
+SYSLOG_FUTURE_SLACK: Final[int] = 86400
+
+
+def _require_numpy() -> None:
+    if np is None:
+        raise RuntimeError("numpy is required for the binary CE export")
+
+
+def _mktime(date: str, year: int) -> Optional[int]:
+    try:
+        return int(time.mktime(time.strptime(f"{year} {date}", "%Y %b %d %H:%M:%S")))
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=4096)
+def syslog_timestamp(date: str, year: Optional[int], reference: int) -> int:
+    """
+    Function: syslog_timestamp(date, year, reference)
+    Description: Convert syslog "Nov 27 10:04:48" local time to epoch seconds,
+    0 when the date is missing or malformed. Without [year] the year of the
+    [reference] time is used, or the previous year when the date would be
+    later than [reference] (a log crossing new year, Feb 29 of a leap year)
+    """
+    if not date:
+        return 0
+    if year:
+        return _mktime(date, year) or 0
+    current: int = time.localtime(reference).tm_year
+    stamp: Optional[int] = _mktime(date, current)
+    if stamp is None or stamp > reference + SYSLOG_FUTURE_SLACK:
+        stamp = _mktime(date, current - 1)
+    return stamp or 0
+
+
+class CEColumnStore:
+    """
+    Class: CEColumnStore
+    Description: Append CE records to an export directory.
+    Records are buffered per column and written as a new shard every
+    [shard_rows] records and on flush(); existing shards and dictionaries
+    are kept, so an export can be appended to by later runs.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        fmt: str = FORMAT_NPY,
+        shard_rows: int = 1 << 20,
+        year: Optional[int] = None,
+    ) -> None:
+        _require_numpy()
+        if fmt not in (FORMAT_NPY, FORMAT_NPZ):
+            raise ValueError(f"Unsupported export format {fmt!r}")
+        self.path = path
+        self.fmt = fmt
+        self.shard_rows = shard_rows
+        # syslog dates have no year, without [year] it is inferred relative
+        # to the time of the export
+        self.year: Optional[int] = year
+        self.reference: int = int(time.time())
+        os.makedirs(path, exist_ok=True)
+        self.index: Dict[str, Any] = read_index(path)
+        self.hosts: Dict[str, int] = {
+            host: idx for idx, host in enumerate(self.index["hosts"])
+        }
+        self.pcis: Dict[str, int] = {
+            pci: idx for idx, pci in enumerate(self.index["pci"])
+        }
+        self.columns: Dict[str, List[int]] = {name: [] for name in CE_COLUMNS}
+
+    def _encode(self, values: Dict[str, int], key: str, dictionary: List[str]) -> int:
+        idx: Optional[int] = values.get(key)
+        if idx is None:
+            idx = values[key] = len(dictionary)
+            dictionary.append(key)
+        return idx
+
+    def append(self, record: Dict[str, Any]) -> None:
+        columns: Dict[str, List[int]] = self.columns
+        columns["timestamp"].append(
+            syslog_timestamp(record["date"], self.year, self.reference)
+        )
+        columns["host"].append(
+            self._encode(self.hosts, record["host"], self.index["hosts"])
+        )
+        columns["pci"].append(
+            self._encode(self.pcis, record["pci"], self.index["pci"])
+        )
+        for name in CE_COLUMNS:
+            if name in ("timestamp", "host", "pci"):
+                continue
+            value: int = record.get(name, 0)
+            if name in ("mci_status", "mci_addr"):
+                # driver logs the 64-bit registers with %lld
+                value &= U64_MASK
+            columns[name].append(value)
+        if len(columns["timestamp"]) >= self.shard_rows:
+            self.flush()
+
+    def extend(self, records: Iterable[Dict[str, Any]]) -> int:
+        count: int = 0
+        for record in records:
+            self.append(record)
+            count += 1
+        return count
+
+    def flush(self) -> None:
+        """
+        Method: flush()
+        Description: Write buffered records as a new shard and update the index
+        """
+        rows: int = len(self.columns["timestamp"])
+        if not rows:
+            return None
+        arrays: Dict[str, Any] = {
+            name: np.array(self.columns[name], dtype=dtype)
+            for name, dtype in CE_COLUMNS.items()
+        }
+        name: str = f"shard-{len(self.index['shards']):05d}"
+        if self.fmt == FORMAT_NPZ:
+            name += ".npz"
+            np.savez_compressed(os.path.join(self.path, name), **arrays)
+        else:
+            os.makedirs(os.path.join(self.path, name), exist_ok=True)
+            for column, array in arrays.items():
+                np.save(os.path.join(self.path, name, f"{column}.npy"), array)
+        self.index["shards"].append({"name": name, "rows": rows})
+        self.index["rows"] += rows
+        write_index(self.path, self.index)
+        logger.debug(f"[CE_EXPORT] {name}: {rows} records")
+        self.columns = {column: [] for column in CE_COLUMNS}
+        return None
+
+    def close(self) -> None:
+        self.flush()
+
+
+def read_index(path: str) -> Dict[str, Any]:
+    """
+    Function: read_index(path)
+    Description: Return index of the export directory (empty index if none)
+    """
+    try:
+        with open(os.path.join(path, INDEX_FILE), "r") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {
+            "columns": CE_COLUMNS,
+            "rows": 0,
+            "shards": [],
+            "hosts": [],
+            "pci": [],
+        }
+
+
+def write_index(path: str, index: Dict[str, Any]) -> None:
+    tmp: str = os.path.join(path, INDEX_FILE + ".tmp")
+    with open(tmp, "w") as file:
+        json.dump(index, file)
+    os.replace(tmp, os.path.join(path, INDEX_FILE))
+
+
+def iter_shards(path: str, mmap: bool = True) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Function: iter_shards(path, mmap)
+    Description: Yield (shard name, column -> array) of the export directory.
+    "npy" shards are memory mapped unless mmap is False.
+    """
+    _require_numpy()
+    for shard in read_index(path)["shards"]:
+        name: str = shard["name"]
+        if name.endswith(".npz"):
+            with np.load(os.path.join(path, name)) as archive:
+                yield name, {column: archive[column] for column in archive.files}
+        else:
+            yield name, {
+                column: np.load(
+                    os.path.join(path, name, f"{column}.npy"),
+                    mmap_mode="r" if mmap else None,
+                )
+                for column in CE_COLUMNS
+            }
+
+
+def load_columns(path: str) -> Dict[str, Any]:
+    """
+    Function: load_columns(path)
+    Description: Return column -> array of all shards concatenated
+    """
+    shards: List[Dict[str, Any]] = [arrays for _, arrays in iter_shards(path)]
+    if not shards:
+        return {name: np.empty(0, dtype=dtype) for name, dtype in CE_COLUMNS.items()}
+    return {
+        name: np.concatenate([shard[name] for shard in shards]) for name in CE_COLUMNS
+    }
@@ -0,0 +1,512 @@
+"""
+Sliding-window training tensors from CE histories
+Combines CE records (columnar export, see libs.ce_export) and
+PMONCorrerrcntValues CSV output into fixed-size windows per DIMM rank.
+
+A series is one (host, PCI device, rank); the memory controller PCI device
+identifies socket and channel. Series ID is device ID * 8 + rank.
+
+Building runs in two passes so that inputs larger than RAM can be used:
+    1. inputs are streamed into events (series, timestamp, feature, value)
+       spilled to disk in chunks sorted by hash bucket of the device
+    2. consecutive buckets are grouped into partitions of about
+       [partition_bytes] spilled events, partitions are binned and windowed
+       by a process pool series by series, CHUNK_STARTS windows at a time.
+       Every partition produces one shard of X [windows, window, features],
+       y [windows], series [windows] and start [windows] arrays written
+       through memory maps
+
+Layout of an output directory:
+    index.json          parameters, device list and shard list
+    shard-00000/        X.npy, y.npy, series.npy, start.npy
+"""
+import glob
+import json
+import os
+import shutil
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, Final, List, Optional, Tuple
+
+from libs.ce_export import iter_shards, read_index
+from libs.logger import logger
+from libs.pmon.pmon import Registers
+from libs.pmon.pmon_layout import decode_array
+from libs.pmon.pmon_metric_values import METRICS_PMON_CORRERRCNT
+from libs.syslog_ce import open_log
+
+try:
+    import numpy as np  # type: ignore
+except ImportError:
+    # numpy is only required for the tensor builder
+    np = None
+
+RANKS: Final[int] = 8
+
+# device hash buckets of spilled events, the unit partitions are made of
+SPILL_BUCKETS: Final[int] = 4096
+# window starts of one series binned and written at once
+CHUNK_STARTS: Final[int] = 1024
+
+# output features, in X last axis order
+FEATURES: Final[List[str]] = [
+    "ce_errors",
+    "ce_records",
+    "correrr_delta",
+    "correrr_overflow",
+]
+F_CE_ERRORS: Final[int] = 0
+F_CE_RECORDS: Final[int] = 1
+F_CORRERR: Final[int] = 2
+F_CORRERR_OVERFLOW: Final[int] = 3
+
+# CSV row: "creation_timestamp";"tool";"hostname";"node_name";"correrrcnt_0";...
+CSV_TOOL: Final[int] = 1
+CSV_HOST: Final[int] = 2
+CSV_NODE: Final[int] = 3
+CSV_CORRERRCNT: Final[int] = 4
+
+
+def _require_numpy() -> None:
+    if np is None:
+        raise RuntimeError("numpy is required for the tensor builder")
+
+
+def _event_dtype() -> Any:
+    return np.dtype(
+        [("series", "u4"), ("ts", "i8"), ("feature", "u1"), ("value", "f8")]
+    )
+
+
+def normalize_pci(pci: str, decimal_slot: bool = False) -> str:
+    """
+    Function: normalize_pci(pci, decimal_slot)
+    Description: Return "bb:dd.f" (hex) of "[ssss:]bb:dd.f" PCI address.
+    The sb_edac driver logs the slot in decimal (decimal_slot=True).
+    """
+    parts: List[str] = pci.split(":")
+    try:
+        slot, _, func = parts[-1].partition(".")
+        bus: int = int(parts[-2], 16)
+        dev: int = int(slot, 10 if decimal_slot else 16)
+        fn: int = int(func or "0", 16)
+    except (IndexError, ValueError):
+        return pci.lower()
+    return f"{bus:02x}:{dev:02x}.{fn:x}"
+
+
+class TensorDatasetBuilder:
+    """
+    Class: TensorDatasetBuilder
+    Description: Build windowed tensors with [window] bins of [bin_seconds]
+    every [stride] bins, labelled with the number of CE errors of the rank in
+    the [horizon] bins following the window.
+    Windows without any event (in the window or its horizon) are skipped
+    when skip_empty is set.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        bin_seconds: int = 3600,
+        window: int = 24,
+        stride: int = 1,
+        horizon: int = 24,
+        partition_bytes: int = 256 << 20,
+        chunk_rows: int = 1 << 20,
+        skip_empty: bool = True,
+    ) -> None:
+        _require_numpy()
+        self.path = path
+        self.bin_seconds = bin_seconds
+        self.window = window
+        self.stride = stride
+        self.horizon = horizon
+        self.partition_bytes = partition_bytes
+        self.chunk_rows = chunk_rows
+        self.skip_empty = skip_empty
+        self.devices: Dict[Tuple[str, str], int] = {}
+        self.device_bucket: List[int] = []
+        self.spill_path: str = os.path.join(path, "partitions")
+        self.buffer: List[Any] = []
+        self.buffered: int = 0
+        # spilled chunk file and its bucket offsets [SPILL_BUCKETS + 1]
+        self.spills: List[Tuple[str, Any]] = []
+        # time range of all events, bins and window starts are aligned to it
+        self.ts_range: Optional[Tuple[int, int]] = None
+        os.makedirs(self.spill_path, exist_ok=True)
+
+    def device(self, host: str, pci: str) -> int:
+        key: Tuple[str, str] = (host, pci)
+        idx: Optional[int] = self.devices.get(key)
+        if idx is None:
+            idx = self.devices[key] = len(self.devices)
+            # all ranks of a device end up in the same partition
+            self.device_bucket.append(
+                zlib.crc32(f"{host}|{pci}".encode()) % SPILL_BUCKETS
+            )
+        return idx
+
+    def _spill(self) -> None:
+        if not self.buffered:
+            return None
+        events = np.concatenate(self.buffer)
+        buckets = np.asarray(self.device_bucket, dtype=np.int64)[
+            events["series"] // RANKS
+        ]
+        events = events[np.argsort(buckets, kind="stable")]
+        offsets = np.zeros(SPILL_BUCKETS + 1, dtype=np.int64)
+        np.cumsum(np.bincount(buckets, minlength=SPILL_BUCKETS), out=offsets[1:])
+        filename: str = os.path.join(self.spill_path, f"{len(self.spills):08d}.npy")
+        np.save(filename, events)
+        self.spills.append((filename, offsets))
+        self.buffer = []
+        self.buffered = 0
+        return None
+
+    def add_events(
+        self, devices: Any, ranks: Any, ts: Any, feature: int, values: Any
+    ) -> None:
+        """
+        Method: add_events(devices, ranks, ts, feature, values)
+        Description: Buffer event arrays, spill them every [chunk_rows] events
+        """
+        if not len(devices):
+            return None
+        events = np.empty(len(devices), dtype=_event_dtype())
+        events["series"] = devices * RANKS + ranks
+        events["ts"] = ts
+        events["feature"] = feature
+        events["value"] = values
+        low, high = int(events["ts"].min()), int(events["ts"].max())
+        if self.ts_range is not None:
+            low, high = min(low, self.ts_range[0]), max(high, self.ts_range[1])
+        self.ts_range = (low, high)
+        self.buffer.append(events)
+        self.buffered += len(events)
+        if self.buffered >= self.chunk_rows:
+            self._spill()
+        return None
+
+    def add_ce_export(self, path: str) -> int:
+        """
+        Method: add_ce_export(path)
+        Description: Add CE records of a columnar export directory
+        """
+        index: Dict[str, Any] = read_index(path)
+        hosts: List[str] = index["hosts"]
+        pcis: List[str] = [
+            normalize_pci(pci, decimal_slot=True) for pci in index["pci"]
+        ]
+        count: int = 0
+        for _, columns in iter_shards(path):
+            ts = np.asarray(columns["timestamp"])
+            # records without a syslog date can't be placed in time
+            valid = ts > 0
+            hosts_ids = columns["host"].astype(np.uint64)
+            pairs = (hosts_ids << np.uint64(32)) | columns["pci"].astype(np.uint64)
+            unique, inverse = np.unique(pairs[valid], return_inverse=True)
+            lookup = np.array(
+                [
+                    self.device(hosts[int(pair) >> 32], pcis[int(pair) & 0xFFFFFFFF])
+                    for pair in unique
+                ],
+                dtype=np.int64,
+            )
+            devices = lookup[inverse]
+            ts = ts[valid]
+            for rank in range(RANKS):
+                errors = np.asarray(columns[f"rank{rank}"])[valid]
+                hit = errors > 0
+                self.add_events(devices[hit], rank, ts[hit], F_CE_ERRORS, errors[hit])
+                self.add_events(devices[hit], rank, ts[hit], F_CE_RECORDS, 1.0)
+            count += int(valid.sum())
+        return count
+
+    def add_correrrcnt_csv(self, filename: str, batch: int = 65536) -> int:
+        """
+        Method: add_correrrcnt_csv(filename, batch)
+        Description: Add PMONCorrerrcntValues rows of a mem_inspector CSV output
+        file (plain, .gz or .xz), other metrics and failed reads are skipped
+        """
+        tool: bytes = METRICS_PMON_CORRERRCNT.encode()
+        devices: List[int] = []
+        stamps: List[int] = []
+        registers: List[List[int]] = []
+        count: int = 0
+        with open_log(filename) as file:
+            for line in file:
+                if tool not in line:
+                    continue
+                row: List[bytes] = [value.strip(b'"') for value in line.split(b";")]
+                try:
+                    if row[CSV_TOOL] != tool:
+                        continue
+                    regs: List[int] = list(
+                        map(int, row[CSV_CORRERRCNT : CSV_CORRERRCNT + 4])
+                    )
+                    created = datetime.fromisoformat(row[0].decode())
+                except (IndexError, ValueError):
+                    continue
+                if len(regs) != 4 or min(regs) < 0:
+                    continue
+                if created.tzinfo is None:
+                    # mem_inspector timestamps are UTC
+                    created = created.replace(tzinfo=timezone.utc)
+                devices.append(
+                    self.device(
+                        row[CSV_HOST].decode(), normalize_pci(row[CSV_NODE].decode())
+                    )
+                )
+                stamps.append(int(created.timestamp()))
+                registers.append(regs)
+                if len(devices) >= batch:
+                    count += self._add_correrr(devices, stamps, registers)
+                    devices, stamps, registers = [], [], []
+        count += self._add_correrr(devices, stamps, registers)
+        return count
+
+    def _add_correrr(
+        self, devices: List[int], stamps: List[int], registers: List[List[int]]
+    ) -> int:
+        if not devices:
+            return 0
+        dev = np.asarray(devices, dtype=np.int64)
+        ts = np.asarray(stamps, dtype=np.int64)
+        regs = np.asarray(registers, dtype=np.uint32)
+        for reg in range(4):
+            # CORRERRCNT_N holds counters and overflow bits of ranks 2N and 2N+1
+            fields = decode_array(Registers[f"correrrcnt_{reg}"], regs[:, reg])
+            for half in range(2):
+                rank: int = 2 * reg + half
+                self.add_events(dev, rank, ts, F_CORRERR, fields[f"cor_err_cnt_{half}"])
+                self.add_events(
+                    dev, rank, ts, F_CORRERR_OVERFLOW, fields[f"overflow_{half}"]
+                )
+        return len(devices)
+
+    def _partitions(self, jobs: int) -> List[List[Tuple[str, int, int]]]:
+        """
+        Method: _partitions(jobs)
+        Description: Group consecutive buckets into partitions of about
+        [partition_bytes] spilled events, split further so that there are
+        [jobs] partitions when the input is small. A partition is a list of
+        (spill file, first event, end event) slices.
+        """
+        if not self.spills:
+            return []
+        rows = sum(np.diff(offsets) for _, offsets in self.spills)
+        limit: int = max(1, self.partition_bytes // _event_dtype().itemsize)
+        target: int = max(1, min(limit, -(-int(rows.sum()) // max(jobs, 1))))
+        bounds: List[int] = [0]
+        size: int = 0
+        for bucket in range(SPILL_BUCKETS):
+            size += int(rows[bucket])
+            if size >= target:
+                bounds.append(bucket + 1)
+                size = 0
+        if bounds[-1] != SPILL_BUCKETS:
+            bounds.append(SPILL_BUCKETS)
+        partitions: List[List[Tuple[str, int, int]]] = []
+        for first, last in zip(bounds, bounds[1:]):
+            slices: List[Tuple[str, int, int]] = [
+                (filename, int(offsets[first]), int(offsets[last]))
+                for filename, offsets in self.spills
+                if offsets[last] > offsets[first]
+            ]
+            if slices:
+                partitions.append(slices)
+        return partitions
+
+    def build(self, jobs: int = 1) -> Dict[str, Any]:
+        """
+        Method: build(jobs)
+        Description: Bin and window all partitions in [jobs] processes,
+        write shards and index.json, remove spilled events
+        """
+        self._spill()
+        first_bin, last_bin = [ts // self.bin_seconds for ts in self.ts_range or (0, 0)]
+        tasks: List[Tuple[Any, ...]] = []
+        for slices in self._partitions(jobs):
+            tasks.append(
+                (
+                    slices,
+                    os.path.join(self.path, f"shard-{len(tasks):05d}"),
+                    self.bin_seconds,
+                    first_bin,
+                    last_bin - first_bin + 1,
+                    self.window,
+                    self.stride,
+                    self.horizon,
+                    self.skip_empty,
+                )
+            )
+        if jobs > 1 and len(tasks) > 1:
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                results = list(executor.map(build_partition, tasks))
+        else:
+            results = [build_partition(task) for task in tasks]
+        shutil.rmtree(self.spill_path, ignore_errors=True)
+
+        index: Dict[str, Any] = {
+            "features": FEATURES,
+            "bin_seconds": self.bin_seconds,
+            "window": self.window,
+            "stride": self.stride,
+            "horizon": self.horizon,
+            "ranks": RANKS,
+            "devices": [list(key) for key in self.devices],
+            "shards": [
+                {"name": os.path.basename(task[1]), "windows": windows}
+                for task, windows in zip(tasks, results)
+                if windows
+            ],
+        }
+        index["windows"] = sum(shard["windows"] for shard in index["shards"])
+        with open(os.path.join(self.path, "index.json"), "w") as file:
+            json.dump(index, file)
+        return index
+
+
+def _active_starts(bins: Any, n_starts: int, stride: int, span: int) -> Any:
+    """
+    Function: _active_starts(bins, n_starts, stride, span)
+    Description: Sorted indexes of window starts whose [span] bins (window and
+    horizon) hold one of the sorted [bins], without a per bin array
+    """
+    bins = np.unique(bins)
+    # start k covers bins k * stride .. k * stride + span - 1
+    first = -(-np.maximum(bins - span + 1, 0) // stride)
+    last = np.minimum(bins // stride, n_starts - 1)
+    valid = first <= last
+    first, last = first[valid], last[valid]
+    if not len(first):
+        return np.zeros(0, dtype=np.int64)
+    # both are non decreasing, merge overlapping [first, last] ranges
+    opens = np.ones(len(first), dtype=bool)
+    opens[1:] = first[1:] > last[:-1] + 1
+    closes = np.ones(len(first), dtype=bool)
+    closes[:-1] = opens[1:]
+    first, last = first[opens], last[closes]
+    lengths = last - first + 1
+    offsets = np.repeat(np.cumsum(lengths) - lengths - first, lengths)
+    return np.arange(int(lengths.sum()), dtype=np.int64) - offsets
+
+
+def build_partition(task: Tuple[Any, ...]) -> int:
+    """
+    Function: build_partition(task)
+    Description: Bin and window events of one partition, return number of
+    windows written. Bins start at [first_bin] of all inputs, so windows do
+    not depend on partitioning. Series are binned one by one in chunks of
+    CHUNK_STARTS window starts and written to memory mapped shard arrays, so
+    only the partition events and one chunk are held in memory. Module level
+    so it can run in a process pool.
+    """
+    slices, shard, bin_seconds, first_bin, n_bins = task[:5]
+    window, stride, horizon, skip_empty = task[5:]
+    events = np.concatenate(
+        [np.load(name, mmap_mode="r")[start:stop] for name, start, stop in slices]
+    )
+    if not len(events):
+        return 0
+    events = events[np.lexsort((events["ts"], events["series"]))]
+
+    # counters to per sample deltas; a decreasing counter has been reset
+    counter = events["feature"] == F_CORRERR
+    if counter.any():
+        samples = events[counter]
+        delta = np.diff(samples["value"], prepend=0.0)
+        first = np.ones(len(samples), dtype=bool)
+        first[1:] = samples["series"][1:] != samples["series"][:-1]
+        delta[first] = 0.0
+        reset = delta < 0
+        delta[reset] = samples["value"][reset]
+        events["value"][counter] = delta
+
+    bins = events["ts"] // bin_seconds - first_bin
+    span: int = window + horizon
+    n_starts: int = len(range(0, n_bins - span + 1, stride))
+    if not n_starts:
+        return 0
+    series = np.unique(events["series"])
+    # values are non negative: zero events change no bin and mark no activity
+    nonzero = events["value"] != 0
+    events, bins = events[nonzero], bins[nonzero]
+    bounds = np.append(np.searchsorted(events["series"], series), len(events))
+
+    def active(idx: int) -> Any:
+        if not skip_empty:
+            return np.arange(n_starts, dtype=np.int64)
+        return _active_starts(
+            bins[bounds[idx] : bounds[idx + 1]], n_starts, stride, span
+        )
+
+    total: int = sum(len(active(idx)) for idx in range(len(series)))
+    if not total:
+        return 0
+
+    os.makedirs(shard, exist_ok=True)
+    n_features: int = len(FEATURES)
+    open_memmap = np.lib.format.open_memmap
+    X = open_memmap(
+        os.path.join(shard, "X.npy"),
+        mode="w+",
+        dtype=np.float32,
+        shape=(total, window, n_features),
+    )
+    y = open_memmap(
+        os.path.join(shard, "y.npy"), mode="w+", dtype=np.float32, shape=(total,)
+    )
+    series_ids = open_memmap(
+        os.path.join(shard, "series.npy"), mode="w+", dtype=np.uint32, shape=(total,)
+    )
+    start_ts = open_memmap(
+        os.path.join(shard, "start.npy"), mode="w+", dtype=np.int64, shape=(total,)
+    )
+
+    pos: int = 0
+    for idx in range(len(series)):
+        series_bins = bins[bounds[idx] : bounds[idx + 1]]
+        series_events = events[bounds[idx] : bounds[idx + 1]]
+        indexes = active(idx)
+        if not len(indexes):
+            continue
+        blocks = np.flatnonzero(np.diff(indexes // CHUNK_STARTS)) + 1
+        for chunk in np.split(indexes, blocks):
+            starts = chunk * stride
+            low: int = int(starts[0])
+            length: int = int(starts[-1]) + span - low
+            first_event, end_event = np.searchsorted(series_bins, [low, low + length])
+            chunk_events = series_events[first_event:end_event]
+            linear = (series_bins[first_event:end_event] - low) * n_features
+            linear += chunk_events["feature"]
+
+            # counts are summed per bin, overflow flags are or-ed
+            overflow = chunk_events["feature"] == F_CORRERR_OVERFLOW
+            grid = np.bincount(
+                linear[~overflow],
+                weights=chunk_events["value"][~overflow],
+                minlength=length * n_features,
+            )
+            np.maximum.at(grid, linear[overflow], chunk_events["value"][overflow])
+            grid = grid.reshape(length, n_features).astype(np.float32)
+
+            offsets = starts - low
+            # label: CE errors in the horizon following the window
+            cumulative = np.zeros(length + 1, dtype=np.float64)
+            np.cumsum(grid[:, F_CE_ERRORS], out=cumulative[1:])
+            end: int = pos + len(chunk)
+            y[pos:end] = cumulative[offsets + span] - cumulative[offsets + window]
+            # windows: [length - window + 1, features, window]
+            windows = np.lib.stride_tricks.sliding_window_view(grid, window, axis=0)
+            X[pos:end] = windows[offsets].transpose(0, 2, 1)
+            series_ids[pos:end] = series[idx]
+            start_ts[pos:end] = (first_bin + starts) * bin_seconds
+            pos = end
+
+    for array in (X, y, series_ids, start_ts):
+        array.flush()
+    logger.debug(f"[TENSORS] {shard}: {total} windows of {len(series)} series")
+    return total
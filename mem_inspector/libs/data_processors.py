@@ -1,8 +1,110 @@
+import time
 from abc import ABC
-from typing import List
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Final, List, Optional, Tuple, Type
 
 from libs.metric_values import AbsMetricValues
+from libs.sinks import AbsSink, BatchBuffer, RowFormatter, StdoutSink
+
+EVICT_LRU: Final[str] = "lru"
+EVICT_FIFO: Final[str] = "fifo"
 
 class AbsDataProcessor(ABC):
     def write_metric(self, data: List[AbsMetricValues]) -> None:
         print(data)
+
+
+class CSVDataProcessor(AbsDataProcessor):
+    """
+    Class: CSVDataProcessor
+    Description: Format metrics with per dataclass RowFormatter, optionally drop
+    duplicates and write rows through a batching buffer to the output sink.
+    dedupe(values, unique_key) returns True when the row should be emitted.
+    """
+
+    def __init__(
+        self,
+        formatters: Dict[Type[Any], RowFormatter],
+        sink: Optional[AbsSink] = None,
+        dedupe: Optional[Callable[[Tuple[Any, ...], str], bool]] = None,
+        max_lines: int = 256,
+        max_delay: float = 1.0,
+    ) -> None:
+        self.formatters = formatters
+        self.dedupe = dedupe
+        self.buffer = BatchBuffer(sink or StdoutSink(), max_lines, max_delay)
+
+    def write_metric(self, metrics_list: List[AbsMetricValues]) -> None:
+        for data in metrics_list:
+            formatter: Optional[RowFormatter] = self.formatters.get(type(data.metrics))
+            if formatter is None:
+                continue
+            values: Tuple[Any, ...] = formatter.values(data)
+            if self.dedupe is None or self.dedupe(values, formatter.unique_key(data)):
+                self.buffer.append(formatter.format(data, values))
+
+    def flush(self) -> None:
+        self.buffer.flush()
+
+    def flush_if_due(self) -> None:
+        self.buffer.flush_if_due()
+
+    def close(self) -> None:
+        """Write buffered rows and close the sink, called on collector shutdown."""
+        self.buffer.flush()
+        self.buffer.sink.close()
+
+
+class DedupeFilter:
+    """
+    Class: DedupeFilter
+    Description: Drop rows whose values did not change since the last emitted row
+    with the same unique key. Only a hash of the value tuple is kept per key,
+    at most [capacity] keys are tracked (evicted in LRU or FIFO order).
+    With [heartbeat] > 0 unchanged rows are emitted again every heartbeat seconds.
+    """
+
+    def __init__(
+        self, capacity: int = 4096, heartbeat: float = 0.0, policy: str = EVICT_LRU
+    ) -> None:
+        if policy not in (EVICT_LRU, EVICT_FIFO):
+            raise ValueError(f"Unsupported eviction policy {policy!r}")
+        self.capacity = capacity
+        self.heartbeat = heartbeat
+        self.policy = policy
+        # unique_key -> (hash of values, monotonic time of last emit)
+        self.entries: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+
+    def process(self, values: Tuple[Any, ...], unique_key: str) -> bool:
+        """
+        Method: process(values, unique_key)
+        Description: Return True when the row should be emitted
+        """
+        fingerprint: int = hash(values)
+        now: float = time.monotonic()
+        entry: Optional[Tuple[int, float]] = self.entries.get(unique_key)
+        if entry is not None:
+            if self.policy == EVICT_LRU:
+                self.entries.move_to_end(unique_key)
+            if entry[0] == fingerprint and (
+                not self.heartbeat or now - entry[1] < self.heartbeat
+            ):
+                self.hits += 1
+                return False
+        self.entries[unique_key] = (fingerprint, now)
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+        self.misses += 1
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
@@ -2,10 +2,14 @@
 HWMON kernelspace reader was based on unified sysfs interface
 https://www.kernel.org/doc/Documentation/hwmon/sysfs-interface
 """
+import asyncio
 import os
+import threading
 from dataclasses import dataclass
-from typing import List
+from typing import Any, Dict, List, Optional, Tuple
 
+from libs.instrumentation import IOStats, instrumentation
+from libs.io_executor import IOExecutor, io_executor
 from libs.logger import pmon_logger as logger
 
 
@@ -19,10 +23,113 @@ class HWMONTempDevice:
     label: str
 
 
+@dataclass
+class HWMONSensor:
+    socket: int
+    sensor: int
+    max: float
+    crit: float
+    label: str
+    fd: int
+
+
 class HWMON:
 
     PCI_DEVS: str = "/sys/class/hwmon"
     PCI_PATH: str = PCI_DEVS + "/hwmon%d/temp%d_%s"
+    MAX_SENSORS: int = 64
+
+    stats: IOStats = instrumentation.io_stats("hwmon")
+
+    def __init__(self, executor: Optional[IOExecutor] = None) -> None:
+        self.executor: IOExecutor = executor or io_executor
+        # discovered sensors per hwmon device, static values are read once
+        # and temp*_input files are kept open
+        self.sensors: Dict[int, List[HWMONSensor]] = {}
+        self.token: Any = None
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _read_static(path: str, default: str) -> str:
+        try:
+            with open(path, "r") as f:
+                HWMON.stats.opens += 1
+                return f.readline().strip()
+        except OSError:
+            return default
+
+    @staticmethod
+    def _read_millidegrees(path: str) -> float:
+        """Return temperature of [path] in degrees, 0 when missing, empty or invalid"""
+        try:
+            return int(HWMON._read_static(path, "0")) / 1000
+        except ValueError:
+            return 0.0
+
+    def discover(self, socket: int) -> List[HWMONSensor]:
+        """
+        Method: discover(socket)
+        Description: Find temperature sensors of hwmon[socket] device, cache their
+        label/max/crit values and open temp*_input files
+        """
+        sensors: List[HWMONSensor] = []
+        for sensor in range(1, HWMON.MAX_SENSORS):
+            path: str = HWMON.PCI_PATH % (socket, sensor, "%s")
+            try:
+                fd: int = os.open(path % "input", os.O_RDONLY)
+            except OSError:
+                continue
+            HWMON.stats.opens += 1
+            sensors.append(
+                HWMONSensor(
+                    socket=socket,
+                    sensor=sensor,
+                    max=HWMON._read_millidegrees(path % "max"),
+                    crit=HWMON._read_millidegrees(path % "crit"),
+                    label=HWMON._read_static(path % "label", ""),
+                    fd=fd,
+                )
+            )
+        logger.debug(
+            "[DISCOVER] hwmon%d has %d temperature sensors", socket, len(sensors)
+        )
+        return sensors
+
+    def invalidate(self) -> None:
+        """
+        Method: invalidate()
+        Description: Close sensor files and forget discovered sensors
+        """
+        with self.lock:
+            for sensors in self.sensors.values():
+                for sensor in sensors:
+                    try:
+                        os.close(sensor.fd)
+                    except OSError:
+                        pass
+            self.sensors = {}
+            self.token = None
+
+    def get_sockets(self) -> List[int]:
+        """
+        Method: get_sockets()
+        Description: Return numbers of all hwmon devices, cached sensors are
+        dropped when hwmon directory has changed
+        """
+        try:
+            token: Tuple[int, Tuple[str, ...]] = (
+                os.stat(HWMON.PCI_DEVS).st_mtime_ns,
+                tuple(sorted(os.listdir(HWMON.PCI_DEVS))),
+            )
+        except OSError:
+            logger.error(
+                f"Problem with using Linux kernel, system directory {HWMON.PCI_DEVS} desn't exist."
+            )
+            return []
+        if token != self.token:
+            self.invalidate()
+            self.token = token
+        return [int(socket_path[len("hwmon") :]) for socket_path in token[1]]
 
     def get_temperatures(self) -> List[HWMONTempDevice]:
         """
@@ -30,46 +137,57 @@ class HWMON:
         Description: Return all Sockets
         """
         devlist: List[HWMONTempDevice] = []
-        if not os.path.isdir(HWMON.PCI_DEVS):
-            logger.error(
-                f"Problem with using Linux kernel, system directory {HWMON.PCI_DEVS} desn't exist."
+        for socket in self.get_sockets():
+            devlist += self.get_socket_temperatures(socket)
+        return devlist
+
+    async def aget_temperatures(self) -> List[HWMONTempDevice]:
+        """
+        Method: await aget_temperatures()
+        Description: get_temperatures() with hwmon devices read concurrently in I/O executor
+        """
+        sockets: List[int] = await self.executor.run(self.get_sockets)
+        results: List[List[HWMONTempDevice]] = await asyncio.gather(
+            *(
+                self.executor.run(self.get_socket_temperatures, socket)
+                for socket in sockets
             )
-            return devlist
-        for socket_path in sorted(os.listdir(HWMON.PCI_DEVS)):
-            socket = int(socket_path[len("hwmon") :])
-            for sensor in range(1, 64):
-                if not os.path.isfile(HWMON.PCI_PATH % (socket, sensor, "input")):
-                    continue
-
-                with open(HWMON.PCI_PATH % (socket, sensor, "input"), "r") as f:
-                    input = int(f.readline()) / 1000
-                with open(HWMON.PCI_PATH % (socket, sensor, "max"), "r") as f:
-                    max = int(f.readline()) / 1000
-                with open(HWMON.PCI_PATH % (socket, sensor, "crit"), "r") as f:
-                    crit = int(f.readline()) / 1000
-                with open(HWMON.PCI_PATH % (socket, sensor, "label"), "r") as f:
-                    label = str(f.readline().strip())
-
-                logger.debug(
-                    "[GET] socket_path : %s , socket: %d, sensor: %d, input: %d, max: %d, crit: %d, label: '%s'"
-                    % (
-                        HWMON.PCI_PATH % (socket, sensor, "*"),
-                        socket,
-                        sensor,
-                        input,
-                        max,
-                        crit,
-                        label,
-                    )
+        )
+        return [temp for result in results for temp in result]
+
+    def get_socket_temperatures(self, socket: int) -> List[HWMONTempDevice]:
+        """
+        Method: get_socket_temperatures(socket)
+        Description: Return all temperature sensors of hwmon[socket] device,
+        one pread per sensor once sensors are discovered
+        """
+        sensors: Optional[List[HWMONSensor]] = self.sensors.get(socket)
+        if sensors is None:
+            with self.lock:
+                sensors = self.sensors.get(socket)
+                if sensors is None:
+                    sensors = self.sensors[socket] = self.discover(socket)
+
+        devlist: List[HWMONTempDevice] = []
+        HWMON.stats.reads += len(sensors)
+        for sensor in sensors:
+            try:
+                input = int(os.pread(sensor.fd, 32, 0)) / 1000
+            except (OSError, ValueError) as err:
+                logger.error(
+                    f"[GET] Unable to read hwmon{socket} temp{sensor.sensor}: {err}"
                 )
-                devlist.append(
-                    HWMONTempDevice(
-                        socket=socket,
-                        sensor=sensor,
-                        input=input,
-                        max=max,
-                        crit=crit,
-                        label=label,
-                    )
+                # rediscover on the next call
+                self.token = None
+                continue
+            devlist.append(
+                HWMONTempDevice(
+                    socket=socket,
+                    sensor=sensor.sensor,
+                    input=input,
+                    max=sensor.max,
+                    crit=sensor.crit,
+                    label=sensor.label,
                 )
+            )
         return devlist
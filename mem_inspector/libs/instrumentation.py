@@ -0,0 +1,196 @@
+"""
+Collector self instrumentation
+Per-command latency and schedule lateness histograms, per-driver register
+and sysfs I/O counters and output volume, exported as self metrics and
+JSON snapshots.
+
+Counters are plain attribute increments on the hot paths; updates from
+concurrent executor threads are not locked, so under contention a count
+may be lost, which is acceptable for overhead budgeting.
+"""
+import json
+import os
+import time
+from bisect import bisect_left
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Final, List, Tuple
+
+# histogram bucket upper bounds in seconds, the last bucket is unbounded
+LATENCY_BOUNDS: Final[Tuple[float, ...]] = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+@dataclass
+class IOStats:
+    """Register / file I/O counters of one driver or output."""
+
+    reads: int = 0
+    writes: int = 0
+    block_reads: int = 0
+    block_writes: int = 0
+    bytes_read: int = 0
+    bytes_written: int = 0
+    msr_reads: int = 0
+    msr_writes: int = 0
+    # sysfs/dev files opened and helper processes (setpci, lspci) spawned
+    opens: int = 0
+
+
+class Histogram:
+    """
+    Class: Histogram
+    Description: Fixed bucket histogram of durations in seconds
+    """
+
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self) -> None:
+        self.counts: List[int] = [0] * (len(LATENCY_BOUNDS) + 1)
+        self.count: int = 0
+        self.total: float = 0.0
+        self.max: float = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(LATENCY_BOUNDS, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        """
+        Method: quantile(q)
+        Description: Return upper bound of the bucket holding the [q] quantile
+        capped at the observed maximum, so a quantile never exceeds max
+        """
+        if not self.count:
+            return 0.0
+        rank: float = q * self.count
+        seen: int = 0
+        for idx, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                if idx < len(LATENCY_BOUNDS):
+                    return min(LATENCY_BOUNDS[idx], self.max)
+                return self.max
+        return self.max
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "max": self.max,
+            "buckets": dict(zip([*map(str, LATENCY_BOUNDS), "+Inf"], self.counts)),
+        }
+
+
+class CommandStats:
+    """
+    Class: CommandStats
+    Description: Execution statistics of one scheduled command
+    """
+
+    __slots__ = ("runs", "failures", "latency", "lateness")
+
+    def __init__(self) -> None:
+        self.runs: int = 0
+        self.failures: int = 0
+        self.latency = Histogram()
+        self.lateness = Histogram()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "runs": self.runs,
+            "failures": self.failures,
+            "latency": self.latency.snapshot(),
+            "lateness": self.lateness.snapshot(),
+        }
+
+
+class Instrumentation:
+    """
+    Class: Instrumentation
+    Description: Registry of command and I/O statistics of the process
+    """
+
+    def __init__(self) -> None:
+        self.started: float = time.time()
+        self.commands: Dict[str, CommandStats] = {}
+        self.io: Dict[str, IOStats] = {}
+
+    def command(self, name: str) -> CommandStats:
+        stats: CommandStats = self.commands.get(name)  # type: ignore
+        if stats is None:
+            stats = self.commands[name] = CommandStats()
+        return stats
+
+    def io_stats(self, name: str) -> IOStats:
+        """
+        Method: io_stats(name)
+        Description: Return (shared) I/O counters of a driver or output [name]
+        """
+        stats: IOStats = self.io.get(name)  # type: ignore
+        if stats is None:
+            stats = self.io[name] = IOStats()
+        return stats
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "timestamp": time.time(),
+            "uptime": time.time() - self.started,
+            "commands": {
+                name: stats.snapshot() for name, stats in self.commands.items()
+            },
+            "io": {name: asdict(stats) for name, stats in self.io.items()},
+        }
+
+    def rows(self) -> List[Tuple[str, str, float]]:
+        """
+        Method: rows()
+        Description: Return (name, metric, value) rows of the current statistics
+        """
+        rows: List[Tuple[str, str, float]] = []
+        for name, stats in self.commands.items():
+            rows += [
+                (name, "runs", stats.runs),
+                (name, "failures", stats.failures),
+                (name, "latency_p50", stats.latency.quantile(0.5)),
+                (name, "latency_p99", stats.latency.quantile(0.99)),
+                (name, "latency_max", stats.latency.max),
+                (name, "lateness_p99", stats.lateness.quantile(0.99)),
+                (name, "lateness_max", stats.lateness.max),
+            ]
+        for name, io in self.io.items():
+            rows += [
+                (name, metric, value) for metric, value in asdict(io).items() if value
+            ]
+        return rows
+
+    def write_snapshot(self, path: str) -> None:
+        """
+        Method: write_snapshot(path)
+        Description: Atomically replace [path] with JSON snapshot
+        """
+        tmp: str = path + ".tmp"
+        with open(tmp, "w") as file:
+            json.dump(self.snapshot(), file)
+        os.replace(tmp, path)
+
+
+instrumentation = Instrumentation()
@@ -0,0 +1,106 @@
+"""
+Bounded thread pool for blocking register and sysfs I/O
+Lets asyncio native commands await driver calls without stalling the event loop
+"""
+import asyncio
+import functools
+import glob
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Set, TypeVar
+
+from libs.logger import pmon_logger as logger
+
+T = TypeVar("T")
+
+CPU_PACKAGE_PATH: str = "/sys/devices/system/cpu/cpu*/topology/physical_package_id"
+
+
+def socket_cpus() -> Dict[int, Set[int]]:
+    """
+    Function: socket_cpus()
+    Description: Return socket ID to set of logical CPUs mapping
+    """
+    sockets: Dict[int, Set[int]] = {}
+    for path in glob.glob(CPU_PACKAGE_PATH):
+        cpu: int = int(path.split("/")[-3][len("cpu") :])
+        with open(path, "r") as file:
+            sockets.setdefault(int(file.read()), set()).add(cpu)
+    return sockets
+
+
+def all_cpus() -> List[int]:
+    """
+    Function: all_cpus()
+    Description: Return sorted logical CPUs of all sockets
+    """
+    cpus: List[int] = sorted(
+        cpu for members in socket_cpus().values() for cpu in members
+    )
+    return cpus or list(range(os.cpu_count() or 1))
+
+
+def _pin_worker(cpus: Set[int]) -> None:
+    try:
+        # pid 0 means the calling thread on Linux
+        os.sched_setaffinity(0, cpus)
+    except (AttributeError, OSError) as err:
+        logger.error(f"Unable to pin I/O worker to {cpus=}: {err}")
+
+
+class IOExecutor:
+    """
+    Class: IOExecutor
+    Description: Dispatch blocking calls to a bounded thread pool.
+    With per_socket enabled calls tagged with a socket ID are executed by
+    a single worker pinned to the CPUs of that socket.
+    """
+
+    def __init__(self, max_workers: int = 4, per_socket: bool = False) -> None:
+        self.max_workers = max_workers
+        self.per_socket = per_socket
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.socket_executors: Dict[int, ThreadPoolExecutor] = {}
+        self.cpus: Optional[Dict[int, Set[int]]] = None
+
+    def _get_executor(self, socket: Optional[int]) -> ThreadPoolExecutor:
+        if self.per_socket and socket is not None and socket >= 0:
+            executor: Optional[ThreadPoolExecutor] = self.socket_executors.get(socket)
+            if executor is None:
+                if self.cpus is None:
+                    self.cpus = socket_cpus()
+                cpus: Set[int] = self.cpus.get(socket, set())
+                executor = self.socket_executors[socket] = ThreadPoolExecutor(
+                    max_workers=1,
+                    thread_name_prefix=f"io-socket{socket}",
+                    initializer=_pin_worker if cpus else None,
+                    initargs=(cpus,) if cpus else (),
+                )
+            return executor
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="io"
+            )
+        return self.executor
+
+    async def run(
+        self, func: Callable[..., T], *args: Any, socket: Optional[int] = None
+    ) -> T:
+        """
+        Method: run(func, *args, socket)
+        Description: Await func(*args) executed in the worker pool
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._get_executor(socket), functools.partial(func, *args)
+        )
+
+    def shutdown(self) -> None:
+        for executor in [self.executor, *self.socket_executors.values()]:
+            if executor is not None:
+                executor.shutdown(wait=True)
+        self.executor = None
+        self.socket_executors = {}
+
+
+io_executor = IOExecutor()
@@ -1,6 +1,8 @@
+import time
 from typing import Callable, Dict, List
 
 from libs.data_processors import AbsDataProcessor
+from libs.instrumentation import CommandStats, instrumentation
 from libs.logger import pmon_logger as logger
 
 
@@ -15,7 +17,7 @@ class NativeCallMap:
 
     @staticmethod
     async def cmd(name: str, command: List[str], out: AbsDataProcessor) -> None:
-        logger.debug(f"Calling function {name} {command=}")
+        logger.debug("Calling function %s command=%s", name, command)
         if (
             command
             and command[0] in NativeCallMap.map
@@ -27,7 +29,16 @@ class NativeCallMap:
             # i.e
             #   [commands.pmoncntr]
             #       cmd = pmoncntr "0000:24:0A.0" 1
-            await NativeCallMap.map[command[0]](out, command[1:])  # type: ignore
+            stats: CommandStats = instrumentation.command(name)
+            stats.runs += 1
+            start: float = time.perf_counter()
+            try:
+                await NativeCallMap.map[command[0]](out, command[1:])  # type: ignore
+            except Exception:
+                stats.failures += 1
+                raise
+            finally:
+                stats.latency.observe(time.perf_counter() - start)
         else:
             logger.error(f"Calling function {name}:{command} failed")
 
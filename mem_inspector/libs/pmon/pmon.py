@@ -4,10 +4,15 @@ Set of tools for PCICFG and MSR manipulation
 - support ESXi VSI
 """
 import re
+import threading
 from abc import ABC
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from enum import Enum
-from typing import Any, Final, List, Optional, Tuple, Type, Union
+from functools import lru_cache
+from typing import Any, Dict, Final, Iterable, List, Optional, Tuple, Type, Union
+
+from libs.io_executor import IOExecutor, all_cpus, io_executor
 
 PMON_PATH: Final[str] = "path"
 PMON_SEG: Final[str] = "seg"
@@ -162,6 +167,103 @@ class Events(Enum):
     WR_CAS_RANK6 = EventItem("00010000", 0xBE)
     WR_CAS_RANK7 = EventItem("00010000", 0xBF)
 
+    def ctrl_word(
+        self,
+        enable: bool = True,
+        reset: bool = True,
+        thresh: int = 0,
+        invert: bool = False,
+        edge_det: bool = False,
+        ov_en: bool = False,
+    ) -> int:
+        """
+        Method: Events.Type.ctrl_word(enable, reset, thresh, invert, edge_det, ov_en)
+        Description: Return *_PMON_CTLx control word of event, taken from the table
+        precomputed at import. Combinations not in the table are computed once and kept.
+        """
+        key: Tuple["Events", bool, bool, int, bool, bool, bool] = (
+            self,
+            enable,
+            reset,
+            thresh,
+            invert,
+            edge_det,
+            ov_en,
+        )
+        word: Optional[int] = EVENT_CTRL_WORDS.get(key)
+        if word is None:
+            word = EVENT_CTRL_WORDS[key] = build_ctrl_word(*key)
+        return word
+
+
+def build_ctrl_word(
+    event: Events,
+    enable: bool = True,
+    reset: bool = True,
+    thresh: int = 0,
+    invert: bool = False,
+    edge_det: bool = False,
+    ov_en: bool = False,
+) -> int:
+    """
+    Function: build_ctrl_word(event, enable, reset, thresh, invert, edge_det, ov_en)
+    Description: Compose *_PMON_CTLx control word, see PMONRegister.set_event for field layout
+    """
+    return (
+        (thresh & 0xFF) << 24
+        | int(invert) << 23
+        | int(enable) << 22
+        | int(ov_en) << 20
+        | int(edge_det) << 18
+        | int(reset) << 17
+        | int(event.value.umask, 2) << 8
+        | event.value.ev_sel & 0xFF
+    )
+
+
+# Control words of all events with every enable/reset/invert/edge_det/ov_en flag combination
+EVENT_CTRL_WORDS: Dict[Tuple[Events, bool, bool, int, bool, bool, bool], int] = {
+    (event, enable, reset, 0, invert, edge_det, ov_en): build_ctrl_word(
+        event, enable, reset, 0, invert, edge_det, ov_en
+    )
+    for event in Events
+    for enable in (True, False)
+    for reset in (True, False)
+    for invert in (False, True)
+    for edge_det in (False, True)
+    for ov_en in (False, True)
+}
+
+
+RegisterRequest = Union[Registers, Tuple[Registers, Size]]
+
+
+def coalesce_registers(
+    registers: List[RegisterRequest], max_gap: int = 64
+) -> List[Tuple[int, int, List[Tuple[Registers, Size]]]]:
+    """
+    Function: coalesce_registers(registers, max_gap)
+    Description: Group requested registers into minimal list of (start, length, registers)
+    ranges. Registers separated by no more than [max_gap] bytes share one range.
+    """
+    items: List[Tuple[Registers, Size]] = sorted(
+        (
+            (item, Size.DWORD) if isinstance(item, Registers) else item
+            for item in registers
+        ),
+        key=lambda item: item[0].value,
+    )
+    ranges: List[Tuple[int, int, List[Tuple[Registers, Size]]]] = []
+    for register, size in items:
+        end: int = register.value + size.value
+        if ranges and register.value <= ranges[-1][0] + ranges[-1][1] + max_gap:
+            start, length, members = ranges[-1]
+            members.append((register, size))
+            ranges[-1] = (start, max(length, end - start), members)
+        else:
+            ranges.append((register.value, size.value, [(register, size)]))
+    return ranges
+
 
 class PMONDriver(ABC):
     """
@@ -179,6 +281,16 @@ class PMONDriver(ABC):
     def set(self, node: Tuple[str, str, str, str], addr: Registers, value: int) -> None:
         return None
 
+    def get_block(
+        self, node: Tuple[str, str, str, str], addr: int, length: int
+    ) -> Optional[bytes]:
+        return bytes(length)
+
+    def set_block(
+        self, node: Tuple[str, str, str, str], addr: int, data: bytes
+    ) -> None:
+        return None
+
     @staticmethod
     def read_msr(cpu: int, addr: int) -> Optional[int]:
         return None
@@ -187,6 +299,39 @@ class PMONDriver(ABC):
     def write_msr(cpu: int, addr: int, value: int) -> Optional[int]:
         return None
 
+    @classmethod
+    def read_msr_all(
+        cls,
+        addr: Union[int, List[int]],
+        cpus: Optional[Iterable[int]] = None,
+        workers: int = 0,
+    ) -> Dict[int, Any]:
+        """
+        Class method: read_msr_all(addr, cpus, workers)
+        Description: Read MSR [addr] on every logical CPU of [cpus] (all CPUs by
+        default). Returns cpu -> value, or cpu -> {addr: value} when [addr] is
+        a list. With [workers] > 1 the CPUs are split among a thread pool,
+        each MSR read is an IPI to the target CPU during which the GIL is released.
+        """
+        addrs: List[int] = [addr] if isinstance(addr, int) else list(addr)
+        cpulist: List[int] = all_cpus() if cpus is None else list(cpus)
+
+        def read(chunk: List[int]) -> List[Tuple[int, List[Optional[int]]]]:
+            return [(cpu, [cls.read_msr(cpu, msr) for msr in addrs]) for cpu in chunk]
+
+        rows: List[Tuple[int, List[Optional[int]]]]
+        if workers > 1 and len(cpulist) > 1:
+            chunks: List[List[int]] = [cpulist[idx::workers] for idx in range(workers)]
+            values: Dict[int, List[Optional[int]]] = {}
+            for part in _msr_pool(workers).map(read, chunks):
+                values.update(part)
+            rows = [(cpu, values[cpu]) for cpu in cpulist]
+        else:
+            rows = read(cpulist)
+        if isinstance(addr, int):
+            return {cpu: row[0] for cpu, row in rows}
+        return {cpu: dict(zip(addrs, row)) for cpu, row in rows}
+
     @staticmethod
     def scan(
         vendorids: Union[int, List[int]] = [], deviceids: Union[int, List[int]] = []
@@ -197,6 +342,260 @@ class PMONDriver(ABC):
     def get_cpuinfo() -> CPUInfo:
         return CPUInfo()
 
+    @staticmethod
+    def invalidate(node: Optional[Tuple[str, str, str, str]] = None) -> None:
+        return None
+
+    @staticmethod
+    def fingerprint() -> Any:
+        return None
+
+
+msr_pools: Dict[int, ThreadPoolExecutor] = {}
+msr_pool_lock: threading.Lock = threading.Lock()
+
+
+def _msr_pool(workers: int) -> ThreadPoolExecutor:
+    """
+    Function: _msr_pool(workers)
+    Description: Return shared thread pool of [workers] threads for MSR fan-out
+    """
+    with msr_pool_lock:
+        pool: Optional[ThreadPoolExecutor] = msr_pools.get(workers)
+        if pool is None:
+            pool = msr_pools[workers] = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="msr"
+            )
+    return pool
+
+
+@lru_cache(maxsize=None)
+def parse_node(search: str) -> Tuple[str, str, str, str]:
+    """
+    Function: parse_node(search)
+    Description: Split "seg:bus:dev.func" node name into SBDF tuple, results are cached
+    """
+    return tuple(re.split(r":|\.", search))  # type: ignore
+
+
+class PMONRegister:
+    """
+    Class: PMONRegister
+    Description: Reusable handle of a single register on given node, returned by PMON[addr].reg()
+    """
+
+    __slots__ = ("parent", "register", "node", "driver")
+
+    def __init__(self, parent: "PMONUnit", register: Registers) -> None:
+        self.parent = parent
+        self.register = register
+        self.node: Tuple[str, str, str, str] = parent.node
+        self.driver: PMONDriver = parent.driver
+
+    def info(
+        self,
+    ) -> Tuple[Optional[str], Tuple[str, str, str, str], Registers]:
+        """
+        Method: PMON[addr].reg(register).info()
+        Description: Prints debug info
+        """
+        print(
+            "Driver: %s, Device : %s, Register : %s"
+            % (self.driver.name, self.node, self.register)
+        )
+        return (self.driver.name, self.node, self.register)
+
+    def set_event(
+        self,
+        event: Events,
+        enable: bool = True,
+        reset: bool = True,
+        thresh: int = 0,
+        invert: bool = False,
+        edge_det: bool = False,
+        ov_en: bool = False,
+    ) -> Optional[int]:
+        """
+        Method: PMON[addr].reg(register).set_event(Events.Type)
+        Description: Set CTRL registry and set event i.e counters
+
+        According to Table 1-6. Baseline *_PMON_CTLx Register – Field Definitions
+        [bits]        [field]
+        63:32         rsv             Only relevant to unit’s that use 64b control registers
+        31:24         thresh
+          23          invert
+          22          en
+          21          rsv
+          20          ov_en
+          19          rsv
+          18          edge_det
+          17          rst
+          16          rsv
+        15:8          umask
+         7:0          ev_sel
+
+        ev_sel = 0x04         According to 2.3.5 iMC Box Events Ordered By Code
+        umask  = 0x0F
+        rsv    = 0
+        en     = 1            "Local Counter Enable" set to 1
+        rst    = 1            "When set to 1, the corresponding counter will be cleared to 0"
+        thresh = 0            When non zero, counter increments only if event count >= thresh
+        invert = 0            When set to 1, threshold comparison is inverted (<)
+        edge_det = 0          When set to 1, counter increments on 0 to 1 threshold transition
+        ov_en  = 0            When set to 1, counter overflow is signaled
+
+        Control words are precomputed, see Events.ctrl_word
+        """
+        self.set(event.ctrl_word(enable, reset, thresh, invert, edge_det, ov_en))
+        return None
+
+    def get(self, size: Size = Size.DWORD) -> int:
+        """
+        Method: PMON[addr].reg(register).get(size)
+        Description: Returns value from given register on node addr.
+        """
+        return self.driver.get(self.node, self.register, size)  # type: ignore
+
+    def set(self, value: int) -> None:
+        """
+        Method: PMON[addr].reg(register).set(value)
+        Description: Set value of given register on node addr.
+        """
+        self.driver.set(self.node, self.register, value)
+        return None
+
+    async def aget(self, size: Size = Size.DWORD, socket: Optional[int] = None) -> int:
+        """
+        Method: await PMON[addr].reg(register).aget(size, socket)
+        Description: get() executed in PMON I/O executor
+        """
+        return await self.parent.parent.executor.run(self.get, size, socket=socket)
+
+    async def aset(self, value: int, socket: Optional[int] = None) -> None:
+        """
+        Method: await PMON[addr].reg(register).aset(value, socket)
+        Description: set() executed in PMON I/O executor
+        """
+        return await self.parent.parent.executor.run(self.set, value, socket=socket)
+
+    async def aset_event(
+        self,
+        event: Events,
+        enable: bool = True,
+        reset: bool = True,
+        thresh: int = 0,
+        invert: bool = False,
+        edge_det: bool = False,
+        ov_en: bool = False,
+        socket: Optional[int] = None,
+    ) -> None:
+        """
+        Method: await PMON[addr].reg(register).aset_event(Events.Type, enable, reset,
+            thresh, invert, edge_det, ov_en, socket)
+        Description: set_event() executed in PMON I/O executor
+        """
+        await self.aset(
+            event.ctrl_word(enable, reset, thresh, invert, edge_det, ov_en),
+            socket=socket,
+        )
+
+
+class PMONUnit:
+    """
+    Class: PMONUnit
+    Description: Reusable handle of a PCI device function, returned by PMON[addr].
+    Register handles are created once and memoized per unit.
+    """
+
+    __slots__ = ("parent", "node", "driver", "registers")
+
+    def __init__(self, parent: "PMON", node: Tuple[str, str, str, str]) -> None:
+        self.parent = parent
+        self.node = node
+        self.driver: PMONDriver = parent.handle
+        self.registers: Dict[Registers, PMONRegister] = {}
+
+    def reg(self, register: Registers) -> PMONRegister:
+        """
+        Method: PMON[addr].reg( register )
+        Description: Functions retuns an Register handle for set/get operations
+        """
+        handle: Optional[PMONRegister] = self.registers.get(register)
+        if handle is None:
+            handle = self.registers[register] = PMONRegister(self, register)
+        return handle
+
+    def read_registers(
+        self, registers: List[RegisterRequest], max_gap: int = 64
+    ) -> Dict[Registers, int]:
+        """
+        Method: PMON[addr].read_registers([register | (register, size), ...])
+        Description: Read given registers using one driver block read per
+        contiguous range. Returns register to value mapping, -1 on failed read.
+        """
+        values: Dict[Registers, int] = {}
+        for start, length, members in coalesce_registers(registers, max_gap):
+            data: Optional[bytes] = self.driver.get_block(self.node, start, length)
+            for register, size in members:
+                if data is None or len(data) < length:
+                    values[register] = -1
+                    continue
+                offset: int = register.value - start
+                values[register] = int.from_bytes(
+                    data[offset : offset + size.value], "little"
+                )
+        return values
+
+    def write_registers(self, values: Dict[Registers, int]) -> None:
+        """
+        Method: PMON[addr].write_registers({register: value, ...})
+        Description: Write given DWORD registers using one driver block write
+        per range of adjacent registers, i.e. all counter control registers
+        of a unit are programmed with a single write.
+        """
+        for start, length, members in coalesce_registers(list(values), max_gap=0):
+            data = bytearray(length)
+            for register, size in members:
+                offset: int = register.value - start
+                data[offset : offset + size.value] = values[register].to_bytes(
+                    size.value, "little"
+                )
+            self.driver.set_block(self.node, start, bytes(data))
+
+    async def aread_registers(
+        self,
+        registers: List[RegisterRequest],
+        max_gap: int = 64,
+        socket: Optional[int] = None,
+    ) -> Dict[Registers, int]:
+        """
+        Method: await PMON[addr].aread_registers(registers, max_gap, socket)
+        Description: read_registers() executed in PMON I/O executor
+        """
+        return await self.parent.executor.run(
+            self.read_registers, registers, max_gap, socket=socket
+        )
+
+    def block(
+        self,
+        start_reg: Registers,
+        end_reg: Registers,
+        size: Size = Size.DWORD,
+    ) -> Dict[Registers, int]:
+        """
+        Method: PMON[addr].block(start_reg, end_reg, size)
+        Description: Read all known registers from [start_reg] up to [end_reg]
+        (inclusive) with a single block read.
+        """
+        return self.read_registers(
+            [
+                (register, size)
+                for register in Registers
+                if start_reg.value <= register.value <= end_reg.value
+            ],
+            max_gap=end_reg.value - start_reg.value,
+        )
+
 
 class PMON:
     """
@@ -207,130 +606,24 @@ class PMON:
 
     driver: Type[PMONDriver] = PMONDriver
 
-    def __init__(self, driver: Type[PMONDriver]) -> None:
+    def __init__(
+        self, driver: Type[PMONDriver], executor: Optional[IOExecutor] = None
+    ) -> None:
         self.driver = driver
+        self.handle: PMONDriver = driver()
+        self.units: Dict[str, PMONUnit] = {}
+        self.executor: IOExecutor = executor or io_executor
 
-    def __getitem__(self, search: str) -> Any:
+    def __getitem__(self, search: str) -> PMONUnit:
         """
         Method: index [] methd
-        Desription: The magic method __getitem__ is used for accessing node methods on given address
-        """
-
-        class Unit:
-            """
-            Class: PMON
-            Description: PMON class is producing factories objects based on supported PCI device functions
-            within given driver strategy.
-            """
-
-            parent: PMON
-            node: Tuple[str, str, str, str]
-
-            def __init__(self, parent: PMON, node: Tuple[str, str, str, str]) -> None:
-                self.parent = parent
-                self.node = node
-
-            def reg(self, register: Registers) -> Any:
-                """
-                Method: PMON[addr].reg( register )
-                Description: Functions retuns an Register class for set/get operations
-                """
-
-                class Register(self.parent.driver):  # type: ignore
-                    parent: Unit
-                    register: Registers
-
-                    def __init__(self, parent: Unit, register: Registers) -> None:
-                        self.parent = parent
-                        self.register = register
-
-                    def info(
-                        self,
-                    ) -> Tuple[Optional[str], Tuple[str, str, str, str], Registers]:
-                        """
-                        Method: PMON[addr].reg(register).info()
-                        Description: Prints debug info
-                        """
-                        print(
-                            "Driver: %s, Device : %s, Register : %s"
-                            % (super().name, self.parent.node, self.register)
-                        )
-                        return (super().name, self.parent.node, self.register)
-
-                    def set_event(
-                        self,
-                        event: Events,
-                        enable: bool = True,
-                        reset: bool = True,
-                    ) -> Optional[int]:
-                        """
-                        Method: PMON[addr].reg(register).set_event(Events.Type)
-                        Description: Set CTRL registry and set event i.e counters
-
-                        According to Table 1-6. Baseline *_PMON_CTLx Register – Field Definitions
-                        [bits]        [field]
-                        63:32         rsv             Only relevant to unit’s that use 64b control registers
-                        31:24         thresh
-                          23          invert
-                          22          en
-                          21          rsv
-                          20          ov_en
-                          19          rsv
-                          18          edge_det
-                          17          rst
-                          16          rsv
-                        15:8          umask
-                         7:0          ev_sel
-
-                        ev_sel = 0x04         According to 2.3.5 iMC Box Events Ordered By Code
-                        umask  = 0x0F
-                        rsv    = 0
-                        en     = 1            "Local Counter Enable" set to 1
-                        rst    = 1            "When set to 1, the corresponding counter will be cleared to 0"
-                        """
-                        thresh: str = "00000000"
-                        invert: str = "0"
-                        en: str = "1" if enable else "0"
-                        rsv: str = "0"
-                        ov_en: str = "0"
-                        edge_det: str = "0"
-                        rst: str = "1" if reset else "0"
-
-                        pmu_str: str = (
-                            thresh
-                            + invert
-                            + en
-                            + rsv
-                            + ov_en
-                            + rsv
-                            + edge_det
-                            + rst
-                            + rsv
-                            + str(event.value.umask)
-                            + str("{0:0>8b}".format(event.value.ev_sel))
-                        )
-                        pmu_data: int = int(pmu_str, 2)
-                        self.set(pmu_data)
-                        return None
-
-                    def get(self, size: Size = Size.DWORD) -> int:
-                        """
-                        Method: PMON[addr].reg(register).get(size)
-                        Description: Returns value from given register on node addr.
-                        """
-                        return super().get(self.parent.node, self.register, size)  # type: ignore
-
-                    def set(self, value: int) -> None:
-                        """
-                        Method: PMON[addr].reg(register).set(value)
-                        Description: Set value of given register on node addr.
-                        """
-                        super().set(self.parent.node, self.register, value)
-                        return None
-
-                return Register(self, register)
-
-        return Unit(self, tuple(re.split(r":|\.", search)))  # type: ignore
+        Desription: The magic method __getitem__ is used for accessing node methods on given address.
+        Unit handles are memoized per node name.
+        """
+        unit: Optional[PMONUnit] = self.units.get(search)
+        if unit is None:
+            unit = self.units[search] = PMONUnit(self, parse_node(search))
+        return unit
 
     def read_msr(self, cpu: int, addr: int) -> Optional[int]:
         """
@@ -346,6 +639,19 @@ class PMON:
         """
         return self.driver.write_msr(cpu, addr, value)
 
+    def read_msr_all(
+        self,
+        addr: Union[int, List[int]],
+        cpus: Optional[Iterable[int]] = None,
+        workers: int = 0,
+    ) -> Dict[int, Any]:
+        """
+        Method: read_msr_all(addr, cpus, workers)
+        Description: Read MSR [addr] (or list of MSRs) on all logical [cpus] at once,
+        optionally split among [workers] threads
+        """
+        return self.driver.read_msr_all(addr, cpus, workers)
+
     def scan(
         self,
         vendorids: Union[int, List[int]] = [],
@@ -358,6 +664,17 @@ class PMON:
         """
         return self.driver.scan(vendorids, deviceids)
 
+    async def ascan(
+        self,
+        vendorids: Union[int, List[int]] = [],
+        deviceids: Union[int, List[int]] = [],
+    ) -> List[PMONDevice]:
+        """
+        Method: await ascan(vendorids, deviceids)
+        Description: scan() executed in PMON I/O executor
+        """
+        return await self.executor.run(self.driver.scan, vendorids, deviceids)
+
     def get_cpuinfo(self) -> CPUInfo:
         """
         Method: getCPUInfo()
@@ -365,3 +682,19 @@ class PMON:
         vendorID, model, family
         """
         return self.driver.get_cpuinfo()
+
+    def invalidate(self, node: Optional[str] = None) -> None:
+        """
+        Method: invalidate(node)
+        Description: Drop driver resources (i.e pooled file descriptors) held for [node],
+        or for all devices when [node] is None. Call it after device removal or rescan.
+        """
+        self.driver.invalidate(None if node is None else parse_node(node))
+
+    def fingerprint(self) -> Any:
+        """
+        Method: fingerprint()
+        Description: Cheap token describing the current set of PCI devices,
+        a changed value means that scan() results have to be refreshed
+        """
+        return self.driver.fingerprint()
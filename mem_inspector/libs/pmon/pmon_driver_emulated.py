@@ -1,8 +1,13 @@
+import atexit
 import os
 import re
-from typing import Any, Dict, Final, List, Optional, Tuple, Union
+from dataclasses import replace
+from typing import Any, Dict, Final, List, Optional, Set, Tuple, Union
 
+from libs.instrumentation import IOStats, instrumentation
 from libs.pmon.pmon import CPUInfo, PMONDevice, PMONDriver, Registers, Size
+from libs.pmon.pmon_fd_pool import FDPool
+from libs.pmon.pmon_snapshot import ids_of, is_snapshot, load_snapshot, parse_lspci
 from libs.logger import pmon_logger as logger
 from libs.vme_constants import (
     PCI_AMD_VENDORID,
@@ -17,19 +22,50 @@ class PMONEmulatedDriver(PMONDriver):
     """
     Class: PMONEmulatedDriver(based on PMONDriver)
     Description: This is a replacement for old legacy lspci/setpci strategy based of output of lspci -D -xxx
+    Live mode (no dump_file) reads the same config space in process through
+    pooled sysfs descriptors, setpci/lspci are spawned only when [setpci] is set
     """
 
+    PCI_DEVS: str = "/sys/bus/pci/devices"
+    PCI_PATH: str = PCI_DEVS + "/%s/config"
     FILE_CPUINFO: Final[str] = "/proc/cpuinfo"
     LABEL_VENDORID: Final[str] = "vendor_id"
     LABEL_MODEL: Final[str] = "model"
     LABEL_CPU_FAMILY: Final[str] = "cpu family"
 
     name: Final[str] = "Emulated"
+    stats: IOStats = instrumentation.io_stats("pmon.Emulated")
 
     dump_file: str = ""
     dump_data: Dict[str, Any] = {}
+    # devices of the dump in dump order and vendorID -> devices index for scan()
+    dump_devices: List[PMONDevice] = []
+    dump_index: Dict[int, List[PMONDevice]] = {}
+    # mmap backing dump_data of a binary snapshot
+    dump_map: Any = None
     cpuinfo_file: str = FILE_CPUINFO
 
+    # explicit fallback to one setpci/lspci process per access in live mode
+    setpci: bool = False
+    # config space descriptors per device path, shared pool of LinuxKernel driver
+    config_pool: FDPool = FDPool(
+        lambda path: PMONEmulatedDriver.PCI_PATH % path.lower(),  # type: ignore
+        stats,
+    )
+
+    @staticmethod
+    def invalidate(node: Optional[Tuple[str, str, str, str]] = None) -> None:
+        """
+        Static method: invalidate(node)
+        Description: Close pooled config space descriptors of [node],
+        all pooled descriptors are closed when [node] is None (i.e device removal/rescan).
+        Descriptors in use by other threads are closed when their I/O completes.
+        """
+        PMONEmulatedDriver.config_pool.invalidate(
+            None if node is None else "%s:%s:%s.%s" % node
+        )
+        return None
+
     def get(
         self, node: Tuple[str, str, str, str], addr: Registers, size: Size = Size.DWORD
     ) -> int:
@@ -37,6 +73,7 @@ class PMONEmulatedDriver(PMONDriver):
         Method: get(node, addr, size)
         Description: Function read [size] data from [addr] of [node]
         """
+        PMONEmulatedDriver.stats.reads += 1
         if PMONEmulatedDriver.dump_file:
             if not PMONEmulatedDriver.dump_data:
                 PMONEmulatedDriver.readdump()
@@ -48,47 +85,67 @@ class PMONEmulatedDriver(PMONDriver):
                 "little",
             )
             logger.debug(
-                f"[GET] pmon[{path}].reg({hex(addr.value)}).get({size.value}) = {value}"
+                "[GET] pmon[%s].reg(%#x).get(%d) = %d", path, addr.value, size.value, value
             )
             return value
-        else:
-            unit: str
-            if size.value == 1:
-                unit = "b"
-            elif size.value == 2:
-                unit = "w"
-            else:
-                unit = "l"
-            cmd: str = "setpci -s %s %s.%s" % (
-                str("%s:%s:%s.%s" % node),
-                hex(addr.value),
-                unit,
+        if PMONEmulatedDriver.setpci:
+            return PMONEmulatedDriver._setpci_get(node, addr, size)
+
+        path = str("%s:%s:%s.%s" % node)
+        try:
+            # Size.COUNTER is 48bit value, low dword and high word are read at once
+            data: Optional[bytes] = PMONEmulatedDriver.config_pool.pread(
+                path, size.value, addr.value
             )
-            logger.debug("[GET] %s" % cmd)
-            stream = os.popen(cmd)
-            output: str = stream.read()
-            stream.close()
-            if size.value == 6:
-                cmd = "setpci -s %s %s.%s" % (
-                    str("%s:%s:%s.%s" % node),
-                    hex(addr.value + 4),
-                    "w",
-                )
-                logger.debug("[GET] %s" % cmd)
-                stream = os.popen(cmd)
-                hi: str = stream.read()
-                stream.close()
-                lo: str = output
-                sum = (int(hi, 16) << 32) + int(lo, 16)
-                return sum
-            else:
-                return int(output, 16)
+        except OSError as err:
+            logger.error(f"[GET] Unable to read {path}, {addr=}: {err}")
+            PMONEmulatedDriver.invalidate(node)
+            return -1
+        if data is None:
+            return -1
+        if len(data) < size.value:
+            # config space beyond the first 64 bytes is readable only by root
+            logger.error(f"[GET] Short read of {path}, {addr=}, {len(data)=}")
+            return -1
+        return int.from_bytes(data, "little")
+
+    def get_block(
+        self, node: Tuple[str, str, str, str], addr: int, length: int
+    ) -> Optional[bytes]:
+        """
+        Method: get_block(node, addr, length)
+        Description: Function read [length] bytes starting at [addr] of [node] at once
+        """
+        PMONEmulatedDriver.stats.block_reads += 1
+        PMONEmulatedDriver.stats.bytes_read += length
+        path = str("%s:%s:%s.%s" % node)
+        if PMONEmulatedDriver.dump_file:
+            if not PMONEmulatedDriver.dump_data:
+                PMONEmulatedDriver.readdump()
+            if path not in PMONEmulatedDriver.dump_data:
+                logger.error(f"[GET_BLOCK] Device {path} not found in dump")
+                return None
+            logger.debug("[GET_BLOCK] pmon[%s].block(%#x, %d)", path, addr, length)
+            return bytes(PMONEmulatedDriver.dump_data[path][addr : addr + length])
+
+        if PMONEmulatedDriver.setpci:
+            return PMONEmulatedDriver._setpci_get_block(path, addr, length)
+
+        try:
+            return PMONEmulatedDriver.config_pool.pread(path, length, addr)
+        except OSError as err:
+            logger.error(
+                f"[GET_BLOCK] Unable to read {path}, {addr=}, {length=}: {err}"
+            )
+            PMONEmulatedDriver.invalidate(node)
+            return None
 
     def set(self, node: Tuple[str, str, str, str], addr: Registers, value: int) -> None:
         """
         Method: set(node, addr, value)
         Description: Function writes [value] to [addr] of [node]
         """
+        PMONEmulatedDriver.stats.writes += 1
         if PMONEmulatedDriver.dump_file:
             if not PMONEmulatedDriver.dump_data:
                 PMONEmulatedDriver.readdump()
@@ -97,50 +154,221 @@ class PMONEmulatedDriver(PMONDriver):
             PMONEmulatedDriver.dump_data[path][addr.value : addr.value + 4] = (
                 value
             ).to_bytes(size, byteorder="little")
-            logger.debug(f"[SET] pmon[{path}].reg({hex(addr.value)}).set({value})")
+            logger.debug("[SET] pmon[%s].reg(%#x).set(%d)", path, addr.value, value)
+
+        elif PMONEmulatedDriver.setpci:
+            PMONEmulatedDriver._setpci_set(node, addr, value)
+        else:
+            path = str("%s:%s:%s.%s" % node)
+            try:
+                PMONEmulatedDriver.config_pool.pwrite(
+                    path, (value).to_bytes(4, byteorder="little"), addr.value
+                )
+            except OSError as err:
+                logger.error(f"[SET] Unable to write {path}, {addr=}, {value=}: {err}")
+                PMONEmulatedDriver.invalidate(node)
+        return None
+
+    def set_block(
+        self, node: Tuple[str, str, str, str], addr: int, data: bytes
+    ) -> None:
+        """
+        Method: set_block(node, addr, data)
+        Description: Function writes [data] starting at [addr] of [node] at once
+        """
+        PMONEmulatedDriver.stats.block_writes += 1
+        path = str("%s:%s:%s.%s" % node)
+        if PMONEmulatedDriver.dump_file:
+            if not PMONEmulatedDriver.dump_data:
+                PMONEmulatedDriver.readdump()
+            PMONEmulatedDriver.dump_data[path][addr : addr + len(data)] = data
+            logger.debug("[SET_BLOCK] pmon[%s].block(%#x, %d)", path, addr, len(data))
 
+        elif PMONEmulatedDriver.setpci:
+            PMONEmulatedDriver._setpci_set_block(path, addr, data)
         else:
-            cmd: str = "setpci -s %s %s.%s=%s" % (
+            try:
+                PMONEmulatedDriver.config_pool.pwrite(path, data, addr)
+            except OSError as err:
+                logger.error(
+                    f"[SET_BLOCK] Unable to write {path}, {addr=}, {len(data)=}: {err}"
+                )
+                PMONEmulatedDriver.invalidate(node)
+        return None
+
+    @staticmethod
+    def _setpci_get(
+        node: Tuple[str, str, str, str], addr: Registers, size: Size = Size.DWORD
+    ) -> int:
+        """
+        Static method: _setpci_get(node, addr, size)
+        Description: Read [size] data from [addr] of [node] by setpci
+        """
+        unit: str
+        if size.value == 1:
+            unit = "b"
+        elif size.value == 2:
+            unit = "w"
+        else:
+            unit = "l"
+        cmd: str = "setpci -s %s %s.%s" % (
+            str("%s:%s:%s.%s" % node),
+            hex(addr.value),
+            unit,
+        )
+        logger.debug("[GET] %s", cmd)
+        PMONEmulatedDriver.stats.opens += 1
+        stream = os.popen(cmd)
+        output: str = stream.read()
+        stream.close()
+        if size.value == 6:
+            cmd = "setpci -s %s %s.%s" % (
                 str("%s:%s:%s.%s" % node),
-                hex(addr.value),
-                "l",
-                hex(value),
+                hex(addr.value + 4),
+                "w",
             )
-            logger.debug("[SET] %s" % cmd)
+            logger.debug("[GET] %s", cmd)
+            PMONEmulatedDriver.stats.opens += 1
             stream = os.popen(cmd)
+            hi: str = stream.read()
             stream.close()
+            lo: str = output
+            sum = (int(hi, 16) << 32) + int(lo, 16)
+            return sum
+        else:
+            return int(output, 16)
+
+    @staticmethod
+    def _setpci_get_block(path: str, addr: int, length: int) -> Optional[bytes]:
+        """
+        Static method: _setpci_get_block(path, addr, length)
+        Description: Read [length] bytes starting at [addr] of [path] by one setpci
+        """
+        # setpci accepts many registers per call, fetch whole block as dwords
+        aligned: int = addr & ~0x3
+        cmd: str = "setpci -s %s %s" % (
+            path,
+            " ".join(
+                "%s.l" % hex(offset)
+                for offset in range(aligned, addr + length, Size.DWORD.value)
+            ),
+        )
+        logger.debug("[GET_BLOCK] %s", cmd)
+        PMONEmulatedDriver.stats.opens += 1
+        stream = os.popen(cmd)
+        output: List[str] = stream.read().split()
+        stream.close()
+        data = bytearray()
+        try:
+            for dword in output:
+                data += int(dword, 16).to_bytes(Size.DWORD.value, "little")
+        except ValueError:
+            logger.error(f"[GET_BLOCK] Unexpected setpci output for {path}")
+            return None
+        return bytes(data[addr - aligned : addr - aligned + length])
+
+    @staticmethod
+    def _setpci_set(
+        node: Tuple[str, str, str, str], addr: Registers, value: int
+    ) -> None:
+        """
+        Static method: _setpci_set(node, addr, value)
+        Description: Write [value] to [addr] of [node] by setpci
+        """
+        cmd: str = "setpci -s %s %s.%s=%s" % (
+            str("%s:%s:%s.%s" % node),
+            hex(addr.value),
+            "l",
+            hex(value),
+        )
+        logger.debug("[SET] %s", cmd)
+        PMONEmulatedDriver.stats.opens += 1
+        stream = os.popen(cmd)
+        stream.close()
+        return None
 
+    @staticmethod
+    def _setpci_set_block(path: str, addr: int, data: bytes) -> None:
+        """
+        Static method: _setpci_set_block(path, addr, data)
+        Description: Write DWORD aligned [data] to [addr] of [path] by one setpci
+        """
+        cmd: str = "setpci -s %s %s" % (
+            path,
+            " ".join(
+                "%s.l=%s"
+                % (
+                    hex(addr + offset),
+                    hex(int.from_bytes(data[offset : offset + 4], "little")),
+                )
+                for offset in range(0, len(data), Size.DWORD.value)
+            ),
+        )
+        logger.debug("[SET_BLOCK] %s", cmd)
+        PMONEmulatedDriver.stats.opens += 1
+        stream = os.popen(cmd)
+        stream.close()
         return None
 
     @staticmethod
     def readdump() -> None:
+        """
+        Static method: readdump()
+        Description: Load dump_file, either "lspci -xxxx -D" text output or
+        binary snapshot (see pmon_snapshot), the latter is memory mapped and
+        dump_data holds zero-copy views of its config space blocks
+        """
         if not os.path.isfile(PMONEmulatedDriver.dump_file):
             logger.error(f"File {PMONEmulatedDriver.dump_file} desn't exist")
             return None
-        file = open(PMONEmulatedDriver.dump_file, "rb")
-        PMONEmulatedDriver.dump_data = {}
-        dataload = bytearray()
-        devname = ""
-        for line in file:
-            words = line.split()
-            if not len(words):
-                continue
-            if len(words[0]) == 12:
-                if devname:
-                    PMONEmulatedDriver.dump_data[devname] = dataload
-                devname = words[0].decode("utf-8")
-                dataload = bytearray()
-                continue
-            for word in words[1:]:
-                byte = int(word, 16)
-                dataload.append(byte)
-        file.close()
-        PMONEmulatedDriver.dump_data[devname] = dataload
+        PMONEmulatedDriver.stats.opens += 1
+        if is_snapshot(PMONEmulatedDriver.dump_file):
+            (
+                PMONEmulatedDriver.dump_data,
+                PMONEmulatedDriver.dump_devices,
+                PMONEmulatedDriver.dump_map,
+            ) = load_snapshot(PMONEmulatedDriver.dump_file)
+        else:
+            with open(PMONEmulatedDriver.dump_file, "rb") as file:
+                PMONEmulatedDriver.dump_data = parse_lspci(file)
+            PMONEmulatedDriver.dump_devices = []
+        PMONEmulatedDriver.index_dump()
         logger.debug(
-            f"[READDUMP] {PMONEmulatedDriver.dump_file=} has {len(PMONEmulatedDriver.dump_data.keys())} records"
+            "[READDUMP] %s has %d records",
+            PMONEmulatedDriver.dump_file,
+            len(PMONEmulatedDriver.dump_data),
         )
         return None
 
+    @staticmethod
+    def index_dump() -> None:
+        """
+        Static method: index_dump()
+        Description: Build vendorID index of dump devices, devices are derived
+        from dump_data config space headers when not known yet
+        """
+        if not PMONEmulatedDriver.dump_devices:
+            devices: List[PMONDevice] = []
+            for node, config in PMONEmulatedDriver.dump_data.items():
+                sbdf: List[str] = re.split(r":|\.", node)
+                vid, did = ids_of(config)
+                devices.append(
+                    PMONDevice(
+                        path=node,
+                        seg=int(sbdf[0], 16),
+                        bus=int(sbdf[1], 16),
+                        dev=int(sbdf[2], 16),
+                        func=int(sbdf[3], 16),
+                        did=did,
+                        vid=vid,
+                    )
+                )
+            PMONEmulatedDriver.dump_devices = devices
+        index: Dict[int, List[PMONDevice]] = {}
+        for device in PMONEmulatedDriver.dump_devices:
+            index.setdefault(device.vid, []).append(device)
+        PMONEmulatedDriver.dump_index = index
+
     @staticmethod
     def read_msr(cpu: int, addr: int) -> Optional[int]:
         """
@@ -167,6 +395,54 @@ class PMONEmulatedDriver(PMONDriver):
         """
         deviceids = [deviceids] if isinstance(deviceids, int) else deviceids
         vendorids = [vendorids] if isinstance(vendorids, int) else vendorids
+        if PMONEmulatedDriver.dump_file:
+            return PMONEmulatedDriver.scan_dump(vendorids, deviceids)
+        if PMONEmulatedDriver.setpci:
+            return PMONEmulatedDriver._lspci_scan(vendorids, deviceids)
+
+        devlist: List[PMONDevice] = []
+        try:
+            names: List[str] = sorted(os.listdir(PMONEmulatedDriver.PCI_DEVS))
+        except OSError as err:
+            logger.error(f"Unable to list {PMONEmulatedDriver.PCI_DEVS}: {err}")
+            return devlist
+        for name in names:
+            # vendorID and deviceID are the first dword of the config space
+            try:
+                with open(PMONEmulatedDriver.PCI_PATH % name, "rb") as file:
+                    header: bytes = file.read(4)
+            except OSError as err:
+                logger.error(f"[SCAN] Unable to read {name}: {err}")
+                continue
+            PMONEmulatedDriver.stats.opens += 1
+            vid, did = ids_of(header)
+            if (vendorids and vid not in vendorids) or (
+                deviceids and did not in deviceids
+            ):
+                continue
+            sbdf: List[str] = re.split(r":|\.", name)
+            devlist.append(
+                PMONDevice(
+                    path=name,
+                    seg=int(sbdf[0], 16),
+                    bus=int(sbdf[1], 16),
+                    dev=int(sbdf[2], 16),
+                    func=int(sbdf[3], 16),
+                    did=did,
+                    vid=vid,
+                )
+            )
+        logger.debug(
+            "[SCAN] %d devices in %s", len(devlist), PMONEmulatedDriver.PCI_DEVS
+        )
+        return devlist
+
+    @staticmethod
+    def _lspci_scan(vendorids: List[int], deviceids: List[int]) -> List[PMONDevice]:
+        """
+        Static method: _lspci_scan(vendorids, deviceids)
+        Description: Scan pci devices by lspci and filter vendorIDs and deviceIDs
+        """
         devid: str = ".. .."
         venid: str = ".. .."
         if vendorids:
@@ -185,14 +461,8 @@ class PMONEmulatedDriver(PMONDriver):
             devid = "(" + "|".join(list) + ")"
 
         filter: str = 'egrep -i "^00: %s %s" -B 1' % (venid, devid)
-        cmd: str = (
-            "cat %s" % (PMONEmulatedDriver.dump_file)
-            if PMONEmulatedDriver.dump_file
-            else "lspci -xxxx -D"
-        )
-
-        cmd = f"{cmd} | {filter}"
-        logger.debug("[SCAN] %s" % cmd)
+        cmd: str = f"lspci -xxxx -D | {filter}"
+        logger.debug("[SCAN] %s", cmd)
 
         stream = os.popen(cmd)
         output = stream.read()
@@ -220,6 +490,52 @@ class PMONEmulatedDriver(PMONDriver):
                 devlist.append(pmon_device)
         return devlist
 
+    @staticmethod
+    def scan_dump(vendorids: List[int], deviceids: List[int]) -> List[PMONDevice]:
+        """
+        Static method: scan_dump(vendorids, deviceids)
+        Description: Filter dump devices by vendorIDs and deviceIDs using the
+        vendorID index, devices are returned in dump order
+        """
+        if not PMONEmulatedDriver.dump_data:
+            PMONEmulatedDriver.readdump()
+        if not PMONEmulatedDriver.dump_index:
+            PMONEmulatedDriver.index_dump()
+        devices: List[PMONDevice]
+        if vendorids:
+            devices = []
+            for vid in vendorids:
+                devices += PMONEmulatedDriver.dump_index.get(vid, [])
+            if len(vendorids) > 1:
+                order: Dict[str, int] = {
+                    device.path: idx
+                    for idx, device in enumerate(PMONEmulatedDriver.dump_devices)
+                }
+                devices.sort(key=lambda device: order[device.path])
+        else:
+            devices = PMONEmulatedDriver.dump_devices
+        if deviceids:
+            wanted: Set[int] = set(deviceids)
+            devices = [device for device in devices if device.did in wanted]
+        logger.debug(
+            "[SCAN] %d devices in %s", len(devices), PMONEmulatedDriver.dump_file
+        )
+        return [replace(device) for device in devices]
+
+    @staticmethod
+    def fingerprint() -> Any:
+        """
+        Static method: fingerprint()
+        Description: Return (path, mtime, size) of the dump file, None in live mode
+        """
+        if not PMONEmulatedDriver.dump_file:
+            return None
+        try:
+            stat = os.stat(PMONEmulatedDriver.dump_file)
+        except OSError:
+            return None
+        return (PMONEmulatedDriver.dump_file, stat.st_mtime_ns, stat.st_size)
+
     @staticmethod
     def get_cpuinfo() -> CPUInfo:
         """
@@ -251,3 +567,6 @@ class PMONEmulatedDriver(PMONDriver):
                 if key == PMONEmulatedDriver.LABEL_CPU_FAMILY:
                     cpuinfo.family = int(value)
         return cpuinfo
+
+
+atexit.register(PMONEmulatedDriver.invalidate)
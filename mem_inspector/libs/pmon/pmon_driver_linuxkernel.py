@@ -1,8 +1,13 @@
+import atexit
+import errno
 import os
 import re
-from typing import List, Optional, Tuple, Union
+from functools import lru_cache
+from typing import Any, List, Optional, Tuple, Union
 
+from libs.instrumentation import IOStats, instrumentation
 from libs.pmon.pmon import CPUInfo, PMONDevice, PMONDriver, Registers, Size
+from libs.pmon.pmon_fd_pool import FDPool
 from libs.logger import pmon_logger as logger
 from libs.vme_constants import (
     PCI_AMD_VENDORID,
@@ -28,20 +33,58 @@ class PMONLinuxKernelDriver(PMONDriver):
     LABEL_CPU_FAMILY: str = "cpu family"
 
     name: str = "LinuxKernel"
+    stats: IOStats = instrumentation.io_stats("pmon.LinuxKernel")
 
     cpuinfo_file: str = FILE_CPUINFO
 
+    fd_pool: bool = True
+    # config space descriptors per (seg, bus, dev, func), MSR descriptors per CPU
+    config_pool: FDPool = FDPool(
+        lambda sbdf: PMONLinuxKernelDriver.PCI_PATH % (*sbdf, "config"),  # type: ignore
+        stats,
+    )
+    msr_pool: FDPool = FDPool(lambda cpu: PMONLinuxKernelDriver.MSR_PATH % cpu, stats)
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def _parse_sbdf(node: Tuple[str, str, str, str]) -> Tuple[int, int, int, int]:
+        return (int(node[0], 16), int(node[1], 16), int(node[2], 16), int(node[3], 16))
+
     @staticmethod
     def _build_pci_path(node: Tuple[str, str, str, str], file: str) -> str:
-        seg: int = int(node[0], 16)
-        bus: int = int(node[1], 16)
-        dev: int = int(node[2], 16)
-        func: int = int(node[3], 16)
-        logger.debug(
-            "[_build_pci_path] "
-            + PMONLinuxKernelDriver.PCI_PATH % (seg, bus, dev, func, file)
+        path: str = PMONLinuxKernelDriver.PCI_PATH % (
+            *PMONLinuxKernelDriver._parse_sbdf(node),
+            file,
         )
-        return PMONLinuxKernelDriver.PCI_PATH % (seg, bus, dev, func, file)
+        logger.debug("[_build_pci_path] %s", path)
+        return path
+
+    @staticmethod
+    def invalidate_msr(cpu: Optional[int] = None) -> None:
+        """
+        Static method: invalidate_msr(cpu)
+        Description: Close pooled MSR descriptors of [cpu],
+        all pooled MSR descriptors are closed when [cpu] is None (i.e CPU hotplug)
+        """
+        PMONLinuxKernelDriver.msr_pool.invalidate(cpu)
+        return None
+
+    @staticmethod
+    def invalidate(node: Optional[Tuple[str, str, str, str]] = None) -> None:
+        """
+        Static method: invalidate(node)
+        Description: Close pooled config space descriptors of [node],
+        all pooled descriptors are closed when [node] is None (i.e device removal/rescan).
+        Descriptors in use by other threads are closed when their I/O completes.
+        """
+        if node is None:
+            PMONLinuxKernelDriver.invalidate_msr()
+            PMONLinuxKernelDriver.config_pool.invalidate()
+        else:
+            PMONLinuxKernelDriver.config_pool.invalidate(
+                PMONLinuxKernelDriver._parse_sbdf(node)
+            )
+        return None
 
     def get(
         self, node: Tuple[str, str, str, str], addr: Registers, size: Size = Size.DWORD
@@ -50,6 +93,114 @@ class PMONLinuxKernelDriver(PMONDriver):
         Method: get(node, addr, size)
         Description: Function read [size] data from [addr] of [node]
         """
+        if not PMONLinuxKernelDriver.fd_pool:
+            return self._get_unpooled(node, addr, size)
+
+        PMONLinuxKernelDriver.stats.reads += 1
+        try:
+            # Size.COUNTER is 48bit value, low dword and high word are read at once
+            data: Optional[bytes] = PMONLinuxKernelDriver.config_pool.pread(
+                PMONLinuxKernelDriver._parse_sbdf(node), size.value, addr.value
+            )
+        except OSError as err:
+            logger.error(f"[GET] Unable to read {node=}, {addr=}: {err}")
+            PMONLinuxKernelDriver.invalidate(node)
+            return -1
+        if data is None:
+            return -1
+        if len(data) < size.value:
+            # config space beyond the first 64 bytes is readable only by root
+            logger.error(f"[GET] Short read of {node=}, {addr=}, {len(data)=}")
+            return -1
+        return int.from_bytes(data, "little")
+
+    def get_block(
+        self, node: Tuple[str, str, str, str], addr: int, length: int
+    ) -> Optional[bytes]:
+        """
+        Method: get_block(node, addr, length)
+        Description: Function read [length] bytes starting at [addr] of [node] at once
+        """
+        PMONLinuxKernelDriver.stats.block_reads += 1
+        PMONLinuxKernelDriver.stats.bytes_read += length
+        if not PMONLinuxKernelDriver.fd_pool:
+            path: str = PMONLinuxKernelDriver._build_pci_path(node, "config")
+            if not os.path.isfile(path):
+                logger.error(f"Problem with using Linux kernel, file {path} desn't exist.")
+                return None
+            PMONLinuxKernelDriver.stats.opens += 1
+            with open(path, "rb") as file:
+                file.seek(addr)
+                return file.read(length)
+
+        try:
+            return PMONLinuxKernelDriver.config_pool.pread(
+                PMONLinuxKernelDriver._parse_sbdf(node), length, addr
+            )
+        except OSError as err:
+            logger.error(f"[GET_BLOCK] Unable to read {node=}, {addr=}, {length=}: {err}")
+            PMONLinuxKernelDriver.invalidate(node)
+            return None
+
+    def set(self, node: Tuple[str, str, str, str], addr: Registers, value: int) -> None:
+        """
+        Method: set(node, addr, value)
+        Description: Function writes [value] to [addr] of [node]
+        """
+        if not PMONLinuxKernelDriver.fd_pool:
+            return self._set_unpooled(node, addr, value)
+
+        PMONLinuxKernelDriver.stats.writes += 1
+        try:
+            PMONLinuxKernelDriver.config_pool.pwrite(
+                PMONLinuxKernelDriver._parse_sbdf(node),
+                (value).to_bytes(4, byteorder="little"),
+                addr.value,
+            )
+        except OSError as err:
+            logger.error(f"[SET] Unable to write {node=}, {addr=}, {value=}: {err}")
+            PMONLinuxKernelDriver.invalidate(node)
+        return None
+
+    def set_block(
+        self, node: Tuple[str, str, str, str], addr: int, data: bytes
+    ) -> None:
+        """
+        Method: set_block(node, addr, data)
+        Description: Function writes [data] starting at [addr] of [node] at once,
+        the kernel splits it into aligned DWORD config space writes
+        """
+        PMONLinuxKernelDriver.stats.block_writes += 1
+        if not PMONLinuxKernelDriver.fd_pool:
+            path: str = PMONLinuxKernelDriver._build_pci_path(node, "config")
+            if not os.path.isfile(path):
+                logger.error(f"Problem with using Linux kernel, file {path} desn't exist.")
+                return None
+            PMONLinuxKernelDriver.stats.opens += 1
+            configspace = os.open(path, os.O_WRONLY)
+            os.pwrite(configspace, data, addr)
+            os.close(configspace)
+            return None
+
+        try:
+            PMONLinuxKernelDriver.config_pool.pwrite(
+                PMONLinuxKernelDriver._parse_sbdf(node), data, addr
+            )
+        except OSError as err:
+            logger.error(
+                f"[SET_BLOCK] Unable to write {node=}, {addr=}, {len(data)=}: {err}"
+            )
+            PMONLinuxKernelDriver.invalidate(node)
+        return None
+
+    def _get_unpooled(
+        self, node: Tuple[str, str, str, str], addr: Registers, size: Size = Size.DWORD
+    ) -> int:
+        """
+        Method: _get_unpooled(node, addr, size)
+        Description: Function read [size] data from [addr] of [node],
+        config file is opened and closed on every call
+        """
         if not os.path.isdir(PMONLinuxKernelDriver.PCI_DEVS) or not os.path.isfile(
             PMONLinuxKernelDriver._build_pci_path(node, "config")
         ):
@@ -58,6 +209,8 @@ class PMONLinuxKernelDriver(PMONDriver):
             )
             return -1
 
+        PMONLinuxKernelDriver.stats.reads += 1
+        PMONLinuxKernelDriver.stats.opens += 1
         configspace = os.open(
             PMONLinuxKernelDriver._build_pci_path(node, "config"), os.O_RDONLY
         )
@@ -74,10 +227,13 @@ class PMONLinuxKernelDriver(PMONDriver):
         os.close(configspace)
         return value
 
-    def set(self, node: Tuple[str, str, str, str], addr: Registers, value: int) -> None:
+    def _set_unpooled(
+        self, node: Tuple[str, str, str, str], addr: Registers, value: int
+    ) -> None:
         """
-        Method: set(node, addr, value)
-        Description: Function writes [value] to [addr] of [node]
+        Method: _set_unpooled(node, addr, value)
+        Description: Function writes [value] to [addr] of [node],
+        config file is opened and closed on every call
         """
         if not os.path.isdir(PMONLinuxKernelDriver.PCI_DEVS) or not os.path.isfile(
             PMONLinuxKernelDriver._build_pci_path(node, "config")
@@ -87,6 +243,8 @@ class PMONLinuxKernelDriver(PMONDriver):
             )
             return None
 
+        PMONLinuxKernelDriver.stats.writes += 1
+        PMONLinuxKernelDriver.stats.opens += 1
         configspace = os.open(
             PMONLinuxKernelDriver._build_pci_path(node, "config"), os.O_WRONLY
         )
@@ -101,11 +259,61 @@ class PMONLinuxKernelDriver(PMONDriver):
         Static method: read_msr(cpu, addr)
         Description: Read data from an MSR [addr] from a given logical [cpu].
         """
+        if not PMONLinuxKernelDriver.fd_pool:
+            return PMONLinuxKernelDriver._read_msr_unpooled(cpu, addr)
+
+        PMONLinuxKernelDriver.stats.msr_reads += 1
+        try:
+            data: Optional[bytes] = PMONLinuxKernelDriver.msr_pool.pread(cpu, 8, addr)
+        except OSError as err:
+            # EIO is a #GP on the target CPU, i.e. MSR not implemented
+            if err.errno == errno.EIO:
+                logger.debug("[READ_MSR] MSR %#x not readable on cpu %d", addr, cpu)
+            else:
+                logger.error(f"[READ_MSR] Unable to read {cpu=}, {addr=}: {err}")
+                PMONLinuxKernelDriver.invalidate_msr(cpu)
+            return -1
+        if data is None:
+            return -1
+        return int.from_bytes(data, "little")
+
+    @staticmethod
+    def write_msr(cpu: int, addr: int, value: int) -> Optional[int]:
+        """
+        Static method: write_msr(cpu, addr, value)
+        Description: Write [value] data to an MSR [addr] on given logical [cpu].
+        """
+        if not PMONLinuxKernelDriver.fd_pool:
+            return PMONLinuxKernelDriver._write_msr_unpooled(cpu, addr, value)
+
+        PMONLinuxKernelDriver.stats.msr_writes += 1
+        try:
+            written: Optional[int] = PMONLinuxKernelDriver.msr_pool.pwrite(
+                cpu, (value).to_bytes(8, byteorder="little"), addr
+            )
+        except OSError as err:
+            logger.error(
+                f"[WRITE_MSR] Unable to write {cpu=}, {addr=}, {value=}: {err}"
+            )
+            if err.errno != errno.EIO:
+                PMONLinuxKernelDriver.invalidate_msr(cpu)
+            return -1
+        return -1 if written is None else None
+
+    @staticmethod
+    def _read_msr_unpooled(cpu: int, addr: int) -> Optional[int]:
+        """
+        Static method: _read_msr_unpooled(cpu, addr)
+        Description: Read data from an MSR [addr] from a given logical [cpu],
+        msr file is opened and closed on every call
+        """
         if not os.path.exists(PMONLinuxKernelDriver.MSR_PATH % cpu):
             print(
                 f"Problem with using Linux kernel, system file {PMONLinuxKernelDriver.MSR_PATH % cpu} desn't exist."
             )
             return -1
+        PMONLinuxKernelDriver.stats.msr_reads += 1
+        PMONLinuxKernelDriver.stats.opens += 1
         msr = os.open(PMONLinuxKernelDriver.MSR_PATH % cpu, os.O_RDONLY)
         os.lseek(msr, addr, os.SEEK_SET)
 
@@ -114,16 +322,19 @@ class PMONLinuxKernelDriver(PMONDriver):
         return value
 
     @staticmethod
-    def write_msr(cpu: int, addr: int, value: int) -> Optional[int]:
+    def _write_msr_unpooled(cpu: int, addr: int, value: int) -> Optional[int]:
         """
-        Static method: write_msr(cpu, addr, value)
-        Description: Write [value] data to an MSR [addr] on given logical [cpu].
+        Static method: _write_msr_unpooled(cpu, addr, value)
+        Description: Write [value] data to an MSR [addr] on given logical [cpu],
+        msr file is opened and closed on every call
         """
         if not os.path.exists(PMONLinuxKernelDriver.MSR_PATH % cpu):
             logger.error(
                 f"Problem with using Linux kernel, system file {PMONLinuxKernelDriver.MSR_PATH % cpu} desn't exist."
             )
             return -1
+        PMONLinuxKernelDriver.stats.msr_writes += 1
+        PMONLinuxKernelDriver.stats.opens += 1
         msr = os.open(PMONLinuxKernelDriver.MSR_PATH % cpu, os.O_WRONLY)
         os.lseek(msr, addr, os.SEEK_SET)
         os.write(msr, (value).to_bytes(8, byteorder="little"))
@@ -165,8 +376,11 @@ class PMONLinuxKernelDriver(PMONDriver):
                 add_deviceid = pci_deviceid in deviceids
 
             logger.debug(
-                "[SCAN] vendorid: %s/%s, deviceid: %d/%s"
-                % (pci_vendorid, str(add_vendorid), pci_deviceid, str(add_deviceid))
+                "[SCAN] vendorid: %s/%s, deviceid: %d/%s",
+                pci_vendorid,
+                add_vendorid,
+                pci_deviceid,
+                add_deviceid,
             )
             if add_deviceid and add_vendorid:
                 devlist.append(
@@ -182,6 +396,20 @@ class PMONLinuxKernelDriver(PMONDriver):
                 )
         return devlist
 
+    @staticmethod
+    def fingerprint() -> Any:
+        """
+        Static method: fingerprint()
+        Description: Return (mtime, number of entries) of PCI devices directory
+        """
+        try:
+            return (
+                os.stat(PMONLinuxKernelDriver.PCI_DEVS).st_mtime_ns,
+                len(os.listdir(PMONLinuxKernelDriver.PCI_DEVS)),
+            )
+        except OSError:
+            return None
+
     @staticmethod
     def get_cpuinfo() -> CPUInfo:
         """
@@ -213,3 +441,6 @@ class PMONLinuxKernelDriver(PMONDriver):
                 if key == PMONLinuxKernelDriver.LABEL_CPU_FAMILY:
                     cpuinfo.family = int(value)
         return cpuinfo
+
+
+atexit.register(PMONLinuxKernelDriver.invalidate)
@@ -11,6 +11,7 @@ from libs.pmon.pmon import (
     Registers,
     Size,
 )
+from libs.instrumentation import IOStats, instrumentation
 from libs.logger import pmon_logger as logger
 from libs.vme_constants import (
     DEVICEID,
@@ -53,14 +54,14 @@ class PMONVSIDriver(PMONDriver):
     LABEL_NAME: str = "name"
 
     name: str = "VSI"
+    stats: IOStats = instrumentation.io_stats("pmon.VSI")
 
     def _build_pci_path(
         self, seg: str, bus: str, slot: str, func: str, size: int, addr: int
     ) -> str:
-        logger.debug(
-            "[_build_pci_path] " + self.PCI_PATH % (seg, bus, slot, func, size, addr)
-        )
-        return self.PCI_PATH % (seg, bus, slot, func, size, addr)
+        path: str = self.PCI_PATH % (seg, bus, slot, func, size, addr)
+        logger.debug("[_build_pci_path] %s", path)
+        return path
 
     def get(
         self, node: Tuple[str, str, str, str], addr: Registers, size: Size = Size.DWORD
@@ -69,10 +70,13 @@ class PMONVSIDriver(PMONDriver):
         Method: get(node, addr, size)
         Description: Function read [size] data from [addr] of [node]
         """
+        PMONVSIDriver.stats.reads += 1
         logger.debug(
-            "[GET] Driver: {0}, Device : {1}, Address : 0x{2:0X}, Size : {3}bits".format(
-                self.name, node, addr.value, size.value * 8
-            )
+            "[GET] Driver: %s, Device : %s, Address : 0x%X, Size : %dbits",
+            self.name,
+            node,
+            addr.value,
+            size.value * 8,
         )
         try:
             if size.value == int(Size.COUNTER.value):
@@ -112,15 +116,48 @@ class PMONVSIDriver(PMONDriver):
             return None
         return value
 
+    def get_block(
+        self, node: Tuple[str, str, str, str], addr: int, length: int
+    ) -> Optional[bytes]:
+        """
+        Method: get_block(node, addr, length)
+        Description: Function read [length] bytes starting at [addr] of [node]
+        using the largest pciConfigReg access size (DWORD)
+        """
+        PMONVSIDriver.stats.block_reads += 1
+        PMONVSIDriver.stats.bytes_read += length
+        data = bytearray()
+        aligned: int = addr & ~0x3
+        try:
+            for offset in range(aligned, addr + length, Size.DWORD.value):
+                path: str = self._build_pci_path(
+                    seg=node[0],
+                    bus=node[1],
+                    slot=node[2],
+                    func=node[3],
+                    size=Size.DWORD.value,
+                    addr=offset,
+                )
+                data += int(vsi.get(path)).to_bytes(Size.DWORD.value, "little")
+        except Exception as err:
+            logger.error(
+                f"[GET_BLOCK] Unexpected vsi.get error : {err=}, {err.args=}, {node=}, {addr=}, {length=}"
+            )
+            return None
+        return bytes(data[addr - aligned : addr - aligned + length])
+
     def set(self, node: Tuple[str, str, str, str], addr: Registers, value: int) -> None:
         """
         Method: set(node, addr, value)
         Description: Function writes [value] to [addr] of [node]
         """
+        PMONVSIDriver.stats.writes += 1
         logger.debug(
-            "[SET] Driver: {0}, Device : {1}, Address : 0x{2:0X}, Value : 0x{3:0X}".format(
-                self.name, node, addr.value, value
-            )
+            "[SET] Driver: %s, Device : %s, Address : 0x%X, Value : 0x%X",
+            self.name,
+            node,
+            addr.value,
+            value,
         )
         try:
             path: str = self._build_pci_path(
@@ -138,12 +175,39 @@ class PMONVSIDriver(PMONDriver):
             )
         return None
 
+    def set_block(
+        self, node: Tuple[str, str, str, str], addr: int, data: bytes
+    ) -> None:
+        """
+        Method: set_block(node, addr, data)
+        Description: Function writes DWORD aligned [data] starting at [addr] of
+        [node], pciConfigReg has no block access so every DWORD is one vsi.set
+        """
+        PMONVSIDriver.stats.block_writes += 1
+        try:
+            for offset in range(0, len(data), Size.DWORD.value):
+                path: str = self._build_pci_path(
+                    seg=node[0],
+                    bus=node[1],
+                    slot=node[2],
+                    func=node[3],
+                    size=Size.DWORD.value,
+                    addr=addr + offset,
+                )
+                vsi.set(path, int.from_bytes(data[offset : offset + 4], "little"))
+        except Exception as err:
+            logger.error(
+                f"[SET_BLOCK] Unexpected vsi.set error : {err=}, {err.args=}, {node=}, {addr=}, {len(data)=}"
+            )
+        return None
+
     @staticmethod
     def read_msr(cpu: int, addr: int) -> Optional[int]:
         """
         Static method: read_msr(cpu, addr)
         Description: Read data from an MSR [addr] from a given logical [cpu].
         """
+        PMONVSIDriver.stats.msr_reads += 1
         try:
             value: int = vsi.get(PMONVSIDriver.MSR_PATH % (cpu, addr))
         except Exception as err:
@@ -159,6 +223,7 @@ class PMONVSIDriver(PMONDriver):
         Static method: write_msr(cpu, addr, value)
         Description: Write [value] data to an MSR [addr] on given logical [cpu].
         """
+        PMONVSIDriver.stats.msr_writes += 1
         try:
             vsi.set(PMONVSIDriver.MSR_PATH % (cpu, addr), value)
         except Exception as err:
@@ -204,8 +269,11 @@ class PMONVSIDriver(PMONDriver):
                 add_deviceid = pci_deviceid in deviceids
 
             logger.debug(
-                "[SCAN] vendorid: %s/%s, deviceid: %d/%s"
-                % (pci_vendorid, str(add_vendorid), pci_deviceid, str(add_deviceid))
+                "[SCAN] vendorid: %s/%s, deviceid: %d/%s",
+                pci_vendorid,
+                add_vendorid,
+                pci_deviceid,
+                add_deviceid,
             )
 
             if add_deviceid and add_vendorid:
@@ -227,6 +295,18 @@ class PMONVSIDriver(PMONDriver):
                 )
         return devlist
 
+    @staticmethod
+    def fingerprint() -> Any:
+        """
+        Static method: fingerprint()
+        Description: Return number of PCI devices known to VSI
+        """
+        try:
+            return len(vsi.list(PMONVSIDriver.PCI_DEVS))
+        except Exception as err:
+            logger.error(f"[FINGERPRINT] Unexpected vsi.list error : {err=}, {err.args=}")
+            return None
+
     @staticmethod
     def get_cpuinfo() -> CPUInfo:
         """
@@ -247,7 +327,10 @@ class PMONVSIDriver(PMONDriver):
             cpuinfo.family = int(read_data[PMONVSIDriver.LABEL_FAMILY])
 
             logger.debug(
-                f"[GET_CPUINFO] VendorID: {hex(cpuinfo.vendorid)} Model: {hex(cpuinfo.model)} Family: {hex(cpuinfo.family)}"
+                "[GET_CPUINFO] VendorID: %#x Model: %#x Family: %#x",
+                cpuinfo.vendorid,
+                cpuinfo.model,
+                cpuinfo.family,
             )
 
         except Exception as err:
@@ -0,0 +1,109 @@
+"""
+Pooled file descriptors shared by PMON drivers
+Config space and MSR files are opened once and accessed with pread/pwrite
+from I/O executor threads. Descriptors are reference counted: invalidation
+removes them from the pool at once, but the last in-flight pread/pwrite
+closes them, so a descriptor number is never closed (and reused by an
+unrelated open) under running I/O.
+"""
+import os
+import threading
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+from libs.instrumentation import IOStats
+from libs.logger import pmon_logger as logger
+
+
+class PooledFD:
+    __slots__ = ("fd", "refs", "retired")
+
+    def __init__(self, fd: int) -> None:
+        self.fd = fd
+        self.refs: int = 0
+        self.retired: bool = False
+
+
+class FDPool:
+    """
+    Class: FDPool
+    Description: Reference counted descriptors per (key, flags), [path_of]
+    returns file path of a key and is called only when the file is opened.
+    pread()/pwrite() return None when the file can not be opened and raise
+    OSError of the I/O itself, error handling stays with the driver.
+    """
+
+    def __init__(self, path_of: Callable[[Hashable], str], stats: IOStats) -> None:
+        self.path_of = path_of
+        self.stats = stats
+        self.entries: Dict[Tuple[Hashable, int], PooledFD] = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, key: Hashable, flags: int) -> Optional[PooledFD]:
+        """
+        Method: acquire(key, flags)
+        Description: Return descriptor of [key] opened with [flags] holding a
+        reference, the file is opened only on the first access
+        """
+        with self.lock:
+            entry: Optional[PooledFD] = self.entries.get((key, flags))
+            if entry is None:
+                path: str = self.path_of(key)
+                try:
+                    entry = PooledFD(os.open(path, flags))
+                except OSError as err:
+                    logger.error(f"Unable to open {path}: {err}")
+                    return None
+                self.stats.opens += 1
+                self.entries[(key, flags)] = entry
+            entry.refs += 1
+            return entry
+
+    def release(self, entry: PooledFD) -> None:
+        with self.lock:
+            entry.refs -= 1
+            if entry.retired and not entry.refs:
+                self._close(entry)
+
+    def pread(self, key: Hashable, length: int, offset: int) -> Optional[bytes]:
+        entry: Optional[PooledFD] = self.acquire(key, os.O_RDONLY)
+        if entry is None:
+            return None
+        try:
+            return os.pread(entry.fd, length, offset)
+        finally:
+            self.release(entry)
+
+    def pwrite(self, key: Hashable, data: bytes, offset: int) -> Optional[int]:
+        entry: Optional[PooledFD] = self.acquire(key, os.O_WRONLY)
+        if entry is None:
+            return None
+        try:
+            return os.pwrite(entry.fd, data, offset)
+        finally:
+            self.release(entry)
+
+    def invalidate(self, key: Optional[Hashable] = None) -> None:
+        """
+        Method: invalidate(key)
+        Description: Drop descriptors of [key] (all keys when None) from the
+        pool, descriptors in use are closed by their last release()
+        """
+        with self.lock:
+            keys: List[Tuple[Hashable, int]] = [
+                item for item in self.entries if key is None or item[0] == key
+            ]
+            for item in keys:
+                entry: PooledFD = self.entries.pop(item)
+                entry.retired = True
+                if not entry.refs:
+                    self._close(entry)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @staticmethod
+    def _close(entry: PooledFD) -> None:
+        try:
+            os.close(entry.fd)
+        except OSError:
+            pass
@@ -0,0 +1,174 @@
+"""
+PCI device inventory
+Indexed, cached view of PMON.scan() results, rebuilt only when the driver
+fingerprint of the PCI device list changes
+"""
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from libs.pmon.pmon import PMON, PMONDevice
+from libs.pmon.pmon_utils import Dev2SocketID
+from libs.logger import pmon_logger as logger
+
+QueryKey = Tuple[Tuple[int, ...], Tuple[int, ...], Tuple[int, ...], Tuple[int, ...]]
+
+
+def _as_tuple(values: Union[int, List[int]]) -> Tuple[int, ...]:
+    return (values,) if isinstance(values, int) else tuple(sorted(set(values)))
+
+
+class DeviceInventory:
+    """
+    Class: DeviceInventory
+    Description: Scan all PCI devices once and answer filtered queries
+    from in-memory vendorID, deviceID, bus and socket indexes.
+    """
+
+    def __init__(self, pmon: PMON, check_interval: float = 1.0) -> None:
+        self.pmon = pmon
+        self.check_interval = check_interval
+        self.devices: List[PMONDevice] = []
+        self.by_vendorid: Dict[int, List[PMONDevice]] = {}
+        self.by_deviceid: Dict[int, List[PMONDevice]] = {}
+        self.by_bus: Dict[int, List[PMONDevice]] = {}
+        self.by_socket: Optional[Dict[int, List[PMONDevice]]] = None
+        self.socket_of: Dict[str, int] = {}
+        self.queries: Dict[QueryKey, List[PMONDevice]] = {}
+        self.token: Any = None
+        self.built: bool = False
+        self.checked: float = 0.0
+        self.lock = threading.RLock()
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Method: refresh(force)
+        Description: Rebuild indexes when the driver fingerprint has changed.
+        Fingerprint is checked at most once per check_interval seconds.
+        Returns True when the inventory has been rebuilt.
+        """
+        with self.lock:
+            return self._refresh(force)
+
+    def _refresh(self, force: bool) -> bool:
+        now: float = time.monotonic()
+        if self.built and not force and now - self.checked < self.check_interval:
+            return False
+        self.checked = now
+        token: Any = self.pmon.fingerprint()
+        if self.built and not force and token == self.token:
+            return False
+
+        if self.built:
+            logger.debug(f"[INVENTORY] PCI devices changed {self.token} -> {token}")
+            # pooled device resources and socket mapping may refer to removed devices
+            self.pmon.invalidate()
+            Dev2SocketID.reset()
+        self.token = token
+        self.devices = self.pmon.scan()
+        self.by_vendorid = {}
+        self.by_deviceid = {}
+        self.by_bus = {}
+        self.by_socket = None
+        self.queries = {}
+        for dev in self.devices:
+            self.by_vendorid.setdefault(dev.vid, []).append(dev)
+            self.by_deviceid.setdefault(dev.did, []).append(dev)
+            self.by_bus.setdefault(dev.bus, []).append(dev)
+        self.built = True
+        return True
+
+    def socket(self, dev: PMONDevice) -> int:
+        """
+        Method: socket(dev)
+        Description: Return socket ID of the device, -1 if unknown
+        """
+        with self.lock:
+            self._refresh(False)
+            self._index_sockets()
+            return self.socket_of.get(dev.path, -1)
+
+    def _index_sockets(self) -> None:
+        # socket mapping requires register reads, build it only when asked for
+        if self.by_socket is None:
+            self.by_socket = {}
+            self.socket_of = {}
+            for dev in self.devices:
+                socket: int = Dev2SocketID.get(self.pmon, dev)
+                self.socket_of[dev.path] = socket
+                self.by_socket.setdefault(socket, []).append(dev)
+
+    def find(
+        self,
+        vendorids: Union[int, List[int]] = [],
+        deviceids: Union[int, List[int]] = [],
+        sockets: Union[int, List[int]] = [],
+        buses: Union[int, List[int]] = [],
+    ) -> List[PMONDevice]:
+        """
+        Method: find(vendorids, deviceids, sockets, buses)
+        Description: Return devices matching all given filters (same semantic as PMON.scan),
+        in scan order. Results are cached until the inventory is rebuilt.
+        """
+        with self.lock:
+            return self._find(vendorids, deviceids, sockets, buses)
+
+    async def afind(
+        self,
+        vendorids: Union[int, List[int]] = [],
+        deviceids: Union[int, List[int]] = [],
+        sockets: Union[int, List[int]] = [],
+        buses: Union[int, List[int]] = [],
+    ) -> List[PMONDevice]:
+        """
+        Method: await afind(vendorids, deviceids, sockets, buses)
+        Description: find() executed in PMON I/O executor
+        """
+        return await self.pmon.executor.run(
+            self.find, vendorids, deviceids, sockets, buses
+        )
+
+    def _find(
+        self,
+        vendorids: Union[int, List[int]],
+        deviceids: Union[int, List[int]],
+        sockets: Union[int, List[int]],
+        buses: Union[int, List[int]],
+    ) -> List[PMONDevice]:
+        self._refresh(False)
+        key: QueryKey = (
+            _as_tuple(vendorids),
+            _as_tuple(deviceids),
+            _as_tuple(sockets),
+            _as_tuple(buses),
+        )
+        result: Optional[List[PMONDevice]] = self.queries.get(key)
+        if result is not None:
+            return result
+
+        vids, dids, socks, busids = key
+        if socks:
+            self._index_sockets()
+        candidates: List[List[PMONDevice]] = []
+        for values, index in (
+            (dids, self.by_deviceid),
+            (vids, self.by_vendorid),
+            (busids, self.by_bus),
+            (socks, self.by_socket),
+        ):
+            if values:
+                candidates.append(
+                    [dev for value in values for dev in index.get(value, [])]  # type: ignore
+                )
+        if not candidates:
+            result = list(self.devices)
+        else:
+            # start from the smallest index hit list and intersect with the others
+            candidates.sort(key=len)
+            selected = set(map(id, candidates[0]))
+            for other in candidates[1:]:
+                selected &= set(map(id, other))
+            result = [dev for dev in self.devices if id(dev) in selected]
+
+        self.queries[key] = result
+        return result
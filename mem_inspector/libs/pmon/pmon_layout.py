@@ -0,0 +1,187 @@
+"""
+Declarative register layouts
+Field name and bit range of PMON registers, decoded either for a single
+value (plain Python, precomputed shifts and masks) or for arrays of raw
+register values with NumPy, returning structured arrays.
+
+NumPy decoding:
+    blocks = config_matrix(configs)                   (devices, 4096) uint8
+    raw = register_columns(blocks, [Registers.correrrcnt_0, ...])
+    fields = decode_registers(raw)
+    fields["correrrcnt_0"]["cor_err_cnt_1"]           one column per field
+"""
+from typing import Any, Dict, Final, Iterable, List, Tuple
+
+from libs.pmon.pmon import Registers
+
+try:
+    import numpy as np  # type: ignore
+except ImportError:
+    # numpy is only required for array decoding
+    np = None
+
+# (field name, low bit, high bit)
+Layout = Tuple[Tuple[str, int, int], ...]
+
+CORRERRCNT_LAYOUT: Final[Layout] = (
+    ("cor_err_cnt_0", 0, 14),
+    ("overflow_0", 15, 15),
+    ("cor_err_cnt_1", 16, 30),
+    ("overflow_1", 31, 31),
+)
+CORRERRTHRSHLD_LAYOUT: Final[Layout] = (
+    ("cor_err_th_0", 0, 14),
+    ("cor_err_th_1", 16, 30),
+)
+PMONCNTR_LAYOUT: Final[Layout] = (("counter", 0, 47),)
+# Baseline *_PMON_CTLx register, see PMONRegister.set_event
+PMONCNTRCFG_LAYOUT: Final[Layout] = (
+    ("ev_sel", 0, 7),
+    ("umask", 8, 15),
+    ("rst", 17, 17),
+    ("edge_det", 18, 18),
+    ("ov_en", 20, 20),
+    ("en", 22, 22),
+    ("invert", 23, 23),
+    ("thresh", 24, 31),
+)
+
+REGISTER_LAYOUTS: Final[Dict[Registers, Layout]] = {
+    Registers.vendorid: (("vendorid", 0, 15), ("deviceid", 16, 31)),
+    Registers.memtrmltemprep: (
+        ("channel0_max_temp", 0, 7),
+        ("channel1_max_temp", 8, 15),
+        ("channel2_max_temp", 16, 23),
+        ("channel3_max_temp", 24, 31),
+    ),
+    **{Registers[f"pmoncntr_{idx}"]: PMONCNTR_LAYOUT for idx in range(5)},
+    **{Registers[f"pmoncntrcfg_{idx}"]: PMONCNTRCFG_LAYOUT for idx in range(5)},
+    **{Registers[f"correrrcnt_{idx}"]: CORRERRCNT_LAYOUT for idx in range(4)},
+    **{Registers[f"correrrthrshld_{idx}"]: CORRERRTHRSHLD_LAYOUT for idx in range(4)},
+    # per rank corrected error counter overflow flags
+    Registers.correrrorstatus: (("err_overflow_stat", 0, 7),),
+}
+
+# field name, shift and mask of every layout, computed once
+LAYOUT_MASKS: Final[Dict[Registers, Tuple[Tuple[str, int, int], ...]]] = {
+    register: tuple((name, lo, (1 << (hi - lo + 1)) - 1) for name, lo, hi in layout)
+    for register, layout in REGISTER_LAYOUTS.items()
+}
+
+
+def register_size(register: Registers) -> int:
+    """Return number of bytes covering all fields of [register]"""
+    return max(hi for _, _, hi in REGISTER_LAYOUTS[register]) // 8 + 1
+
+
+def decode_value(register: Registers, value: int) -> Dict[str, int]:
+    """
+    Function: decode_value(register, value)
+    Description: Return field name -> value of a single raw [register] value
+    """
+    return {
+        name: value >> shift & mask for name, shift, mask in LAYOUT_MASKS[register]
+    }
+
+
+def format_fields(register: Registers, value: int) -> str:
+    """Return "field=value ..." text of a single raw [register] value"""
+    return " ".join(
+        f"{name}={field}" for name, field in decode_value(register, value).items()
+    )
+
+
+def _require_numpy() -> None:
+    if np is None:
+        raise RuntimeError("numpy is required for register array decoding")
+
+
+def _field_type(lo: int, hi: int) -> str:
+    width: int = hi - lo + 1
+    if width <= 8:
+        return "u1"
+    if width <= 16:
+        return "<u2"
+    if width <= 32:
+        return "<u4"
+    return "<u8"
+
+
+def layout_dtype(register: Registers) -> Any:
+    """
+    Function: layout_dtype(register)
+    Description: Return structured dtype with one smallest fitting unsigned
+    integer field per layout field of [register]
+    """
+    _require_numpy()
+    return np.dtype(
+        [(name, _field_type(lo, hi)) for name, lo, hi in REGISTER_LAYOUTS[register]]
+    )
+
+
+def decode_array(register: Registers, values: Any) -> Any:
+    """
+    Function: decode_array(register, values)
+    Description: Decode array of raw [register] values into structured array,
+    every field is one shift and mask over the whole array
+    """
+    _require_numpy()
+    raw = np.asarray(values, dtype=np.uint64)
+    out = np.empty(raw.shape, dtype=layout_dtype(register))
+    for name, shift, mask in LAYOUT_MASKS[register]:
+        out[name] = (raw >> np.uint64(shift)) & np.uint64(mask)
+    return out
+
+
+def decode_registers(columns: Dict[Registers, Any]) -> Any:
+    """
+    Function: decode_registers(columns)
+    Description: Decode equally long raw value arrays of several registers
+    into one structured array with a nested record per register
+    """
+    _require_numpy()
+    decoded: Dict[Registers, Any] = {
+        register: decode_array(register, values)
+        for register, values in columns.items()
+    }
+    shape: Tuple[int, ...] = next(iter(decoded.values())).shape if decoded else (0,)
+    out = np.empty(
+        shape,
+        dtype=[(register.name, fields.dtype) for register, fields in decoded.items()],
+    )
+    for register, fields in decoded.items():
+        out[register.name] = fields
+    return out
+
+
+def config_matrix(configs: Iterable[Any], size: int = 4096) -> Any:
+    """
+    Function: config_matrix(configs, size)
+    Description: Stack config spaces (bytes, bytearray or memoryview) into
+    a (devices, size) uint8 matrix, shorter config spaces are zero padded
+    """
+    _require_numpy()
+    rows: List[Any] = list(configs)
+    blocks = np.zeros((len(rows), size), dtype=np.uint8)
+    for idx, config in enumerate(rows):
+        data = np.frombuffer(config, dtype=np.uint8, count=min(len(config), size))
+        blocks[idx, : len(data)] = data
+    return blocks
+
+
+def register_columns(
+    blocks: Any, registers: Iterable[Registers]
+) -> Dict[Registers, Any]:
+    """
+    Function: register_columns(blocks, registers)
+    Description: Return register -> raw little endian values of all devices
+    of a (devices, size) uint8 config space matrix
+    """
+    _require_numpy()
+    columns: Dict[Registers, Any] = {}
+    for register in registers:
+        size: int = register_size(register)
+        raw = np.zeros((blocks.shape[0], 8), dtype=np.uint8)
+        raw[:, :size] = blocks[:, register.value : register.value + size]
+        columns[register] = raw.view("<u8")[:, 0]
+    return columns
@@ -0,0 +1,287 @@
+"""
+Machine Check Architecture bank poller
+Reads memory controller MCi_STATUS/ADDR/MISC banks once per socket and decodes
+MCi_STATUS with precomputed tables indexed by its flag bits (63:55).
+
+The kernel machine check handler and CMCI poller read and clear the same
+banks, so a poller only observes errors still latched at poll time; records
+are emitted when a bank status changes, not on every poll.
+"""
+from typing import Dict, Final, List, Optional, Tuple
+
+from libs.io_executor import socket_cpus
+from libs.logger import pmon_logger as logger
+from libs.pmon.pmon import PMON, CPUInfo
+from libs.pmon.pmon_metric_values import PMONMCAValues
+from libs.vme_constants import (
+    INTEL_BROADWELL_X_MODEL,
+    INTEL_HASWELL_X_MODEL,
+    INTEL_SKYLAKE_XEON_SCALABLE_FAMILY,
+    INTEL_SKYLAKE_XEON_SCALABLE_MODEL,
+    MCA_STATUS_ADDRV,
+    MCA_STATUS_AR,
+    MCA_STATUS_EN,
+    MCA_STATUS_MISCV,
+    MCA_STATUS_OVER,
+    MCA_STATUS_PCC,
+    MCA_STATUS_S,
+    MCA_STATUS_UC,
+    MCA_STATUS_VAL,
+    MCE_CE,
+    MCE_SRAO,
+    MCE_SRAR,
+    MCE_UC,
+    MCE_UCNA,
+)
+
+IA32_MCG_CAP: Final[int] = 0x179
+IA32_MC0_CTL: Final[int] = 0x400
+
+MCG_CAP_COUNT_MASK: Final[int] = 0xFF
+MCG_CAP_SER_P: Final[int] = 1 << 24
+
+# MCi_STATUS flag bits 63:55, in the order of the lookup table index bits
+STATUS_FLAGS: Final[Tuple[Tuple[str, int], ...]] = (
+    (MCA_STATUS_VAL, 63),
+    (MCA_STATUS_OVER, 62),
+    (MCA_STATUS_UC, 61),
+    (MCA_STATUS_EN, 60),
+    (MCA_STATUS_MISCV, 59),
+    (MCA_STATUS_ADDRV, 58),
+    (MCA_STATUS_PCC, 57),
+    (MCA_STATUS_S, 56),
+    (MCA_STATUS_AR, 55),
+)
+STATUS_FLAGS_SHIFT: Final[int] = 55
+
+STATUS_CORRECTED_COUNT_SHIFT: Final[int] = 38
+STATUS_CORRECTED_COUNT_MASK: Final[int] = 0x7FFF
+STATUS_MSCOD_SHIFT: Final[int] = 16
+STATUS_MSCOD_MASK: Final[int] = 0xFFFF
+STATUS_MCACOD_MASK: Final[int] = 0xFFFF
+
+# Memory controller compound error code 000F 0000 1MMM CCCC, F is the filter bit
+MCACOD_MEMORY_MASK: Final[int] = 0xEF80
+MCACOD_MEMORY: Final[int] = 0x0080
+MCACOD_CHANNEL_MASK: Final[int] = 0xF
+MCACOD_CHANNEL_UNKNOWN: Final[int] = 0xF
+MISC_ADDR_LSB_MASK: Final[int] = 0x3F
+
+# Memory controller banks per (family, model): home agents 7-8 and iMC
+# channels 9-16 on Haswell/Broadwell, M2M 7-8 and iMC channels 13-18 on Skylake
+HASWELL_BROADWELL_MEMORY_BANKS: Final[List[int]] = list(range(7, 17))
+MCA_MEMORY_BANKS: Final[Dict[Tuple[int, int], List[int]]] = {
+    (
+        INTEL_SKYLAKE_XEON_SCALABLE_FAMILY,
+        INTEL_HASWELL_X_MODEL,
+    ): HASWELL_BROADWELL_MEMORY_BANKS,
+    (
+        INTEL_SKYLAKE_XEON_SCALABLE_FAMILY,
+        INTEL_BROADWELL_X_MODEL,
+    ): HASWELL_BROADWELL_MEMORY_BANKS,
+    (INTEL_SKYLAKE_XEON_SCALABLE_FAMILY, INTEL_SKYLAKE_XEON_SCALABLE_MODEL): [
+        7,
+        8,
+        13,
+        14,
+        15,
+        16,
+        17,
+        18,
+    ],
+}
+
+# decoded flags: (val, over, uc, en, miscv, addrv, pcc, s, ar)
+StatusFlags = Tuple[bool, bool, bool, bool, bool, bool, bool, bool, bool]
+
+
+def mci_status(bank: int) -> int:
+    return IA32_MC0_CTL + 4 * bank + 1
+
+
+def mci_addr(bank: int) -> int:
+    return IA32_MC0_CTL + 4 * bank + 2
+
+
+def mci_misc(bank: int) -> int:
+    return IA32_MC0_CTL + 4 * bank + 3
+
+
+def classify(flags: StatusFlags, ser: bool) -> str:
+    """
+    Function: classify(flags, ser)
+    Description: Return MC error classification of decoded MCi_STATUS flags,
+    S and AR are defined only with software error recovery support (MCG_SER_P)
+    """
+    val, _, uc, _, _, _, pcc, s, ar = flags
+    if not val:
+        return ""
+    if not uc:
+        return MCE_CE
+    if pcc or not ser:
+        return MCE_UC
+    if s:
+        return MCE_SRAR if ar else MCE_SRAO
+    return MCE_UCNA
+
+
+def _status_table(ser: bool) -> List[Tuple[StatusFlags, str]]:
+    table: List[Tuple[StatusFlags, str]] = []
+    for index in range(1 << len(STATUS_FLAGS)):
+        flags: StatusFlags = tuple(  # type: ignore
+            bool(index >> (bit - STATUS_FLAGS_SHIFT) & 1) for _, bit in STATUS_FLAGS
+        )
+        table.append((flags, classify(flags, ser)))
+    return table
+
+
+# (flags, classification) indexed by MCi_STATUS >> 55
+STATUS_TABLE: Final[List[Tuple[StatusFlags, str]]] = _status_table(False)
+STATUS_TABLE_SER: Final[List[Tuple[StatusFlags, str]]] = _status_table(True)
+
+
+def parse_banks(args: List[str]) -> Optional[List[int]]:
+    """
+    Function: parse_banks(args)
+    Description: Parse bank list i.e ["7", "13-18"], None for an empty list
+    """
+    banks: List[int] = []
+    for arg in args:
+        for item in arg.split(","):
+            first, _, last = item.partition("-")
+            banks += range(int(first, 0), int(last or first, 0) + 1)
+    return sorted(set(banks)) or None
+
+
+class MCAPoller:
+    """
+    Class: MCAPoller
+    Description: Poll memory controller MCA banks on the first CPU of every
+    socket. Bank count and software error recovery support come from
+    MCG_CAP, default banks from MCA_MEMORY_BANKS of the CPU model (nothing is
+    polled for unknown models without [banks]). All MCi_STATUS registers are read in one
+    read_msr_all() call, MCi_ADDR/MCi_MISC only for changed valid banks.
+    """
+
+    def __init__(
+        self, pmon: PMON, banks: Optional[List[int]] = None, workers: int = 0
+    ) -> None:
+        self.pmon = pmon
+        self.requested = banks
+        self.workers = workers
+        self.banks: List[int] = []
+        self.status_msrs: List[int] = []
+        # socket -> first logical CPU of the socket
+        self.cpus: Dict[int, int] = {}
+        self.table: List[Tuple[StatusFlags, str]] = STATUS_TABLE
+        self.ready: bool = False
+        self.failed: bool = False
+        # (socket, bank) -> (status, addr, misc) of the last emitted record
+        self.previous: Dict[Tuple[int, int], Tuple[int, int, int]] = {}
+
+    def setup(self) -> bool:
+        """
+        Method: setup()
+        Description: Read MCG_CAP and select banks and CPUs, done once
+        """
+        if self.ready or self.failed:
+            return self.ready
+        sockets = socket_cpus() or {0: {0}}
+        self.cpus = {socket: min(cpus) for socket, cpus in sorted(sockets.items())}
+        cap: Optional[int] = self.pmon.read_msr(min(self.cpus.values()), IA32_MCG_CAP)
+        if cap is None or cap < 0:
+            logger.error("[MCA] Unable to read MCG_CAP, MCA polling disabled")
+            self.failed = True
+            return False
+        count: int = cap & MCG_CAP_COUNT_MASK
+        cpuinfo: CPUInfo = self.pmon.get_cpuinfo()
+        banks: List[int] = self.requested or MCA_MEMORY_BANKS.get(
+            (cpuinfo.family, cpuinfo.model), []
+        )
+        if not banks:
+            # other banks report core, cache and uncore errors, not memory
+            logger.error(
+                "[MCA] No memory controller banks known for family %#x model %#x,"
+                " select them with --mca-banks, MCA polling disabled",
+                cpuinfo.family,
+                cpuinfo.model,
+            )
+        self.banks = [bank for bank in banks if bank < count]
+        self.status_msrs = [mci_status(bank) for bank in self.banks]
+        self.table = STATUS_TABLE_SER if cap & MCG_CAP_SER_P else STATUS_TABLE
+        logger.debug(
+            "[MCA] MCG_CAP=%#x banks=%s sockets=%s", cap, self.banks, self.cpus
+        )
+        self.ready = True
+        return True
+
+    def poll(self) -> List[PMONMCAValues]:
+        """
+        Method: poll()
+        Description: Return records of valid banks whose status changed since
+        the previous poll and of banks cleared since then
+        """
+        if not self.setup() or not self.banks:
+            return []
+        statuses = self.pmon.read_msr_all(
+            self.status_msrs, list(self.cpus.values()), self.workers
+        )
+        records: List[PMONMCAValues] = []
+        for socket, cpu in self.cpus.items():
+            values: Dict[int, Optional[int]] = statuses.get(cpu, {})
+            for bank, msr in zip(self.banks, self.status_msrs):
+                status: Optional[int] = values.get(msr)
+                if status is None or status < 0:
+                    continue
+                key: Tuple[int, int] = (socket, bank)
+                previous: Optional[Tuple[int, int, int]] = self.previous.get(key)
+                if previous is None and not status >> 63:
+                    continue
+                if previous is not None and previous[0] == status:
+                    continue
+                records.append(self.record(socket, cpu, bank, status))
+        return records
+
+    def record(self, socket: int, cpu: int, bank: int, status: int) -> PMONMCAValues:
+        flags, classification = self.table[status >> STATUS_FLAGS_SHIFT]
+        val, over, uc, en, miscv, addrv, pcc, s, ar = flags
+        addr: int = 0
+        misc: int = 0
+        if val and addrv:
+            addr = max(self.pmon.read_msr(cpu, mci_addr(bank)) or 0, 0)
+        if val and miscv:
+            misc = max(self.pmon.read_msr(cpu, mci_misc(bank)) or 0, 0)
+        key: Tuple[int, int] = (socket, bank)
+        if val:
+            self.previous[key] = (status, addr, misc)
+        else:
+            self.previous.pop(key, None)
+
+        mcacod: int = status & STATUS_MCACOD_MASK
+        memory: bool = mcacod & MCACOD_MEMORY_MASK == MCACOD_MEMORY
+        channel: int = mcacod & MCACOD_CHANNEL_MASK if memory else -1
+        return PMONMCAValues(
+            socket=socket,
+            cpu=cpu,
+            bank=bank,
+            classification=classification,
+            status=status,
+            addr=addr,
+            misc=misc,
+            addr_lsb=misc & MISC_ADDR_LSB_MASK if miscv else 0,
+            corrected_count=(status >> STATUS_CORRECTED_COUNT_SHIFT)
+            & STATUS_CORRECTED_COUNT_MASK,
+            mcacod=mcacod,
+            mscod=(status >> STATUS_MSCOD_SHIFT) & STATUS_MSCOD_MASK,
+            memory=memory,
+            channel=-1 if channel == MCACOD_CHANNEL_UNKNOWN else channel,
+            val=val,
+            over=over,
+            uc=uc,
+            en=en,
+            miscv=miscv,
+            addrv=addrv,
+            pcc=pcc,
+            s=s,
+            ar=ar,
+        )
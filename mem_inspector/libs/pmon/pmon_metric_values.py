@@ -9,6 +9,9 @@ METRICS_PMON_CORRERRCNT: Final[str] = "pmon.read_correrrcnt"
 METRICS_PMON_DIMM_TEMP: Final[str] = "pmon.read_dimm_temp"
 METRICS_PMON_PCICFG: Final[str] = "offline_addinfo.read_pcicfg"
 METRICS_PMON_HWMON_TEMP: Final[str] = "hwmon.read_temp"
+METRICS_PMON_MCA: Final[str] = "pmon.read_mca"
+METRICS_PMON_RANK_BW: Final[str] = "pmon.read_rank_bw"
+METRICS_SELF: Final[str] = "mem_inspector.self"
 
 PMON_MEM_BW_RD: Final[str] = "mem_bw_rd"
 PMON_MEM_BW_WR: Final[str] = "mem_bw_wr"
@@ -59,6 +62,25 @@ class PMONBWValues(ABSPMONValues):
     period: float
 
 
+@dataclass
+class PMONRankBWValues(ABSPMONValues):
+    node_name: str
+    rank: int
+    cas_count_rd: int
+    cas_count_wr: int
+    mem_bw_rd: float
+    mem_bw_wr: float
+    mem_bw_total: float
+    # share of the period the rank events were counted, counts are scaled by it
+    rd_active: float
+    wr_active: float
+    period: float
+
+    @property
+    def key(self) -> str:
+        return f"{self.node_name}.{self.rank}"
+
+
 @dataclass
 class PMONScrubaddressValues(ABSPMONValues):
     node_name: str
@@ -120,3 +142,44 @@ class PMONTRMLMaxTempValues(ABSPMONValues):
     channel1_max_temp: int
     channel2_max_temp: int
     channel3_max_temp: int
+
+
+@dataclass
+class SelfMetricValues(ABSPMONValues):
+    name: str
+    metric: str
+    value: float
+
+    @property
+    def key(self) -> str:
+        return f"{self.name}.{self.metric}"
+
+
+@dataclass
+class PMONMCAValues(ABSPMONValues):
+    socket: int
+    cpu: int
+    bank: int
+    classification: str
+    status: int
+    addr: int
+    misc: int
+    addr_lsb: int
+    corrected_count: int
+    mcacod: int
+    mscod: int
+    memory: bool
+    channel: int
+    val: bool
+    over: bool
+    uc: bool
+    en: bool
+    miscv: bool
+    addrv: bool
+    pcc: bool
+    s: bool
+    ar: bool
+
+    @property
+    def key(self) -> str:
+        return f"{self.socket}.{self.bank}"
@@ -3,10 +3,11 @@ import os
 import socket
 from datetime import datetime
 from functools import lru_cache
-from typing import Dict, List
+from typing import Dict, Final, List, Optional, Tuple
 
 from libs.data_processors import AbsDataProcessor
 from libs.hwmon.hwmon import HWMON
+from libs.instrumentation import instrumentation
 from libs.native import NativeCallMap
 from libs.pmon.pmon import (  # noqa: E402
     PMON,
@@ -20,30 +21,61 @@ from libs.pmon.pmon import (  # noqa: E402
 # from libs.pmon.pmon_driver_emulated import PMONEmulatedDriver
 # from libs.pmon.pmon_driver_vsi import PMONVSIDriver  # noqa: E402
 from libs.pmon.pmon_driver_linuxkernel import PMONLinuxKernelDriver
-from libs.pmon.pmon_utils import count_bw, get_bitfield, measure
+from libs.pmon.pmon_inventory import DeviceInventory
+from libs.pmon.pmon_mca import MCAPoller, parse_banks
+from libs.pmon.pmon_layout import decode_value
+from libs.pmon.pmon_utils import (
+    RANK_COUNTERS,
+    RANKS,
+    BWSampler,
+    RankBWSampler,
+    count_bw,
+    measure,
+)
 from libs.logger import pmon_logger as logger
 from libs.metric_values import AbsMetricValues, MetricMetaData, PMONMetricValues
 from libs.pmon.pmon_metric_values import (
     METRICS_PMON_CORRERRCNT,
     METRICS_PMON_DIMM_TEMP,
     METRICS_PMON_HWMON_TEMP,
+    METRICS_PMON_MCA,
     METRICS_PMON_MEMORY_BW,
     METRICS_PMON_PCICFG,
     METRICS_PMON_PMONCTR,
+    METRICS_PMON_RANK_BW,
     METRICS_PMON_SCRUBADDRESS,
+    METRICS_SELF,
     HWMONTempValues,
     PMONBWValues,
     PMONCorrerrcntValues,
     PMONDevicesWithRegisters,
     PMONPCICFGValues,
     PMONPmoncntrValues,
+    PMONRankBWValues,
     PMONScrubaddressValues,
     PMONTRMLMaxTempValues,
+    SelfMetricValues,
 )
 from libs.vme_constants import PCI_INTEL_VENDORID
 
 pmon = PMON(PMONLinuxKernelDriver)
 hwmon = HWMON()
+inventory = DeviceInventory(pmon)
+bw_sampler = BWSampler(pmon)
+mca_pollers: Dict[Tuple[str, ...], MCAPoller] = {}
+rank_bw_samplers: Dict[Tuple[int, ...], RankBWSampler] = {}
+
+CORRERRCNT_REGISTERS: Final[List[Registers]] = [
+    Registers.correrrcnt_0,
+    Registers.correrrcnt_1,
+    Registers.correrrcnt_2,
+    Registers.correrrcnt_3,
+    Registers.correrrthrshld_0,
+    Registers.correrrthrshld_1,
+    Registers.correrrthrshld_2,
+    Registers.correrrthrshld_3,
+    Registers.correrrorstatus,
+]
 
 @lru_cache
 def get_unique_host_id() -> str:
@@ -55,9 +87,8 @@ def get_unique_host_id() -> str:
         return socket.gethostname()
 
 
-@lru_cache
 def scan_and_cache_all_imc() -> List[PMONDevice]:
-    return pmon.scan(
+    return inventory.find(
         deviceids=[
             Devices.IMC0C0_1LMS,
             Devices.IMC0C1_1LMS,
@@ -69,9 +100,15 @@ def scan_and_cache_all_imc() -> List[PMONDevice]:
     )
 
 
-@lru_cache
 def scan_and_cache_correrr_imc() -> List[PMONDevice]:
-    return pmon.scan(deviceids=[Devices.IMC0C0_1LMDP])
+    return inventory.find(deviceids=[Devices.IMC0C0_1LMDP])
+
+
+async def devices_sockets(devs: List[PMONDevice]) -> List[Optional[int]]:
+    """Return socket of every device for per socket I/O workers, None when not used"""
+    if not pmon.executor.per_socket:
+        return [None] * len(devs)
+    return await pmon.executor.run(lambda: [inventory.socket(dev) for dev in devs])
 
 
 """ Python Native Function syntax:
@@ -168,7 +205,7 @@ async def read_bw(out: AbsDataProcessor, args: List[str]) -> None:
         return None
     period = int(args[0])
 
-    cached_scan_devs = scan_and_cache_all_imc()
+    cached_scan_devs = await pmon.executor.run(scan_and_cache_all_imc)
     result = await asyncio.gather(
         *(
             measure(
@@ -218,6 +255,127 @@ async def read_bw(out: AbsDataProcessor, args: List[str]) -> None:
     out.write_metric(data)
 
 
+async def read_bw_sampler(out: AbsDataProcessor, args: List[str]) -> None:
+    """
+    read_bw_sampler - Return all IMC controllers bandwidth from free running
+        counters. Counters are armed once and every sample reports traffic
+        since the previous sample, so consecutive samples have no gaps.
+        The first call only arms the counters.
+
+    Params:
+        args[0] - sample interval (in seconds, fractions allowed) i.e "0.5", default "1"
+        args[1] - number of samples emitted per call i.e "10", default "1"
+    """
+    interval = float(args[0]) if len(args) > 0 else 1.0
+    samples = int(args[1]) if len(args) > 1 else 1
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time()
+    for sample in range(samples):
+        devs = await pmon.executor.run(scan_and_cache_all_imc)
+        samples_list = await pmon.executor.run(
+            bw_sampler.sample, [dev.path for dev in devs]
+        )
+        data: List[AbsMetricValues] = []
+        for node, cas_count_rd, cas_count_wr, elapsed in samples_list:
+            (mem_bw_rd, mem_bw_wr, mem_bw_total) = count_bw(cas_count_rd, cas_count_wr)
+            data.append(
+                PMONMetricValues(
+                    meta=MetricMetaData(
+                        tool=METRICS_PMON_MEMORY_BW,
+                        creation_timestamp=datetime.utcnow(),
+                        hostname=get_unique_host_id(),
+                    ),
+                    metrics=PMONBWValues(
+                        node_name=node,
+                        mem_bw_rd=mem_bw_rd,
+                        mem_bw_wr=mem_bw_wr,
+                        mem_bw_total=mem_bw_total,
+                        period=elapsed,
+                    ),
+                )
+            )
+        if data:
+            out.write_metric(data)
+        if sample + 1 < samples:
+            deadline += interval
+            await asyncio.sleep(max(0.0, deadline - loop.time()))
+
+
+async def read_rank_bw(out: AbsDataProcessor, args: List[str]) -> None:
+    """
+    read_rank_bw - Return per rank read/write bandwidth of all IMC channels.
+        The 16 RD_CAS_RANK0..7 / WR_CAS_RANK0..7 events are rotated over the
+        channel counters every slice and scaled by the share of the period
+        they were counted. The schedule continues across calls, so
+        consecutive calls have no gaps. The first call only programs the counters
+        for its first slice.
+
+    Params:
+        args[0] - period (in seconds, fractions allowed) i.e "1", default "1"
+        args[1] - multiplexing slice (in seconds) i.e "0.1", default "0.1"
+        args[2] - counters used i.e "0,1,4", default "0,1,2,3,4"
+    """
+    try:
+        period = float(args[0]) if len(args) > 0 else 1.0
+        slice_time = float(args[1]) if len(args) > 1 else 0.1
+        counters: Tuple[int, ...] = (
+            tuple(sorted({int(idx) for idx in args[2].split(",")}))
+            if len(args) > 2
+            else tuple(range(RANK_COUNTERS))
+        )
+        if slice_time <= 0 or not set(counters) <= set(range(RANK_COUNTERS)):
+            raise ValueError(args)
+    except ValueError:
+        logger.error("Invalid params, usage: read_rank_bw [period] [slice] [counters]")
+        return None
+    sampler: Optional[RankBWSampler] = rank_bw_samplers.get(counters)
+    if sampler is None:
+        sampler = rank_bw_samplers[counters] = RankBWSampler(pmon, list(counters))
+
+    devs = await pmon.executor.run(scan_and_cache_all_imc)
+    nodes: List[str] = [dev.path for dev in devs]
+    loop = asyncio.get_running_loop()
+    deadline = loop.time()
+    await pmon.executor.run(sampler.rotate, nodes)
+    for _ in range(max(1, round(period / slice_time))):
+        deadline += slice_time
+        await asyncio.sleep(max(0.0, deadline - loop.time()))
+        await pmon.executor.run(sampler.rotate, nodes)
+    samples = await pmon.executor.run(sampler.collect, nodes)
+
+    data: List[AbsMetricValues] = []
+    meta = MetricMetaData(
+        tool=METRICS_PMON_RANK_BW,
+        creation_timestamp=datetime.utcnow(),
+        hostname=get_unique_host_id(),
+    )
+    for node, counts, fractions, elapsed in samples:
+        for rank in range(RANKS):
+            (mem_bw_rd, mem_bw_wr, mem_bw_total) = count_bw(
+                counts[rank], counts[RANKS + rank]
+            )
+            data.append(
+                PMONMetricValues(
+                    meta=meta,
+                    metrics=PMONRankBWValues(
+                        node_name=node,
+                        rank=rank,
+                        cas_count_rd=counts[rank],
+                        cas_count_wr=counts[RANKS + rank],
+                        mem_bw_rd=mem_bw_rd,
+                        mem_bw_wr=mem_bw_wr,
+                        mem_bw_total=mem_bw_total,
+                        rd_active=fractions[rank],
+                        wr_active=fractions[RANKS + rank],
+                        period=elapsed,
+                    ),
+                )
+            )
+    if data:
+        out.write_metric(data)
+
+
 async def read_pcicfg(out: AbsDataProcessor, args: List[str]) -> None:
     """
     read_pcicfg - Return dump from PCICFG space memory
@@ -255,7 +413,7 @@ async def read_pcicfg(out: AbsDataProcessor, args: List[str]) -> None:
     ]
 
     pmon_devices: List[PMONDevicesWithRegisters] = []
-    for dev in pmon.scan(deviceids=deviceids, vendorids=PCI_INTEL_VENDORID):
+    for dev in inventory.find(deviceids=deviceids, vendorids=PCI_INTEL_VENDORID):
         registers_values: Dict[str, int] = {}
         for reg in registers:
             reg_value = pmon[dev.path].reg(reg).get()
@@ -291,7 +449,7 @@ async def read_hwmon_temp(out: AbsDataProcessor, args: List[str]) -> None:
     Params: none
     """
     data: List[AbsMetricValues] = []
-    for temp in hwmon.get_temperatures():
+    for temp in await hwmon.aget_temperatures():
         v = PMONMetricValues(
             meta=MetricMetaData(
                 tool=METRICS_PMON_HWMON_TEMP,
@@ -322,9 +480,18 @@ async def read_correrrcnt(out: AbsDataProcessor, args: List[str]) -> None:
     for arg in args:
         deviceids.append(int(arg, base=16))
 
+    devs = await inventory.afind(deviceids=deviceids, vendorids=PCI_INTEL_VENDORID)
+    # devs = await pmon.executor.run(scan_and_cache_correrr_imc)
+    sockets = await devices_sockets(devs)
+    # all registers are fetched with a single block read, devices are read concurrently
+    results = await asyncio.gather(
+        *(
+            pmon[dev.path].aread_registers(CORRERRCNT_REGISTERS, socket=socket)
+            for dev, socket in zip(devs, sockets)
+        )
+    )
     data: List[AbsMetricValues] = []
-    for dev in pmon.scan(deviceids=deviceids, vendorids=PCI_INTEL_VENDORID):
-        # for dev in scan_and_cache_correrr_imc():
+    for dev, regs in zip(devs, results):
         data.append(
             PMONMetricValues(
                 meta=MetricMetaData(
@@ -334,23 +501,15 @@ async def read_correrrcnt(out: AbsDataProcessor, args: List[str]) -> None:
                 ),
                 metrics=PMONCorrerrcntValues(
                     node_name=dev.path,
-                    correrrcnt_0=pmon[dev.path].reg(Registers.correrrcnt_0).get(),
-                    correrrcnt_1=pmon[dev.path].reg(Registers.correrrcnt_1).get(),
-                    correrrcnt_2=pmon[dev.path].reg(Registers.correrrcnt_2).get(),
-                    correrrcnt_3=pmon[dev.path].reg(Registers.correrrcnt_3).get(),
-                    correrrthrshld_0=pmon[dev.path]
-                    .reg(Registers.correrrthrshld_0)
-                    .get(),
-                    correrrthrshld_1=pmon[dev.path]
-                    .reg(Registers.correrrthrshld_1)
-                    .get(),
-                    correrrthrshld_2=pmon[dev.path]
-                    .reg(Registers.correrrthrshld_2)
-                    .get(),
-                    correrrthrshld_3=pmon[dev.path]
-                    .reg(Registers.correrrthrshld_3)
-                    .get(),
-                    correrrorstatus=pmon[dev.path].reg(Registers.correrrorstatus).get(),
+                    correrrcnt_0=regs[Registers.correrrcnt_0],
+                    correrrcnt_1=regs[Registers.correrrcnt_1],
+                    correrrcnt_2=regs[Registers.correrrcnt_2],
+                    correrrcnt_3=regs[Registers.correrrcnt_3],
+                    correrrthrshld_0=regs[Registers.correrrthrshld_0],
+                    correrrthrshld_1=regs[Registers.correrrthrshld_1],
+                    correrrthrshld_2=regs[Registers.correrrthrshld_2],
+                    correrrthrshld_3=regs[Registers.correrrthrshld_3],
+                    correrrorstatus=regs[Registers.correrrorstatus],
                 ),
             )
         )
@@ -367,13 +526,17 @@ async def read_dimm_temp(out: AbsDataProcessor, args: List[str]) -> None:
     for arg in args:
         deviceids.append(int(arg, base=16))
 
+    devs = await inventory.afind(deviceids=deviceids, vendorids=PCI_INTEL_VENDORID)
+    sockets = await devices_sockets(devs)
+    temps = await asyncio.gather(
+        *(
+            pmon[dev.path].reg(Registers.memtrmltemprep).aget(socket=socket)
+            for dev, socket in zip(devs, sockets)
+        )
+    )
     data: List[AbsMetricValues] = []
-    for dev in pmon.scan(deviceids=deviceids, vendorids=PCI_INTEL_VENDORID):
-        temp = pmon[dev.path].reg(Registers.memtrmltemprep).get()
-        channel0_max_temp = get_bitfield(temp, 0, 7)
-        channel1_max_temp = get_bitfield(temp, 8, 15)
-        channel2_max_temp = get_bitfield(temp, 16, 23)
-        channel3_max_temp = get_bitfield(temp, 24, 31)
+    for dev, temp in zip(devs, temps):
+        fields = decode_value(Registers.memtrmltemprep, temp)
         data.append(
             PMONMetricValues(
                 meta=MetricMetaData(
@@ -383,22 +546,85 @@ async def read_dimm_temp(out: AbsDataProcessor, args: List[str]) -> None:
                 ),
                 metrics=PMONTRMLMaxTempValues(
                     node_name=dev.path,
-                    channel0_max_temp=channel0_max_temp,
-                    channel1_max_temp=channel1_max_temp,
-                    channel2_max_temp=channel2_max_temp,
-                    channel3_max_temp=channel3_max_temp,
+                    channel0_max_temp=fields["channel0_max_temp"],
+                    channel1_max_temp=fields["channel1_max_temp"],
+                    channel2_max_temp=fields["channel2_max_temp"],
+                    channel3_max_temp=fields["channel3_max_temp"],
                 ),
             )
         )
     out.write_metric(data)
 
 
+async def read_mca(out: AbsDataProcessor, args: List[str]) -> None:
+    """
+    read_mca - Return decoded machine check records (CE/UC classification,
+    MCi_STATUS/ADDR/MISC) of memory controller banks, read once per socket.
+    Only banks whose status changed since the previous call are reported.
+    Params:
+        args - optional bank numbers or ranges i.e "7" "13-18",
+            default memory controller banks of the CPU model
+    """
+    key: Tuple[str, ...] = tuple(args)
+    poller: Optional[MCAPoller] = mca_pollers.get(key)
+    if poller is None:
+        try:
+            banks: Optional[List[int]] = parse_banks(args)
+        except ValueError:
+            logger.error("Invalid params, usage: read_mca [bank|first-last ...]")
+            return None
+        poller = mca_pollers[key] = MCAPoller(pmon, banks)
+    records = await pmon.executor.run(poller.poll)
+    if not records:
+        return None
+    meta = MetricMetaData(
+        tool=METRICS_PMON_MCA,
+        creation_timestamp=datetime.utcnow(),
+        hostname=get_unique_host_id(),
+    )
+    out.write_metric(
+        [PMONMetricValues(meta=meta, metrics=record) for record in records]
+    )
+
+
+async def read_self_metrics(out: AbsDataProcessor, args: List[str]) -> None:
+    """
+    read_self_metrics - Return collector instrumentation (command latency and
+    lateness, driver register reads/writes, file opens, emitted bytes)
+    Params:
+        args - optional path of a JSON snapshot file replaced on every call
+    """
+    if args:
+        try:
+            await pmon.executor.run(instrumentation.write_snapshot, args[0])
+        except OSError as err:
+            logger.error(f"Unable to write instrumentation snapshot {args[0]}: {err}")
+    meta = MetricMetaData(
+        tool=METRICS_SELF,
+        creation_timestamp=datetime.utcnow(),
+        hostname=get_unique_host_id(),
+    )
+    out.write_metric(
+        [
+            PMONMetricValues(
+                meta=meta,
+                metrics=SelfMetricValues(name=name, metric=metric, value=value),
+            )
+            for name, metric, value in instrumentation.rows()
+        ]
+    )
+
+
 def pmu_utils_init() -> None:
     """pmu_utils_init() - function register NativeCallMap call functions"""
     NativeCallMap.register("scrubaddress", read_scrubaddress)  # type: ignore
     NativeCallMap.register("pmoncntr", read_pmoncntr)  # type: ignore
     NativeCallMap.register("read_bw", read_bw)  # type: ignore
+    NativeCallMap.register("read_bw_sampler", read_bw_sampler)  # type: ignore
+    NativeCallMap.register("read_rank_bw", read_rank_bw)  # type: ignore
     NativeCallMap.register("pcicfg_dump", read_pcicfg)  # type: ignore
     NativeCallMap.register("read_hwmon_temp", read_hwmon_temp)  # type: ignore
     NativeCallMap.register("read_correrrcnt", read_correrrcnt)  # type: ignore
     NativeCallMap.register("read_dimm_temp", read_dimm_temp)  # type: ignore
+    NativeCallMap.register("read_mca", read_mca)  # type: ignore
+    NativeCallMap.register("read_self_metrics", read_self_metrics)  # type: ignore
@@ -0,0 +1,151 @@
+"""
+Binary PCI config space snapshots for PMONEmulatedDriver
+Conversion of "lspci -xxxx -D" text dumps to a memory-mappable snapshot and
+loading of both formats into per-device config space buffers.
+
+Snapshot layout (little endian):
+    header      magic "PMONSNP1", version, device count, block size,
+                file offset of the first block
+    index       per device: segment, bus, device, function, vendorID, deviceID,
+                number of config space bytes present in the dump
+    blocks      4 KiB config space per device, zero padded, starting at the
+                stored offset (page aligned on the writing host)
+"""
+import mmap
+import struct
+from typing import IO, Any, Dict, Final, List, Tuple
+
+from libs.pmon.pmon import PMONDevice
+
+SNAPSHOT_MAGIC: Final[bytes] = b"PMONSNP1"
+SNAPSHOT_VERSION: Final[int] = 2
+CONFIG_SIZE: Final[int] = 4096
+
+HEADER: Final[struct.Struct] = struct.Struct("<8sIIII")
+ENTRY: Final[struct.Struct] = struct.Struct("<HBBBxHHH")
+
+# lspci device line: "0000:ff:14.3 System peripheral: Intel ..."
+LSPCI_NODE_LENGTH: Final[int] = 12
+
+
+def device_path(seg: int, bus: int, dev: int, func: int) -> str:
+    return f"{seg:04x}:{bus:02x}:{dev:02x}.{func:x}"
+
+
+def parse_lspci(file: IO[bytes]) -> Dict[str, bytearray]:
+    """
+    Function: parse_lspci(file)
+    Description: Return path -> config space of "lspci -xxxx -D" output,
+    hex rows are converted with bytes.fromhex() instead of per byte int()
+    """
+    devices: Dict[str, bytearray] = {}
+    data: bytearray = bytearray()
+    for line in file:
+        node: bytes = line[:LSPCI_NODE_LENGTH]
+        if line[4:5] == b":" and line[7:8] == b":" and line[10:11] == b".":
+            data = devices[node.decode("ascii")] = bytearray()
+            continue
+        offset, sep, row = line.partition(b":")
+        if not sep or not offset.strip():
+            continue
+        try:
+            data += bytes.fromhex(row.decode("ascii"))
+        except ValueError:
+            continue
+    return devices
+
+
+def ids_of(config: Any) -> Tuple[int, int]:
+    """Return (vendorID, deviceID) from the config space header."""
+    if len(config) < 4:
+        return (0xFFFF, 0xFFFF)
+    return (
+        int.from_bytes(config[0:2], "little"),
+        int.from_bytes(config[2:4], "little"),
+    )
+
+
+def write_snapshot(devices: Dict[str, Any], path: str) -> int:
+    """
+    Function: write_snapshot(devices, path)
+    Description: Write path -> config space mapping as binary snapshot,
+    return number of devices
+    """
+    entries: List[bytes] = []
+    for node, config in devices.items():
+        sbdf: List[str] = node.replace(".", ":").split(":")
+        vid, did = ids_of(config)
+        entries.append(
+            ENTRY.pack(
+                int(sbdf[0], 16),
+                int(sbdf[1], 16),
+                int(sbdf[2], 16),
+                int(sbdf[3], 16),
+                vid,
+                did,
+                min(len(config), CONFIG_SIZE),
+            )
+        )
+    header_size: int = HEADER.size + len(entries) * ENTRY.size
+    # readers take the offset from the header, page size differs between hosts
+    blocks: int = header_size + (-header_size % mmap.PAGESIZE)
+    header: bytes = HEADER.pack(
+        SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(entries), CONFIG_SIZE, blocks
+    ) + b"".join(entries)
+    with open(path, "wb") as file:
+        file.write(header)
+        file.write(b"\0" * (blocks - header_size))
+        for config in devices.values():
+            block: bytes = bytes(config[:CONFIG_SIZE])
+            file.write(block + b"\0" * (CONFIG_SIZE - len(block)))
+    return len(entries)
+
+
+def convert_dump(dump_path: str, snapshot_path: str) -> int:
+    """
+    Function: convert_dump(dump_path, snapshot_path)
+    Description: Convert "lspci -xxxx -D" text dump to binary snapshot
+    """
+    with open(dump_path, "rb") as file:
+        return write_snapshot(parse_lspci(file), snapshot_path)
+
+
+def is_snapshot(path: str) -> bool:
+    with open(path, "rb") as file:
+        return file.read(len(SNAPSHOT_MAGIC)) == SNAPSHOT_MAGIC
+
+
+def load_snapshot(
+    path: str,
+) -> Tuple[Dict[str, memoryview], List[PMONDevice], Any]:
+    """
+    Function: load_snapshot(path)
+    Description: Memory map snapshot and return (path -> config space view,
+    devices in dump order, mmap). Mapping is copy-on-write, so emulated
+    writes change the views but never the file.
+    """
+    with open(path, "rb") as file:
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+    magic, version, count, block_size, blocks = HEADER.unpack_from(mapped, 0)
+    header_size: int = HEADER.size + count * ENTRY.size
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+        mapped.close()
+        raise ValueError(f"{path} is not a PMON snapshot v{SNAPSHOT_VERSION}")
+    if blocks < header_size or blocks + count * block_size > len(mapped):
+        mapped.close()
+        raise ValueError(f"{path} is truncated or has invalid block offset")
+
+    view: memoryview = memoryview(mapped)
+    config: Dict[str, memoryview] = {}
+    devices: List[PMONDevice] = []
+    for idx, entry in enumerate(ENTRY.iter_unpack(view[HEADER.size : header_size])):
+        seg, bus, dev, func, vid, did, length = entry
+        node: str = device_path(seg, bus, dev, func)
+        start: int = blocks + idx * block_size
+        config[node] = view[start : start + length]
+        devices.append(
+            PMONDevice(
+                path=node, seg=seg, bus=bus, dev=dev, func=func, did=did, vid=vid
+            )
+        )
+    return config, devices, mapped
@@ -1,5 +1,7 @@
 import asyncio
-from typing import Final, List, Tuple
+import time
+from logging import DEBUG
+from typing import Dict, Final, List, Optional, Tuple
 
 from libs.pmon.pmon import (  # noqa: E402
     PMON,
@@ -23,11 +25,13 @@ def get_bitfield(data: int, startbit: int, endbit: int) -> int:
     value: int = data >> startbit
     mask: int = (1 << (endbit - startbit + 1)) - 1
     result = value & mask
-    logger.debug(
-        "[BITFIELD] {0:032b}[{1}:{2}] = {3:0b} x {4:0b} = {5:0b}".format(
-            data, startbit, endbit, value, mask, result
+    # binary strings are expensive, build them only when debug is enabled
+    if logger.isEnabledFor(DEBUG):
+        logger.debug(
+            "[BITFIELD] {0:032b}[{1}:{2}] = {3:0b} x {4:0b} = {5:0b}".format(
+                data, startbit, endbit, value, mask, result
+            )
         )
-    )
     return result
 
 
@@ -44,12 +48,219 @@ async def measure(
     time: int,
 ) -> int:
     # Function set_event is : setting counter, enabling, reseting init value
-    pmon[node].reg(unit_ctrl).set_event(event)
+    await pmon[node].reg(unit_ctrl).aset_event(event)
     await asyncio.sleep(time)
-    value: int = pmon[node].reg(unit_ctr).get(Size.COUNTER)
+    value: int = await pmon[node].reg(unit_ctr).aget(Size.COUNTER)
     return value
 
 
+COUNTER_MASK: Final[int] = (1 << 48) - 1
+
+
+def counter_delta(current: int, previous: int) -> int:
+    """Return increment of a 48bit free running counter, handling wraparound."""
+    return (current - previous) & COUNTER_MASK
+
+
+class BWSampler:
+    """
+    Class: BWSampler
+    Description: Free running CAS_COUNT_RD/CAS_COUNT_WR sampler.
+    Counters are armed once per device, every sample reads both counters
+    with a single block read and reports deltas since the previous sample.
+    Default counters 2/3 do not collide with read_bw / read_pmoncntr (0/1).
+    """
+
+    def __init__(
+        self,
+        pmon: PMON,
+        rd_ctrl: Registers = Registers.pmoncntrcfg_2,
+        rd_ctr: Registers = Registers.pmoncntr_2,
+        wr_ctrl: Registers = Registers.pmoncntrcfg_3,
+        wr_ctr: Registers = Registers.pmoncntr_3,
+    ) -> None:
+        self.pmon = pmon
+        self.rd_ctrl = rd_ctrl
+        self.rd_ctr = rd_ctr
+        self.wr_ctrl = wr_ctrl
+        self.wr_ctr = wr_ctr
+        # node -> (cas_count_rd, cas_count_wr, monotonic timestamp) of the last sample
+        self.previous: Dict[str, Tuple[int, int, float]] = {}
+
+    def read(self, node: str) -> Tuple[int, int, float]:
+        regs: Dict[Registers, int] = self.pmon[node].read_registers(
+            [(self.rd_ctr, Size.COUNTER), (self.wr_ctr, Size.COUNTER)]
+        )
+        return (regs[self.rd_ctr], regs[self.wr_ctr], time.monotonic())
+
+    def arm(self, node: str) -> None:
+        # Function set_event is : setting counter, enabling, reseting init value
+        self.pmon[node].reg(self.rd_ctrl).set_event(Events.CAS_COUNT_RD)
+        self.pmon[node].reg(self.wr_ctrl).set_event(Events.CAS_COUNT_WR)
+        baseline: Tuple[int, int, float] = self.read(node)
+        # failed read, node stays unarmed and is armed again on next sample
+        if baseline[0] >= 0 and baseline[1] >= 0:
+            self.previous[node] = baseline
+
+    def sample(self, nodes: List[str]) -> List[Tuple[str, int, int, float]]:
+        """
+        Method: sample(nodes)
+        Description: Return (node, cas_count_rd, cas_count_wr, period) deltas
+        for every armed node. Nodes seen for the first time are armed and
+        reported from the next sample on.
+        """
+        result: List[Tuple[str, int, int, float]] = []
+        for node in nodes:
+            if node not in self.previous:
+                self.arm(node)
+                continue
+            (prev_rd, prev_wr, prev_time) = self.previous[node]
+            (cas_rd, cas_wr, now) = current = self.read(node)
+            self.previous[node] = current
+            if cas_rd < 0 or cas_wr < 0:
+                # failed read, rearm on next sample
+                del self.previous[node]
+                continue
+            result.append(
+                (
+                    node,
+                    counter_delta(cas_rd, prev_rd),
+                    counter_delta(cas_wr, prev_wr),
+                    now - prev_time,
+                )
+            )
+        for node in set(self.previous) - set(nodes):
+            del self.previous[node]
+        return result
+
+
+RANKS: Final[int] = 8
+# RD_CAS_RANK0..7 followed by WR_CAS_RANK0..7, event index = rank (+ RANKS for writes)
+RANK_EVENTS: Final[List[Events]] = [
+    *(Events[f"RD_CAS_RANK{rank}"] for rank in range(RANKS)),
+    *(Events[f"WR_CAS_RANK{rank}"] for rank in range(RANKS)),
+]
+# pmoncntr_0..4 / pmoncntrcfg_0..4 of an iMC channel
+RANK_COUNTERS: Final[int] = 5
+
+
+class RankBWSampler:
+    """
+    Class: RankBWSampler
+    Description: Per rank RD_CAS/WR_CAS sampler time multiplexing the 16 rank
+    events over the channel counters. Every rotate() reads the counters
+    programmed by the previous rotate() and programs the next events of the
+    round robin schedule, each step is one block read of the counters and
+    one block write of their control registers per device. collect() returns
+    counts scaled by the active fraction of every event (counted time /
+    elapsed time) and starts a new period.
+    Counters in use collide with read_bw / read_pmoncntr (0/1) and
+    read_bw_sampler (2/3) on the same channels.
+    """
+
+    def __init__(self, pmon: PMON, counters: Optional[List[int]] = None) -> None:
+        self.pmon = pmon
+        indexes: List[int] = counters or list(range(RANK_COUNTERS))
+        self.ctrls: List[Registers] = [Registers[f"pmoncntrcfg_{i}"] for i in indexes]
+        self.ctrs: List[Registers] = [Registers[f"pmoncntr_{i}"] for i in indexes]
+        self.requests: List[Tuple[Registers, Size]] = [
+            (ctr, Size.COUNTER) for ctr in self.ctrs
+        ]
+        # node -> next schedule position
+        self.offset: Dict[str, int] = {}
+        # node -> (event indexes on counters, monotonic timestamp of programming)
+        self.programmed: Dict[str, Tuple[List[int], float]] = {}
+        # node -> per event accumulated counts and counted time
+        self.counts: Dict[str, List[int]] = {}
+        self.active: Dict[str, List[float]] = {}
+        # node -> start of the current period
+        self.started: Dict[str, float] = {}
+
+    def program(self, node: str) -> None:
+        offset: int = self.offset.get(node, 0)
+        group: List[int] = [
+            (offset + idx) % len(RANK_EVENTS) for idx in range(len(self.ctrls))
+        ]
+        self.offset[node] = (offset + len(group)) % len(RANK_EVENTS)
+        # Control words enable and reset the counters, see PMONRegister.set_event
+        self.pmon[node].write_registers(
+            {
+                ctrl: RANK_EVENTS[event].ctrl_word()
+                for ctrl, event in zip(self.ctrls, group)
+            }
+        )
+        self.programmed[node] = (group, time.monotonic())
+
+    def reset(self, node: str, now: float) -> None:
+        self.counts[node] = [0] * len(RANK_EVENTS)
+        self.active[node] = [0.0] * len(RANK_EVENTS)
+        self.started[node] = now
+
+    def rotate(self, nodes: List[str]) -> None:
+        """
+        Method: rotate(nodes)
+        Description: Accumulate counters of the events programmed on every
+        node and program the next events. Nodes seen for the first time are
+        only programmed, nodes with a failed read are dropped and programmed again.
+        """
+        for node in nodes:
+            programmed: Optional[Tuple[List[int], float]] = self.programmed.get(node)
+            if programmed is None:
+                self.reset(node, time.monotonic())
+                self.program(node)
+                continue
+            group, since = programmed
+            regs: Dict[Registers, int] = self.pmon[node].read_registers(self.requests)
+            now: float = time.monotonic()
+            values: List[int] = [regs[ctr] for ctr in self.ctrs]
+            if min(values) < 0:
+                self.forget(node)
+                continue
+            counts: List[int] = self.counts[node]
+            active: List[float] = self.active[node]
+            for event, value in zip(group, values):
+                counts[event] += value
+                active[event] += now - since
+            self.program(node)
+        for node in set(self.programmed) - set(nodes):
+            self.forget(node)
+
+    def forget(self, node: str) -> None:
+        self.programmed.pop(node, None)
+        self.offset.pop(node, None)
+        self.counts.pop(node, None)
+        self.active.pop(node, None)
+        self.started.pop(node, None)
+
+    def collect(
+        self, nodes: List[str]
+    ) -> List[Tuple[str, List[int], List[float], float]]:
+        """
+        Method: collect(nodes)
+        Description: Return (node, scaled counts, active fractions, period) of
+        every sampled node, indexed as RANK_EVENTS. Counts of events not
+        counted in the period are 0 with active fraction 0.
+        """
+        result: List[Tuple[str, List[int], List[float], float]] = []
+        now: float = time.monotonic()
+        for node in nodes:
+            if node not in self.started:
+                continue
+            elapsed: float = now - self.started[node]
+            if elapsed <= 0:
+                continue
+            scaled: List[int] = [
+                round(count * elapsed / active) if active > 0 else 0
+                for count, active in zip(self.counts[node], self.active[node])
+            ]
+            fractions: List[float] = [
+                min(active / elapsed, 1.0) for active in self.active[node]
+            ]
+            result.append((node, scaled, fractions, elapsed))
+            self.reset(node, now)
+        return result
+
+
 def humanbytes(data: int) -> str:
     """Return the given bytes as a human friendly KB, MB, GB, or TB string."""
     b = float(data)
@@ -105,6 +316,12 @@ class Dev2SocketID:
     socket_nodeid: List[int] = []
     socket_devs: List[PMONDevice] = []
 
+    @staticmethod
+    def reset() -> None:
+        Dev2SocketID.socket_ranges = []
+        Dev2SocketID.socket_nodeid = []
+        Dev2SocketID.socket_devs = []
+
     @staticmethod
     def scan_socketids(pmon: PMON) -> None:
         Dev2SocketID.socket_devs = pmon.scan(
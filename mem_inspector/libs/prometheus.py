@@ -0,0 +1,193 @@
+"""
+Prometheus text exposition of the latest collected values
+write_metric() updates a label-indexed series table in place, scrapes render
+only series whose value changed since the previous scrape.
+"""
+import asyncio
+from operator import attrgetter
+from typing import Any, Callable, Dict, Final, List, Optional, Tuple, Type
+
+from libs.data_processors import AbsDataProcessor
+from libs.logger import logger
+from libs.metric_values import AbsMetricValues
+
+CONTENT_TYPE: Final[str] = "text/plain; version=0.0.4; charset=utf-8"
+METRICS_PATH: Final[bytes] = b"/metrics"
+MAX_REQUEST: Final[int] = 8192
+
+
+def escape_label(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_value(value: Any) -> str:
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, int):
+        return str(value)
+    try:
+        return repr(float(value))
+    except (TypeError, ValueError):
+        return "NaN"
+
+
+class MetricSpec:
+    """
+    Class: MetricSpec
+    Description: Prometheus mapping of one metrics dataclass.
+    [labels] are dataclass fields used as labels, [values] maps value fields to
+    (metric name, extra labels) i.e {"input": ("hwmon_temp_celsius", {})}.
+    """
+
+    def __init__(
+        self,
+        labels: List[str],
+        values: Dict[str, Tuple[str, Dict[str, str]]],
+        help: str = "",
+    ) -> None:
+        self.labels = labels
+        getter: Callable[[Any], Any] = attrgetter(*labels)
+        self.label_getter: Callable[[Any], Tuple[Any, ...]] = (
+            getter if len(labels) > 1 else lambda metrics: (getter(metrics),)
+        )
+        self.values: List[Tuple[Callable[[Any], Any], str, Dict[str, str]]] = [
+            (attrgetter(field), name, extra) for field, (name, extra) in values.items()
+        ]
+        self.help = help
+
+
+class PrometheusSeries:
+    __slots__ = ("labels", "value", "line")
+
+    def __init__(self, labels: str) -> None:
+        self.labels = labels
+        self.value: Any = None
+        # rendered exposition line, None when the value has changed
+        self.line: Optional[str] = None
+
+
+class PrometheusFamily:
+    __slots__ = ("name", "header", "series")
+
+    def __init__(self, name: str, help: str) -> None:
+        self.name = name
+        self.header: str = f"# HELP {name} {help or name}\n# TYPE {name} gauge\n"
+        self.series: List[PrometheusSeries] = []
+
+
+class PrometheusExporter(AbsDataProcessor):
+    """
+    Class: PrometheusExporter
+    Description: Keep the latest value of every series and serve it in
+    Prometheus text format. Series of a (dataclass, label values) row are
+    allocated on first sight and updated in place afterwards; rendered lines
+    and the whole body are cached until a value changes.
+    """
+
+    def __init__(self, specs: Dict[Type[Any], MetricSpec], prefix: str = "vme_"):
+        self.specs = specs
+        self.prefix = prefix
+        self.families: Dict[str, PrometheusFamily] = {}
+        self.table: Dict[Tuple[Type[Any], Tuple[Any, ...]], List[PrometheusSeries]] = {}
+        self.dirty: bool = True
+        self.body: bytes = b""
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    def _allocate(
+        self, kind: Type[Any], spec: MetricSpec, labels: Tuple[Any, ...]
+    ) -> List[PrometheusSeries]:
+        common: List[str] = [
+            f'{name}="{escape_label(value)}"'
+            for name, value in zip(spec.labels, labels)
+        ]
+        row: List[PrometheusSeries] = []
+        for _, name, extra in spec.values:
+            family: Optional[PrometheusFamily] = self.families.get(self.prefix + name)
+            if family is None:
+                family = self.families[self.prefix + name] = PrometheusFamily(
+                    self.prefix + name, spec.help
+                )
+            pairs: List[str] = common + [
+                f'{key}="{escape_label(value)}"' for key, value in extra.items()
+            ]
+            series = PrometheusSeries("{" + ",".join(pairs) + "}" if pairs else "")
+            family.series.append(series)
+            row.append(series)
+        self.table[(kind, labels)] = row
+        return row
+
+    def write_metric(self, metrics_list: List[AbsMetricValues]) -> None:
+        for data in metrics_list:
+            kind: Type[Any] = type(data.metrics)
+            spec: Optional[MetricSpec] = self.specs.get(kind)
+            if spec is None:
+                continue
+            labels: Tuple[Any, ...] = spec.label_getter(data.metrics)
+            row: Optional[List[PrometheusSeries]] = self.table.get((kind, labels))
+            if row is None:
+                row = self._allocate(kind, spec, labels)
+            for series, (getter, _, _) in zip(row, spec.values):
+                value: Any = getter(data.metrics)
+                if value != series.value:
+                    series.value = value
+                    series.line = None
+                    self.dirty = True
+
+    def render(self) -> bytes:
+        """
+        Method: render()
+        Description: Return exposition body, only changed series are formatted
+        """
+        if not self.dirty:
+            return self.body
+        parts: List[str] = []
+        for family in self.families.values():
+            parts.append(family.header)
+            for series in family.series:
+                if series.line is None:
+                    series.line = (
+                        f"{family.name}{series.labels} {format_value(series.value)}\n"
+                    )
+                parts.append(series.line)
+        self.body = "".join(parts).encode("utf-8")
+        self.dirty = False
+        return self.body
+
+    async def _handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            request: bytes = await reader.readuntil(b"\r\n\r\n")
+            method, path, _ = request.split(b" ", 2)
+            if method not in (b"GET", b"HEAD") or path.split(b"?")[0] != METRICS_PATH:
+                writer.write(
+                    b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\n"
+                    b"Connection: close\r\n\r\n"
+                )
+            else:
+                body: bytes = self.render()
+                writer.write(
+                    (
+                        f"HTTP/1.1 200 OK\r\nContent-Type: {CONTENT_TYPE}\r\n"
+                        f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n"
+                    ).encode("ascii")
+                )
+                if method == b"GET":
+                    writer.write(body)
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            pass
+        except OSError as err:
+            logger.error(f"Prometheus exporter connection failed: {err}")
+        finally:
+            writer.close()
+
+    async def serve(self, host: str, port: int) -> asyncio.AbstractServer:
+        """
+        Method: await serve(host, port)
+        Description: Start HTTP server answering GET /metrics
+        """
+        self.server = await asyncio.start_server(
+            self._handle, host, port, limit=MAX_REQUEST
+        )
+        return self.server
@@ -0,0 +1,196 @@
+"""
+Output sinks for collected metrics
+Row formatting, batching and pluggable targets (stdout, file, rotating file, Unix socket)
+"""
+import os
+import socket
+import sys
+import time
+from abc import ABC, abstractmethod
+from operator import attrgetter
+from typing import Any, Callable, Final, List, Optional, Tuple
+
+from libs.instrumentation import IOStats, instrumentation
+from libs.logger import logger
+from libs.metric_values import AbsMetricValues
+
+SINK_STDOUT: Final[str] = "stdout"
+SINK_FILE: Final[str] = "file"
+SINK_ROTATING: Final[str] = "rotating"
+SINK_UNIX: Final[str] = "unix"
+
+META_FIELDS: Final[Tuple[str, ...]] = ("creation_timestamp", "tool", "hostname")
+
+
+class AbsSink(ABC):
+    """
+    Class: AbsSink
+    Description: Target of formatted, already batched output
+    """
+
+    @abstractmethod
+    def write(self, data: str) -> None:
+        pass
+
+    def close(self) -> None:
+        return None
+
+
+class StdoutSink(AbsSink):
+    def write(self, data: str) -> None:
+        sys.stdout.write(data)
+        sys.stdout.flush()
+
+
+class FileSink(AbsSink):
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.file = open(path, "a")
+
+    def write(self, data: str) -> None:
+        self.file.write(data)
+        self.file.flush()
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class RotatingFileSink(FileSink):
+    """
+    Class: RotatingFileSink
+    Description: File sink rotating path -> path.1 -> ... -> path.[backup_count]
+    when the file grows over max_bytes
+    """
+
+    def __init__(
+        self, path: str, max_bytes: int = 64 * 1024 * 1024, backup_count: int = 5
+    ) -> None:
+        super().__init__(path)
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.size: int = self.file.tell()
+
+    def rotate(self) -> None:
+        self.file.close()
+        for idx in range(self.backup_count - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{idx}"):
+                os.replace(f"{self.path}.{idx}", f"{self.path}.{idx + 1}")
+        if self.backup_count:
+            os.replace(self.path, f"{self.path}.1")
+        self.file = open(self.path, "w")
+        self.size = 0
+
+    def write(self, data: str) -> None:
+        if self.size and self.size + len(data) > self.max_bytes:
+            self.rotate()
+        super().write(data)
+        self.size += len(data)
+
+
+class UnixSocketSink(AbsSink):
+    """
+    Class: UnixSocketSink
+    Description: Stream output to a Unix socket, reconnecting after failures.
+    Data written while the peer is unavailable is dropped.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.sock: Optional[socket.socket] = None
+
+    def write(self, data: str) -> None:
+        try:
+            if self.sock is None:
+                self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                self.sock.connect(self.path)
+            self.sock.sendall(data.encode("utf-8"))
+        except OSError as err:
+            logger.error(f"Unable to write to Unix socket {self.path}: {err}")
+            self.close()
+
+    def close(self) -> None:
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+
+def sink_from_spec(spec: str) -> AbsSink:
+    """
+    Function: sink_from_spec(spec)
+    Description: Build sink from "stdout", "file:PATH", "rotating:PATH" or "unix:PATH"
+    """
+    kind, _, path = spec.partition(":")
+    if kind == SINK_STDOUT:
+        return StdoutSink()
+    if kind == SINK_FILE and path:
+        return FileSink(path)
+    if kind == SINK_ROTATING and path:
+        return RotatingFileSink(path)
+    if kind == SINK_UNIX and path:
+        return UnixSocketSink(path)
+    raise ValueError(f"Unsupported output sink {spec!r}")
+
+
+class RowFormatter:
+    """
+    Class: RowFormatter
+    Description: CSV row formatter precompiled for one metrics dataclass.
+    Row layout is: "creation_timestamp";"tool";"hostname";"field_1";...;"field_n";
+    """
+
+    def __init__(self, fields: List[str], key: str) -> None:
+        self.fields = fields
+        self.template: str = '"{}";' * (len(META_FIELDS) + len(fields))
+        self.meta_getter: Callable[[Any], Tuple[Any, ...]] = attrgetter(*META_FIELDS)
+        getter: Callable[[Any], Any] = attrgetter(*fields)
+        self.values_getter: Callable[[Any], Tuple[Any, ...]] = (
+            getter if len(fields) > 1 else lambda metrics: (getter(metrics),)
+        )
+        self.key_getter: Callable[[Any], Any] = attrgetter(key)
+
+    def unique_key(self, data: AbsMetricValues) -> str:
+        return f"{data.meta.tool}_#_{self.key_getter(data.metrics)}"
+
+    def values(self, data: AbsMetricValues) -> Tuple[Any, ...]:
+        return self.values_getter(data.metrics)
+
+    def format(self, data: AbsMetricValues, values: Tuple[Any, ...]) -> str:
+        return self.template.format(*self.meta_getter(data.meta), *values)
+
+
+class BatchBuffer:
+    """
+    Class: BatchBuffer
+    Description: In-memory line buffer written to the sink with a single call
+    once it holds max_lines lines or its oldest line is max_delay seconds old.
+    """
+
+    stats: IOStats = instrumentation.io_stats("output")
+
+    def __init__(self, sink: AbsSink, max_lines: int = 256, max_delay: float = 1.0):
+        self.sink = sink
+        self.max_lines = max_lines
+        self.max_delay = max_delay
+        self.lines: List[str] = []
+        self.first: float = 0.0
+
+    def append(self, line: str) -> None:
+        if not self.lines:
+            self.first = time.monotonic()
+        self.lines.append(line)
+        self.flush_if_due()
+
+    def flush_if_due(self) -> None:
+        if self.lines and (
+            len(self.lines) >= self.max_lines
+            or time.monotonic() - self.first >= self.max_delay
+        ):
+            self.flush()
+
+    def flush(self) -> None:
+        if self.lines:
+            data: str = "\n".join(self.lines) + "\n"
+            BatchBuffer.stats.writes += len(self.lines)
+            BatchBuffer.stats.bytes_written += len(data)
+            self.lines = []
+            self.sink.write(data)
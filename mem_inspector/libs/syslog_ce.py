@@ -0,0 +1,429 @@
+"""
+Streaming parser of CE-ERROR records logged by the modified sb_edac driver
+Handles plain, .gz and .xz rotated syslog files
+"""
+import gzip
+import json
+import lzma
+import os
+import re
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from multiprocessing import Manager
+from queue import Empty
+from typing import (
+    IO,
+    Any,
+    Deque,
+    Dict,
+    Final,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
+from libs.logger import logger
+
+CE_MARKER: Final[bytes] = b"CE-ERROR:"
+
+# records per batch and batches queued per file in parse_files(jobs > 1)
+CE_BATCH_RECORDS: Final[int] = 4096
+CE_QUEUE_BATCHES: Final[int] = 4
+
+CE_FIELDS: Final[List[str]] = [
+    "date",
+    "host",
+    "pci",
+    "rank0",
+    "rank1",
+    "rank2",
+    "rank3",
+    "rank4",
+    "rank5",
+    "rank6",
+    "rank7",
+    "node",
+    "source",
+    "cpu",
+    "ha",
+    "mci_status",
+    "mci_status_long",
+    "mci_addr",
+    "mci_addr_long",
+    "source_id",
+    "pfn",
+]
+
+# "Nov 27 10:04:48 host kernel: [469338.734897] CE-ERROR: ..."
+RE_PREFIX = re.compile(rb"^(\w{3}\s+\d+\s+\d\d:\d\d:\d\d)\s+(\S+)\s.*?CE-ERROR:\s*")
+# three-line format: group header
+RE_COUNTERS = re.compile(rb"Getting counters for PCI device:\s*(\S+)")
+# "key=value", "key: value" and "key=value 0xhex" (MCi_STATUS, MCi_ADDR) tokens
+RE_TOKEN = re.compile(rb"(\w+)\s*[=:]\s*([^\s,]+)(?:\s+(0x[0-9a-fA-F]+\w*))?")
+
+# token key -> (field, field of the optional hex form, integer value)
+CE_TOKENS: Final[Dict[bytes, Tuple[str, Optional[str], bool]]] = {
+    b"PCI_device": ("pci", None, False),
+    b"cpu": ("cpu", None, True),
+    b"source_id": ("source_id", None, True),
+    b"HA": ("ha", None, True),
+    b"MCi_STATUS": ("mci_status", "mci_status_long", True),
+    b"MCi_ADDR": ("mci_addr", "mci_addr_long", True),
+    b"PFN_to_Page": ("pfn", None, True),
+    b"node": ("node", None, True),
+    b"source": ("source", None, True),
+    **{f"Rank{rank}".encode(): (f"rank{rank}", None, True) for rank in range(8)},
+}
+
+
+def new_record(date: str, host: str, pci: str) -> Dict[str, Any]:
+    record: Dict[str, Any] = dict.fromkeys(CE_FIELDS, 0)
+    record["date"] = date
+    record["host"] = host
+    record["pci"] = pci
+    return record
+
+
+def tokenize(body: bytes) -> Dict[str, Any]:
+    """
+    Function: tokenize(body)
+    Description: Return CE fields found in key=value tokens of the line body.
+    Unknown keys and malformed values are ignored.
+    """
+    fields: Dict[str, Any] = {}
+    for key, value, hexform in RE_TOKEN.findall(body):
+        spec: Optional[Tuple[str, Optional[str], bool]] = CE_TOKENS.get(key)
+        if spec is None:
+            continue
+        field, long_field, integer = spec
+        if integer:
+            try:
+                fields[field] = int(value)
+            except ValueError:
+                continue
+        else:
+            fields[field] = value.decode("utf-8", "replace")
+        if long_field and hexform:
+            fields[long_field] = hexform.decode("utf-8")
+    return fields
+
+
+def open_log(filename: str) -> IO[bytes]:
+    """
+    Function: open_log(filename)
+    Description: Open plain or rotated (.gz, .xz) log file in binary mode
+    """
+    if filename.endswith(".gz"):
+        return gzip.open(filename, "rb")  # type: ignore
+    if filename.endswith(".xz"):
+        return lzma.open(filename, "rb")  # type: ignore
+    return open(filename, "rb")
+
+
+class CEParser:
+    """
+    Class: CEParser
+    Description: Incremental CE record parser. Handles the single-line
+    "CE-ERROR: PCI_device=... Rank7=... node=... source=..." format and the
+    older group of "Getting counters", "Rank0=..." and "status and address"
+    lines; feed() returns a record once it is complete.
+    """
+
+    def __init__(self) -> None:
+        # record of the group being parsed, None between groups
+        self.record: Optional[Dict[str, Any]] = None
+
+    def feed(self, line: bytes) -> Optional[Dict[str, Any]]:
+        # cheap bytes filter first, regexes only run on CE-ERROR lines
+        marker: int = line.find(CE_MARKER)
+        if marker < 0:
+            return None
+        prefix = RE_PREFIX.match(line)
+        if prefix is not None:
+            date: str = prefix.group(1).decode("utf-8")
+            host: str = prefix.group(2).decode("utf-8")
+            body: bytes = line[prefix.end() :]
+        else:
+            # dmesg or unknown timestamp format
+            date = host = ""
+            body = line[marker + len(CE_MARKER) :].lstrip()
+
+        match = RE_COUNTERS.match(body)
+        if match:
+            self.record = new_record(date, host, match.group(1).decode("utf-8"))
+            return None
+        fields: Dict[str, Any] = tokenize(body)
+        if "pci" in fields:
+            # single-line format, a pending three-line group is not affected
+            record: Optional[Dict[str, Any]] = new_record(date, host, "")
+            record.update(fields)  # type: ignore
+            return record
+        record = self.record
+        if record is None:
+            return None
+        record.update(fields)
+        if "mci_status" in fields:
+            # status and address line closes the three-line group
+            self.record = None
+            return record
+        return None
+
+
+def parse_lines(lines: Iterable[bytes]) -> Iterator[Dict[str, Any]]:
+    """
+    Function: parse_lines(lines)
+    Description: Yield CE records from syslog lines
+    """
+    parser = CEParser()
+    for line in lines:
+        record: Optional[Dict[str, Any]] = parser.feed(line)
+        if record is not None:
+            yield record
+
+
+def iter_ce_lines(file: IO[bytes], chunk_size: int = 1 << 20) -> Iterator[bytes]:
+    """
+    Function: iter_ce_lines(file, chunk_size)
+    Description: Yield only CE-ERROR lines of the file. The file is read in
+    large chunks and non CE lines are skipped by bytes.find() without being
+    split into line objects.
+    """
+    tail: bytes = b""
+    while True:
+        chunk: bytes = file.read(chunk_size)
+        if not chunk:
+            break
+        data: bytes = tail + chunk if tail else chunk
+        cut: int = data.rfind(b"\n") + 1
+        tail = data[cut:]
+        pos: int = data.find(CE_MARKER, 0, cut)
+        while pos >= 0:
+            start: int = data.rfind(b"\n", 0, pos) + 1
+            end: int = data.find(b"\n", pos) + 1
+            yield data[start:end]
+            pos = data.find(CE_MARKER, end, cut)
+    if CE_MARKER in tail:
+        yield tail
+
+
+def parse_file(filename: str) -> Iterator[Dict[str, Any]]:
+    """
+    Function: parse_file(filename)
+    Description: Yield CE records of a single (optionally compressed) log file
+    """
+    with open_log(filename) as file:
+        yield from parse_lines(iter_ce_lines(file))
+
+
+def _parse_file_batches(filename: str, queue: Any, batch_size: int) -> None:
+    """
+    Function: _parse_file_batches(filename, queue, batch_size)
+    Description: Worker side of parse_files, put lists of at most [batch_size]
+    records of [filename] to [queue] and None when the file is done
+    """
+    try:
+        batch: List[Dict[str, Any]] = []
+        for record in parse_file(filename):
+            batch.append(record)
+            if len(batch) >= batch_size:
+                queue.put(batch)
+                batch = []
+        if batch:
+            queue.put(batch)
+    finally:
+        queue.put(None)
+
+
+def _drain_batches(future: Any, queue: Any) -> Iterator[Dict[str, Any]]:
+    """
+    Function: _drain_batches(future, queue)
+    Description: Yield records of one file sent by _parse_file_batches and
+    raise the worker error, a dead worker never puts the final None
+    """
+    while True:
+        try:
+            batch: Optional[List[Dict[str, Any]]] = queue.get(timeout=1.0)
+        except Empty:
+            if future.done():
+                future.result()
+            continue
+        if batch is None:
+            break
+        yield from batch
+    future.result()
+
+
+def parse_files(
+    filenames: List[str], jobs: int = 1, batch_size: int = CE_BATCH_RECORDS
+) -> Iterator[Dict[str, Any]]:
+    """
+    Function: parse_files(filenames, jobs, batch_size)
+    Description: Yield CE records of all files in the given order.
+    With jobs > 1 files are parsed by a process pool; at most [jobs] files
+    are in flight and results are merged in input order. Workers send
+    records in batches of [batch_size] over queues of CE_QUEUE_BATCHES, so
+    memory does not depend on the file size.
+    """
+    if jobs <= 1 or len(filenames) <= 1:
+        for filename in filenames:
+            yield from parse_file(filename)
+        return
+
+    # Manager is shut down first, so workers blocked on a full queue fail
+    # and the pool can exit when the consumer stops early
+    with ProcessPoolExecutor(max_workers=jobs) as executor, Manager() as manager:
+        pending: Deque[Tuple[Any, Any]] = deque()
+
+        def submit(filename: str) -> None:
+            queue: Any = manager.Queue(maxsize=CE_QUEUE_BATCHES)
+            future: Any = executor.submit(
+                _parse_file_batches, filename, queue, batch_size
+            )
+            pending.append((future, queue))
+
+        names: Iterator[str] = iter(filenames)
+        for filename in islice(names, jobs):
+            submit(filename)
+        while pending:
+            yield from _drain_batches(*pending[0])
+            pending.popleft()
+            for filename in islice(names, 1):
+                submit(filename)
+
+
+class SyslogFollower:
+    """
+    Class: SyslogFollower
+    Description: Tail a syslog file and yield CE records as soon as their group
+    is complete. Rotation is detected by inode change (the rest of the old file
+    is read first), truncation by the file getting shorter than the offset.
+    With [checkpoint] the (inode, offset) position is persisted, the offset
+    points at the first line of an incomplete group so no record is lost.
+    """
+
+    def __init__(
+        self, filename: str, checkpoint: Optional[str] = None, interval: float = 1.0
+    ) -> None:
+        self.filename = filename
+        self.checkpoint = checkpoint
+        self.interval = interval
+        self.parser = CEParser()
+        self.file: Optional[IO[bytes]] = None
+        self.inode: int = 0
+        # offset of the first byte not consumed yet
+        self.offset: int = 0
+        # offset of the first line of the group being parsed
+        self.group_offset: int = 0
+        self.load_checkpoint()
+
+    def load_checkpoint(self) -> None:
+        if not self.checkpoint or not os.path.isfile(self.checkpoint):
+            return None
+        try:
+            with open(self.checkpoint, "r") as file:
+                state: Dict[str, int] = json.load(file)
+            self.inode = int(state["inode"])
+            self.offset = self.group_offset = int(state["offset"])
+        except (OSError, ValueError, KeyError) as err:
+            logger.error(f"Ignoring invalid checkpoint {self.checkpoint}: {err}")
+        return None
+
+    def save_checkpoint(self) -> None:
+        if not self.checkpoint:
+            return None
+        offset: int = self.group_offset if self.parser.record else self.offset
+        tmp: str = self.checkpoint + ".tmp"
+        with open(tmp, "w") as file:
+            json.dump({"inode": self.inode, "offset": offset}, file)
+        os.replace(tmp, self.checkpoint)
+        return None
+
+    def _open(self, rotated: bool = False) -> bool:
+        try:
+            self.file = open(self.filename, "rb")
+        except OSError:
+            return False
+        inode: int = os.fstat(self.file.fileno()).st_ino
+        if inode != self.inode:
+            # new file (or no checkpoint), start from the beginning
+            self.inode = inode
+            self.offset = self.group_offset = 0
+            if not rotated:
+                self.parser = CEParser()
+        return True
+
+    def _resume_rotated(self) -> Iterator[Dict[str, Any]]:
+        """Finish the checkpointed file if it was rotated to [filename].1 meanwhile."""
+        if not self.inode:
+            return
+        rotated: str = f"{self.filename}.1"
+        try:
+            if os.stat(self.filename).st_ino == self.inode:
+                return
+            if os.stat(rotated).st_ino != self.inode:
+                return
+            self.file = open(rotated, "rb")
+        except OSError:
+            return
+        logger.debug(f"[FOLLOW] resuming rotated {rotated}")
+        yield from self._drain()
+        self.file.close()
+        self.file = None
+
+    def _drain(self) -> Iterator[Dict[str, Any]]:
+        """Parse complete lines from the current offset up to EOF."""
+        assert self.file is not None
+        self.file.seek(self.offset)
+        for line in self.file:
+            if not line.endswith(b"\n"):
+                # partial line, wait until the writer completes it
+                break
+            pending: Optional[Dict[str, Any]] = self.parser.record
+            record: Optional[Dict[str, Any]] = self.parser.feed(line)
+            if self.parser.record is not None and self.parser.record is not pending:
+                self.group_offset = self.offset
+            self.offset += len(line)
+            if record is not None:
+                yield record
+
+    def poll(self) -> Iterator[Dict[str, Any]]:
+        """
+        Method: poll()
+        Description: Yield records appended since the last poll
+        """
+        if self.file is None:
+            yield from self._resume_rotated()
+            if not self._open(rotated=True):
+                return
+        try:
+            stat = os.stat(self.filename)
+        except OSError:
+            stat = None
+
+        if stat is not None and stat.st_ino != self.inode:
+            # rotated: finish the old file, then continue with the new one,
+            # a group split by the rotation is completed from the new file
+            yield from self._drain()
+            self.file.close()  # type: ignore
+            self.file = None
+            if not self._open(rotated=True):
+                return
+        elif stat is not None and stat.st_size < self.offset:
+            logger.debug(f"[FOLLOW] {self.filename} truncated")
+            self.offset = self.group_offset = 0
+            self.parser = CEParser()
+        yield from self._drain()
+        self.save_checkpoint()
+
+    def follow(self) -> Iterator[Dict[str, Any]]:
+        """
+        Method: follow()
+        Description: Yield records forever, polling every [interval] seconds
+        """
+        while True:
+            yield from self.poll()
+            time.sleep(self.interval)
@@ -17,6 +17,10 @@ PCI_UNKNOWN_VENDORID: Final[int] = 0x0BAD
 INTEL_SKYLAKE_XEON_SCALABLE_FAMILY: Final[int] = 0x06
 INTEL_SKYLAKE_XEON_SCALABLE_MODEL: Final[int] = 0x55
 
+# Haswell-EP/EX and Broadwell-EP/EX (Xeon E5/E7 v3, v4) models, family 0x06
+INTEL_HASWELL_X_MODEL: Final[int] = 0x3F
+INTEL_BROADWELL_X_MODEL: Final[int] = 0x4F
+
 
 # Prometheus value names
 # MCA